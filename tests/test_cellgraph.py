@@ -0,0 +1,150 @@
+"""Tests for recalculation of dependent ShapeSheet cells"""
+import os
+import pytest
+
+import vsdx
+
+from vsdx import namespace
+from vsdx import Page
+from vsdx import VisioFile
+
+# code to get basedir of this test file in either linux/windows
+basedir = os.path.dirname(os.path.relpath(__file__))
+
+
+@pytest.mark.parametrize(("filename", "shape_id", "cell_name", "expected_dependents"),
+                         [("test4_connectors.vsdx", "1", "Width", [("1", "LocPinX")]),
+                          ("test4_connectors.vsdx", "1", "PinX", [("6", "BeginX"), ("6", "BeginY")]),
+                          ("test4_connectors.vsdx", "6", "EndX", [("6", "Width")]),
+                          ])
+def test_cell_dependents(filename: str, shape_id: str, cell_name: str, expected_dependents: list):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]  # type: Page
+        dependents = page.cell_graph.dependents(shape_id, cell_name)
+        for node in expected_dependents:
+            assert node in dependents
+
+
+@pytest.mark.parametrize(("filename", "shape_text", "width"),
+                         [("test4_connectors.vsdx", "Shape A", 3.0),
+                          ("test4_connectors.vsdx", "Shape C", 0.5),
+                          ])
+def test_set_cell_value_recalculates_dependents(filename: str, shape_text: str, width: float):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]  # type: Page
+        shape = page.find_shape_by_text(shape_text)
+        shape.width = width
+        assert shape.width == width
+        assert shape.loc_x == width * 0.5  # LocPinX = Width*0.5
+
+
+@pytest.mark.parametrize(("filename", "shape_text", "formula", "expected_width"),
+                         [("test4_connectors.vsdx", "Shape A", "2*3", 6.0),
+                          ("test4_connectors.vsdx", "Shape B", "Height*2", None),
+                          ])
+def test_set_cell_formula_recalculates_cell_and_dependents(filename: str, shape_text: str, formula: str,
+                                                           expected_width: float):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]  # type: Page
+        shape = page.find_shape_by_text(shape_text)
+        expected_width = expected_width or shape.height * 2
+        shape.set_cell_formula('Width', formula)
+        assert shape.width == expected_width
+        assert shape.loc_x == expected_width * 0.5
+        # a later change to Height recalculates a Width formula which uses it
+        shape.height = shape.height + 1.0
+        if 'Height' in formula:
+            assert shape.width == shape.height * 2
+
+
+@pytest.mark.parametrize(("filename", "shape_text", "connector_id", "end"),
+                         [("test4_connectors.vsdx", "Shape A", "6", "begin"),
+                          ("test4_connectors.vsdx", "Shape B", "6", "end"),
+                          ("test4_connectors.vsdx", "Shape C", "7", "end"),
+                          ])
+def test_move_shape_reroutes_glued_connector(filename: str, shape_text: str, connector_id: str, end: str):
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_move_shape_reroutes_glued_connector_{shape_text}.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]  # type: Page
+        shape = page.find_shape_by_text(shape_text)
+        connector = page.find_shape_by_id(connector_id)
+        other_end = (connector.end_x, connector.end_y) if end == 'begin' else (connector.begin_x, connector.begin_y)
+        shape.move(1.0, -1.0)
+
+        connector = page.find_shape_by_id(connector_id)
+        if end == 'begin':
+            assert (connector.begin_x, connector.begin_y) == (shape.x, shape.y)
+            assert (connector.end_x, connector.end_y) == other_end
+        else:
+            assert (connector.end_x, connector.end_y) == (shape.x, shape.y)
+            assert (connector.begin_x, connector.begin_y) == other_end
+        vis.save_vsdx(out_file)
+
+
+@pytest.mark.parametrize(("moved_texts", "expected_connector_ids"),
+                         [(["Shape A"], ["6"]),
+                          (["Shape B"], ["6", "7"]),
+                          (["Shape C"], ["7"]),
+                          (None, ["6", "7"]),
+                          ])
+def test_reroute_connectors(moved_texts: list, expected_connector_ids: list):
+    with VisioFile(os.path.join(basedir, 'test4_connectors.vsdx')) as vis:
+        page = vis.pages[0]  # type: Page
+        shapes = [page.find_shape_by_text(text) for text in ["Shape A", "Shape B", "Shape C"]]
+        moved = shapes if moved_texts is None else [s for s in shapes if s.text.strip() in moved_texts]
+        for s in moved:  # move shapes in xml only, so connectors are not rerouted
+            for name in ('PinX', 'PinY'):
+                cell = s.xml.find(f'{namespace}Cell[@N="{name}"]')
+                cell.attrib['V'] = str(float(cell.attrib['V']) + 1.5)
+
+        rerouted = page.reroute_connectors(None if moved_texts is None else moved)
+        assert sorted(c.ID for c in rerouted) == expected_connector_ids
+        moved_ids = [s.ID for s in moved]
+        for connect in page.connects:  # each end glued to a moved shape is at the shape pin
+            if connect.shape_id in moved_ids:
+                connector, shape = page.find_shape_by_id(connect.connector_shape_id), connect.shape
+                end = 'begin' if connect.from_rel == 'BeginX' else 'end'
+                assert (getattr(connector, f'{end}_x'), getattr(connector, f'{end}_y')) == (shape.x, shape.y)
+        page.reroute_connectors()
+        assert page.reroute_connectors() == []  # every connector is now in place
+
+
+def test_batch_defers_recalculation():
+    with VisioFile(os.path.join(basedir, 'test4_connectors.vsdx')) as vis:
+        page = vis.pages[0]  # type: Page
+        shape = page.find_shape_by_text('Shape A')
+        loc_x = shape.loc_x
+        with page.cell_graph.batch():
+            shape.width = 4.0
+            assert shape.loc_x == loc_x  # not yet recalculated
+        assert shape.loc_x == 2.0
+
+
+def test_set_new_cell_value_adds_cell_to_graph():
+    with VisioFile(os.path.join(basedir, 'test4_connectors.vsdx')) as vis:
+        page = vis.pages[2]  # type: Page
+        shape = page.find_shape_by_id('1')
+        assert ('1', 'LocPinX') not in page.cell_graph.dependents('1', 'Width')  # LocPinX is inherited from master
+        shape.set_cell_value('LocPinX', '0.1')  # new cell, with the formula of the master shape cell
+        assert ('1', 'LocPinX') in page.cell_graph.dependents('1', 'Width')
+        assert shape.loc_x == 0.1
+        shape.width = 2.0
+        assert shape.loc_x == 1.0  # LocPinX = Width*0.5
+
+
+@pytest.mark.parametrize("filename", ["test1.vsdx", "test10_nested_shapes.vsdx"])
+def test_sheet_refs_use_shape_id_map(filename: str, monkeypatch):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]  # type: Page
+        shapes = page.all_shapes
+        page.cell_graph.dependents(shapes[0].ID, 'Width')  # build the graph
+        monkeypatch.setattr(Page, "find_shape_by_id", lambda self, shape_id: pytest.fail("page searched"))
+        for shape in shapes:  # Sheet.N! refs are found without searching the page
+            assert vsdx.calc_value(shapes[0], f"Sheet.{shape.ID}!Width*2") == pytest.approx(2 * float(shape.width))
+        monkeypatch.undo()
+
+        # a shape with a new ID, not yet in the graph, is found by searching the page
+        old_id = shapes[-1].ID
+        shapes[-1].xml.attrib['ID'] = '999'
+        assert page.cell_graph.find_shape('999').xml is shapes[-1].xml
+        assert page.cell_graph.find_shape(old_id) is None
@@ -0,0 +1,72 @@
+"""Tests for ShapeSheet formula evaluation"""
+import math
+import os
+import pytest
+
+import vsdx
+from vsdx import VisioFile
+from vsdx.formulae import compile_formula
+from vsdx.formulae import formula_refs
+
+# code to get basedir of this test file in either linux/windows
+basedir = os.path.dirname(os.path.relpath(__file__))
+
+
+@pytest.mark.parametrize(("formula", "expected_value"),
+                         [("1+2*3", 7.0),
+                          ("(1+2)*3", 9.0),
+                          ("2^3", 8.0),
+                          ("GUARD(0)", 0.0),
+                          ("GUARD(FALSE)", 0.0),
+                          ("SQRT(3^2+4^2)", 5.0),
+                          ("ATAN2(1,0)", math.pi / 2),
+                          ("IF(1>2,10,20)", 20.0),
+                          ("IF(AND(1,NOT(0)),10,20)", 10.0),
+                          ("MIN(3,1,2)+MAX(3,1,2)", 4.0),
+                          ("((1<0)*2)+((2>1)*4)", 4.0),
+                          ("90DEG", math.pi / 2),
+                          ("GUARD(0.19685039370079DL)", 0.19685039370079),
+                          ("25.4 mm", 1.0),
+                          ('"a"&"b"', "ab"),
+                          ])
+def test_evaluate_formula(formula: str, expected_value):
+    value = compile_formula(formula).evaluate(shape=None)
+    if isinstance(expected_value, float):
+        assert abs(value - expected_value) < 1e-9
+    else:
+        assert value == expected_value
+
+
+@pytest.mark.parametrize("formula", ["THEMEVAL()", "Width*", "No Formula", "1+)", ""])
+def test_unsupported_formula(formula: str):
+    assert compile_formula(formula) is None
+
+
+def test_compiled_formula_is_cached():
+    assert compile_formula("Sheet.5!Width*0.5") is compile_formula("Sheet.5!Width*0.5")
+    assert compile_formula("Sheet.5!Width*0.5").refs == {("5", "Width")}
+    assert compile_formula("GUARD((BeginX+EndX)/2)").refs == {(None, "BeginX"), (None, "EndX")}
+
+
+@pytest.mark.parametrize(("formula", "expected_refs"),
+                         [("Sheet.5!Width*0.5", {("5", "Width")}),
+                          ("Sheet.12!Width-Sheet.7!Height+Sheet.12!PinX", {("12", "Width"), ("7", "Height"), ("12", "PinX")}),
+                          ("Width*0.5+ThePage!PageScale", {(None, "Width"), ("ThePage", "PageScale")}),
+                          ("UNKNOWN(Sheet.5!Width)", None),
+                          ])
+def test_formula_refs(formula: str, expected_refs: set):
+    assert formula_refs(formula) == expected_refs
+
+
+@pytest.mark.parametrize(("filename", "page_index", "shape_id", "cell_name", "formula"),
+                         [("test4_connectors.vsdx", 0, "1", "LocPinX", "Width*0.5"),
+                          ("test4_connectors.vsdx", 0, "6", "Width", "GUARD(EndX-BeginX)"),
+                          ("test4_connectors.vsdx", 0, "7", "Width", "GUARD(0.19685039370079DL)"),
+                          ])
+def test_calc_value_matches_shape_cell(filename: str, page_index: int, shape_id: str, cell_name: str, formula: str):
+    # values calculated from formula should match the values saved by Visio
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        shape = vis.pages[page_index].find_shape_by_id(shape_id)
+        assert shape.cell_formula(cell_name) == formula
+        value = vsdx.calc_value(shape, shape.cell_formula(cell_name))
+        assert abs(value - float(shape.cell_value(cell_name))) < 1e-6
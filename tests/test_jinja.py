@@ -2,9 +2,15 @@ import pytest
 import os
 from datetime import datetime
 
+import xml.etree.ElementTree as ET
+
+from vsdx import namespace
 from vsdx import Page  # for typing
 from vsdx import Shape  # for typing
 from vsdx import VisioFile
+from vsdx import vsdxfile
+from vsdx.vsdxfile import jinja_template_shape_ids
+from vsdx.vsdxfile import split_jinja_statements
 
 # code to get basedir of this test file in either linux/windows
 basedir = os.path.dirname(os.path.relpath(__file__))
@@ -233,3 +239,78 @@ def test_jinja_page_showif(filename: str, context: dict, expected_page_count, ex
             page_names.append(p.name)
         assert len(vis.pages) == expected_page_count
         assert page_names == expected_page_names
+
+
+@pytest.mark.parametrize(("filename", "context"),
+                         [("test_jinja.vsdx", {"date": datetime(2024, 1, 2), "scenario": "Two", "x": 5, "y": 2}),
+                          ("test_jinja_loop_showif.vsdx", {"test_list": [1, 2, 3, 4]}),
+                          ("test_jinja_page_showif.vsdx", {"show": False}),
+                          ])
+def test_jinja_render_parallel(filename: str, context: dict):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        vis.jinja_render_vsdx(context=context)
+        expected_pages = [(p.name, ET.tostring(p.xml.getroot())) for p in vis.pages]
+
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_jinja_render_parallel.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        # pages rendered in worker processes have the same content, in the same order, as when rendered in turn
+        vis.jinja_render_vsdx(context=context, max_workers=2)
+        assert [(p.name, ET.tostring(p.xml.getroot())) for p in vis.pages] == expected_pages
+        vis.save_vsdx(out_file)
+
+
+@pytest.mark.parametrize(("text", "expected_text", "expected_statements"),
+                         [("Shape {{ x }}", "Shape {{ x }}", []),
+                          ("{% for item in items %}{{ item }}", "{{ item }}", [("for", "item in items", None)]),
+                          ("{% showif x > 1 %}A{% set self.y = n*2 %}B{% if y %}C{% endif %}", "AB{% if y %}C{% endif %}",
+                           [("showif", "x > 1", None), ("set self", "y", "n*2")]),
+                          ])
+def test_split_jinja_statements(text: str, expected_text: str, expected_statements: list):
+    assert split_jinja_statements(text) == (expected_text, expected_statements)
+
+
+def test_unescape_jinja_statements():
+    source = "<Text>{% if x &gt; 1 and y &lt; 2 %}x &gt; 1{% endif %}</Text>"
+    assert VisioFile.unescape_jinja_statements(source) == "<Text>{% if x > 1 and y < 2 %}x &gt; 1{% endif %}</Text>"
+
+
+@pytest.mark.parametrize(("filename", "page_index", "expected_shape_ids"),
+                         [("test_jinja.vsdx", 0, {"6": True, "7": True, "8": True}),
+                          ("test_jinja.vsdx", 1, {"1": True, "3": False, "4": True, "5": True}),
+                          ("test1.vsdx", 0, {"6": True}),
+                          ("test1.vsdx", 2, {}),
+                          ])
+def test_jinja_template_shape_ids(filename: str, page_index: int, expected_shape_ids: dict):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        assert jinja_template_shape_ids(vis.pages[page_index]) == expected_shape_ids
+
+
+def test_jinja_template_shape_ids_finds_each_master_once(monkeypatch):
+    found = []
+    find_master_shape_xml = vsdxfile.master_shape_xml
+
+    def master_shape_xml(vis, master_id, master_shape_id):
+        found.append((master_id, master_shape_id))
+        return find_master_shape_xml(vis, master_id, master_shape_id)
+
+    with VisioFile(os.path.join(basedir, "test4_connectors.vsdx")) as vis:
+        expected = [jinja_template_shape_ids(page) for page in vis.pages]
+        monkeypatch.setattr(vsdxfile, "master_shape_xml", master_shape_xml)
+        master_cache = dict()  # shared by all pages, as in jinja_render_vsdx()
+        assert [jinja_template_shape_ids(page, master_cache) for page in vis.pages] == expected
+        assert found and len(found) == len(set(found)) == len(master_cache)
+
+
+def test_jinja_render_skips_non_template_shapes():
+    with VisioFile(os.path.join(basedir, "test1.vsdx")) as vis:
+        page = vis.pages[0]  # type: Page
+        shape = page.find_shape_by_id("1")
+        text_xml = shape.xml.find(f"{namespace}Text")
+        text_xml.append(ET.Element(f"{namespace}cp", {"IX": "0"}))  # text formatting, which would be cleared by setting text
+        xml_by_page = [p.xml for p in vis.pages]
+
+        vis.jinja_render_vsdx(context={"scenario": "One"})
+        # pages with no template markup are not re-parsed, and shapes with no markup are not changed
+        assert [p.xml is xml for p, xml in zip(vis.pages, xml_by_page)] == [False, True, True]
+        assert page.find_shape_by_id("1").xml.find(f"{namespace}Text/{namespace}cp") is not None
+        assert "One" in page.find_shape_by_id("6").text
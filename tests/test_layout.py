@@ -0,0 +1,159 @@
+"""Tests for grid, row, column and graph layout of shapes"""
+import os
+import pytest
+
+from vsdx import namespace
+from vsdx import Page
+from vsdx import VisioFile
+from vsdx.layout import connect_graph
+from vsdx.layout import force_positions
+from vsdx.layout import grid_positions
+from vsdx.layout import layered_positions
+from vsdx.layout import layout_connected
+from vsdx.layout import layout_column
+from vsdx.layout import layout_grid
+from vsdx.layout import layout_row
+from vsdx.layout import shape_box
+
+# code to get basedir of this test file in either linux/windows
+basedir = os.path.dirname(os.path.relpath(__file__))
+
+
+@pytest.mark.parametrize(("sizes", "options", "expected_positions"),
+                         [([(1, 1)] * 3, {}, [(0, 0), (1, 0), (2, 0)]),
+                          ([(1, 1)] * 3, {"columns": 2, "spacing": 0.5}, [(0, 0), (1.5, 0), (0, -1.5)]),
+                          ([(1, 1)] * 3, {"rows": 2, "order": "columns"}, [(0, 0), (0, -1), (1, 0)]),
+                          ([(1, 1)] * 5, {"max_width": 3.5, "spacing": (0.25, 0)}, [(0, 0), (1.25, 0), (2.5, 0),
+                                                                                    (0, -1), (1.25, -1)]),
+                          ([(2, 1), (1, 3), (1, 1)], {"columns": 2, "uniform": False}, [(0, 0), (2, 0), (0, -3)]),
+                          ([(2, 1), (1, 3), (1, 1)], {"columns": 2}, [(0, 0), (2, 0), (0, -3)]),
+                          ([(1, 1)] * 2, {"origin": (2, 10)}, [(2, 10), (3, 10)]),
+                          ([], {}, []),
+                          ])
+def test_grid_positions(sizes: list, options: dict, expected_positions: list):
+    assert grid_positions(sizes, **options) == expected_positions
+
+
+@pytest.mark.parametrize(("filename", "shape_ids", "options"),
+                         [("test4_connectors.vsdx", ["1", "2", "5"], {"columns": 2, "spacing": 0.25}),
+                          ("test4_connectors.vsdx", ["5", "2", "1"], {"rows": 1, "origin": (1.0, 5.0)}),
+                          ("test4_connectors.vsdx", ["1", "2", "5"], {"wrap": True, "spacing": 3.0}),
+                          ])
+def test_layout_grid(filename: str, shape_ids: list, options: dict):
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_layout_grid.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]  # type: Page
+        shapes = [page.find_shape_by_id(i) for i in shape_ids]
+        positions = layout_grid(shapes, **options)
+        for shape, (x, y) in zip(shapes, positions):
+            left, top, width, height = shape_box(shape)
+            assert (round(left, 6), round(top, 6)) == (round(x, 6), round(y, 6))
+        assert all(x + shape_box(s)[2] <= page.width for s, (x, y) in zip(shapes, positions)) or not options.get('wrap')
+        # connectors glued to moved shapes are rerouted when the batch of moves ends
+        connector = page.find_shape_by_id("6")
+        assert (connector.end_x, connector.end_y) == (page.find_shape_by_id("2").x, page.find_shape_by_id("2").y)
+        vis.save_vsdx(out_file)
+
+
+def test_layout_row_and_column():
+    with VisioFile(os.path.join(basedir, "test4_connectors.vsdx")) as vis:
+        page = vis.pages[0]  # type: Page
+        shapes = [page.find_shape_by_id(i) for i in ["1", "2", "5"]]
+        layout_row(shapes, spacing=0.5, origin=(1.0, 8.0))
+        boxes = [shape_box(s) for s in shapes]
+        assert [round(top, 6) for left, top, w, h in boxes] == [8.0] * 3
+        assert all(abs(boxes[i][0] - (boxes[i - 1][0] + boxes[i - 1][2] + 0.5)) < 1e-9 for i in (1, 2))
+
+        layout_column(shapes, spacing=0.5, origin=(1.0, 8.0))
+        boxes = [shape_box(s) for s in shapes]
+        assert [round(left, 6) for left, top, w, h in boxes] == [1.0] * 3
+        assert all(abs(boxes[i][1] - (boxes[i - 1][1] - boxes[i - 1][3] - 0.5)) < 1e-9 for i in (1, 2))
+
+
+def test_jinja_loop_layout():
+    with VisioFile(os.path.join(basedir, "test_jinja_loop.vsdx")) as vis:
+        page = vis.pages[0]  # type: Page
+        loop_shape = page.find_shape_by_id("9")
+        text_xml = loop_shape.xml.find(f"{namespace}Text")
+        text_xml.text = text_xml.text.replace("%}", "%}{% layout columns=cols, spacing=0.1 %}", 1)
+        left, top, width, height = shape_box(loop_shape)
+
+        vis.jinja_render_vsdx(context={"scenario": "Layout", "test_list": [1, 2, 3], "cols": 2})
+        copies = [s for s in vis.pages[0].child_shapes if s.find_shape_by_text("In this instance")]
+        assert len(copies) == 3
+        assert [(round(b[0], 6), round(b[1], 6)) for b in map(shape_box, copies)] == \
+               [(round(x, 6), round(y, 6)) for x, y in [(left, top), (left + width + 0.1, top), (left, top - height - 0.1)]]
+
+
+def test_jinja_layout_without_loop():
+    with VisioFile(os.path.join(basedir, "test_jinja_loop.vsdx")) as vis:
+        text_xml = vis.pages[0].find_shape_by_id("9").xml.find(f"{namespace}Text")
+        for e in text_xml.iter():
+            e.text = e.tail = None
+        text_xml.text = "{% layout columns=2 %}Not a loop"
+        with pytest.raises(ValueError, match="layout statement without a for loop"):
+            vis.jinja_render_vsdx(context={"scenario": "Layout", "test_list": [1, 2, 3]})
+
+
+def test_connect_graph():
+    with VisioFile(os.path.join(basedir, "test4_connectors.vsdx")) as vis:
+        nodes, edges = connect_graph(vis.pages[0])
+        assert sorted(edges) == [("1", "2"), ("2", "5")]
+        assert sorted(nodes) == ["1", "2", "5"]
+
+
+@pytest.mark.parametrize(("edges", "options", "expected_positions"),
+                         [([("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")], {},
+                           {"a": (0.5, 0), "b": (0, -1), "c": (1, -1), "d": (0.5, -2)}),
+                          ([("a", "b"), ("b", "c"), ("c", "a")], {"spacing": 2.0, "origin": (1.0, 1.0)},
+                           {"a": (1, 1), "b": (1, -1), "c": (1, -3)}),
+                          ([("a", "b"), ("a", "c")], {"direction": "right"},
+                           {"a": (0, -0.5), "b": (1, 0), "c": (1, -1)}),
+                          ])
+def test_layered_positions(edges: list, options: dict, expected_positions: dict):
+    nodes = list(dict.fromkeys(n for edge in edges for n in edge))
+    assert layered_positions(nodes, edges, **options) == expected_positions
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_force_positions(use_numpy: bool):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    nodes = [str(i) for i in range(20)]
+    edges = [(str(i), str(i + 1)) for i in range(19)]
+    positions = force_positions(nodes, edges, spacing=1.5, origin=(2.0, 10.0), use_numpy=use_numpy)
+    assert list(positions) == nodes
+    assert min(x for x, y in positions.values()) == pytest.approx(2.0)
+    assert max(y for x, y in positions.values()) == pytest.approx(10.0)
+    # positions are repeatable for a seed
+    assert force_positions(nodes, edges, spacing=1.5, origin=(2.0, 10.0), use_numpy=use_numpy) == positions
+
+
+def test_force_positions_numpy_matches_python():
+    pytest.importorskip("numpy")
+    nodes = [str(i) for i in range(30)]
+    edges = [(str(i), str((i * 7) % 30)) for i in range(30)]
+    python = force_positions(nodes, edges, iterations=1, use_numpy=False)
+    numpy = force_positions(nodes, edges, iterations=1, use_numpy=True)
+    assert all(python[n] == pytest.approx(numpy[n]) for n in nodes)
+
+
+@pytest.mark.parametrize("method", ["layered", "force"])
+def test_layout_connected(method: str):
+    out_file = os.path.join(basedir, 'out', f'test4_connectors_test_layout_connected_{method}.vsdx')
+    with VisioFile(os.path.join(basedir, "test4_connectors.vsdx")) as vis:
+        page = vis.pages[0]  # type: Page
+        positions = layout_connected(page, method=method, origin=(2.0, 9.0))
+        assert sorted(positions) == ["1", "2", "5"]
+        for shape_id, (x, y) in positions.items():
+            shape = page.find_shape_by_id(shape_id)
+            assert (shape.x, shape.y) == pytest.approx((x, y))
+        # connectors glued at both ends are rerouted to the moved shapes
+        for connector_id, begin_id, end_id in [("6", "1", "2"), ("7", "2", "5")]:
+            connector = page.find_shape_by_id(connector_id)
+            end = page.find_shape_by_id(end_id)
+            assert (connector.end_x, connector.end_y) == pytest.approx((end.x, end.y))
+        vis.save_vsdx(out_file)
+    with pytest.raises(ValueError):
+        with VisioFile(os.path.join(basedir, "test4_connectors.vsdx")) as vis:
+            layout_connected(vis.pages[0], method="circle")
@@ -270,3 +270,20 @@ def test_get_text_from_master_shape(filename: str, shape_id: str, expected_text:
 
         child_shape = vis.pages[0].find_shape_by_id(shape_id)
         assert child_shape.text == expected_text
+
+
+@pytest.mark.parametrize(("filename", "setter"),
+                         [('test5_master.vsdx', 'set_cell_value'),
+                          ('test5_master.vsdx', 'set_cell_formula')])
+def test_new_master_cell_is_inherited(filename: str, setter: str):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.get_page(0)
+        sub_shape_a = page.find_shape_by_text('Shape A').child_shapes[0]
+        master = sub_shape_a.master_shape
+        assert 'ShapeSplit' not in master.cells
+
+        # add a cell to the master shape through another Shape of the same xml
+        master_copy = Shape(xml=master.xml, parent=master.parent, page=master.page)
+        getattr(master_copy, setter)('ShapeSplit', '1')
+        assert 'ShapeSplit' in sub_shape_a.master_shape.cells
+        assert float(sub_shape_a.cell_value('ShapeSplit')) == 1.0
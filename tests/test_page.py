@@ -309,6 +309,54 @@ def test_find_shape_by_data_property_label_value(filename: str, page_index: int,
         assert shape.text.replace('\n', '') == expected_shape_name
 
 
+@pytest.mark.parametrize(("filename", "page_index", "key", "rows", "expected_values", "expected_unmatched"),
+                         [("test6_shape_properties.vsdx", 0, "shape_id",
+                           [{"shape_id": "1", "my_property_label": "new 1"},
+                            {"shape_id": "2", "my_property_label": "new 2"},
+                            {"shape_id": "99", "my_property_label": "no such shape"}],
+                           {"1": {"my_property_label": "new 1"}, "2": {"my_property_label": "new 2"}}, 1),
+                          ("test6_shape_properties.vsdx", 0, "my_property_label",
+                           [{"my_property_label": "a different value", "my_property_label_x": "ignored"},
+                            {"my_property_label": "property value", "my_second_property_label": "updated"}],
+                           {"1": {"my_property_label": "property value", "my_second_property_label": "updated"}}, 0),
+                          ])
+def test_update_data_properties(filename: str, page_index: int, key: str, rows: list, expected_values: dict,
+                                expected_unmatched: int):
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_update_data_properties.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        unmatched = vis.pages[page_index].update_data_properties(rows, key=key)
+        assert len(unmatched) == expected_unmatched
+        vis.save_vsdx(out_file)
+
+    with VisioFile(out_file) as vis:
+        page = vis.pages[page_index]
+        for shape_id, values in expected_values.items():
+            props = page.find_shape_by_id(shape_id).data_properties
+            for label, value in values.items():
+                assert props[label].value == value
+
+
+@pytest.mark.parametrize(("filename", "filters", "expected_shape_ids"),
+                         [("test2.vsdx", {}, ["6", "9", "1", "7", "8", "11", "2", "10", "14", "5", "12", "13", "16", "17"]),
+                          ("test2.vsdx", {"max_depth": 1}, ["6", "9", "11", "14", "16", "17"]),
+                          ("test2.vsdx", {"shape_type": "Group"}, ["9", "11", "14"]),
+                          ("test2.vsdx", {"shape_type": "Shape", "max_depth": 1}, ["6", "16", "17"]),
+                          ("test4_connectors.vsdx", {"master": "2"}, ["6", "7"]),
+                          ("test4_connectors.vsdx", {"master": "Dynamic connector"}, ["6", "7"]),
+                          ("test4_connectors.vsdx", {"master": "Router"}, []),
+                          ])
+def test_iter_shapes(filename: str, filters: dict, expected_shape_ids: list):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]  # type: Page
+        shapes = page.iter_shapes(**filters)
+        assert not isinstance(shapes, list)  # shapes are generated as needed
+        assert [s.ID for s in shapes] == expected_shape_ids
+        if not filters:
+            assert [s.ID for s in page.all_shapes] == expected_shape_ids
+            # sub shapes have their parent group as parent
+            assert page.find_shape_by_id("7").parent.ID == "9"
+
+
 @pytest.mark.parametrize(("filename", "page_index", "regex", "expected_shape_ids"),
                          [
                              ('test1.vsdx', 0, r'\s(\S{2})\s', ['2', '5', '6']),
@@ -469,6 +517,36 @@ def test_add_connect_between_shapes_by_property(filename: str, page_index: int,
             assert page.find_shape_by_id(new_connector_id)
 
 
+@pytest.mark.parametrize(("filename", "page_index", "shape_texts"),
+                         [
+                             ('test1.vsdx', 0, ["Shape to copy", "Shape to remove", "Shape to copy"]),
+                             ('test4_connectors.vsdx', 0, ["Shape A", "Shape B", "Shape C", "Shape A"]),
+                             ('test8_simple_connector.vsdx', 0, []),
+                          ])
+def test_connect_many(filename: str, page_index: int, shape_texts: List[str]):
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_connect_many.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[page_index]  # type: Page
+        shapes = [page.find_shape_by_text(text) for text in shape_texts]
+        pairs = list(zip(shapes, shapes[1:]))
+        connectors = page.connect_many(pairs)
+        assert len(connectors) == len(pairs)
+        assert len(set(c.ID for c in connectors)) == len(pairs)
+        for c, (from_shape, to_shape) in zip(connectors, pairs):
+            assert (c.begin_x, c.begin_y) == from_shape.center_x_y
+            assert (c.end_x, c.end_y) == to_shape.center_x_y
+        vis.save_vsdx(out_file)
+
+    # re-open saved file and check each connector is glued to its pair of shapes
+    with VisioFile(out_file) as vis:
+        page = vis.pages[page_index]
+        glued = {(c.connector_shape_id, c.from_rel): c.shape_id for c in page.connects}
+        for c, (from_shape, to_shape) in zip(connectors, pairs):
+            assert page.find_shape_by_id(c.ID) is not None
+            assert glued[(c.ID, 'BeginX')] == from_shape.ID
+            assert glued[(c.ID, 'EndX')] == to_shape.ID
+
+
 def fl(v: float):
     if type(v) is float:
         return f"{v:.2g}"
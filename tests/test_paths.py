@@ -0,0 +1,118 @@
+"""Tests for export of shape geometry as SVG path data and polylines"""
+import math
+import os
+import pytest
+
+from vsdx import VisioFile
+from vsdx.paths import geometry_path, page_polylines, page_svg_paths, polylines, shape_paths, svg_number, svg_path_data
+
+# code to get basedir of this test file in either linux/windows
+basedir = os.path.dirname(os.path.relpath(__file__))
+
+
+@pytest.mark.parametrize("rows, width, height, expected_path", [
+    ([('MoveTo', {'X': 0.0, 'Y': 0.0}), ('LineTo', {'X': 1.0, 'Y': 0.0}), ('LineTo', {'X': 0.0, 'Y': 0.0})], 2, 3,
+     'M0 0 L1 0 L0 0 Z'),
+    ([('RelMoveTo', {'X': 0.0, 'Y': 0.0}), ('RelLineTo', {'X': 1.0, 'Y': 1.0})], 2, 3, 'M0 0 L2 3'),
+    ([('LineTo', {'X': 1.0, 'Y': 1.0})], 1, 1, 'M0 0 L1 1'),  # starts at local origin without a MoveTo
+    ([('MoveTo', {'X': 0.0, 'Y': 0.0}), ('ArcTo', {'X': 1.0, 'Y': 0.0, 'A': 0.0})], 1, 1, 'M0 0 L1 0'),
+    ([('MoveTo', {'X': 0.0, 'Y': 0.0}), ('RelCubBezTo', {'X': 1.0, 'Y': 0.0, 'A': 0.0, 'B': 1.0, 'C': 1.0, 'D': 1.0})],
+     2, 2, 'M0 0 C0 2 2 2 2 0'),
+    ([('MoveTo', {'X': 0.0, 'Y': 0.0}), ('PolylineTo', {'X': 1.0, 'Y': 1.0, 'A': 'POLYLINE(0, 1, 0.5, 0.5)'})], 4, 4,
+     'M0 0 L2 0.5 L1 1'),
+])
+def test_geometry_path(rows: list, width: float, height: float, expected_path: str):
+    assert svg_path_data(geometry_path(rows, width, height)) == expected_path
+
+
+@pytest.mark.parametrize("value, precision, expected", [
+    (1.0, 4, '1'), (-0.0, 4, '0'), (2.50004, 4, '2.5'), (0.999, 2, '1'), (-1.25, 1, '-1.2'), (10.0, 4, '10'),
+])
+def test_svg_number(value: float, precision: int, expected: str):
+    assert svg_number(value, precision) == expected
+
+
+@pytest.mark.parametrize("row, expected_mid", [
+    (('ArcTo', {'X': 2.0, 'Y': 0.0, 'A': 1.0}), (1.0, -1.0)),  # positive bow is counter clockwise
+    (('ArcTo', {'X': 2.0, 'Y': 0.0, 'A': -1.0}), (1.0, 1.0)),
+    (('EllipticalArcTo', {'X': 4.0, 'Y': 0.0, 'A': 2.0, 'B': 1.0, 'C': 0.0, 'D': 2.0}), (2.0, 1.0)),
+])
+def test_geometry_path_arcs(row: tuple, expected_mid: tuple):
+    commands = geometry_path([('MoveTo', {'X': 0.0, 'Y': 0.0}), row], 1, 1)
+    line = polylines(commands, curve_points=16, use_numpy=False)[0]
+    assert line[-1] == (row[1]['X'], row[1]['Y'])
+    # every point is on the circle or ellipse, and the arc passes through its middle point
+    if row[0] == 'ArcTo':
+        assert all(math.isclose(math.hypot(x - 1, y), 1.0, abs_tol=1e-3) for x, y in line)
+    else:
+        assert all(math.isclose(math.hypot((x - 2) / 2, y), 1.0, abs_tol=1e-3) for x, y in line)
+    assert min(math.hypot(x - expected_mid[0], y - expected_mid[1]) for x, y in line) < 0.05
+
+
+def test_geometry_path_ellipse():
+    commands = geometry_path([('Ellipse', {'X': 1.0, 'Y': 1.0, 'A': 2.0, 'B': 1.0, 'C': 1.0, 'D': 1.5})], 2, 1)
+    line = polylines(commands, use_numpy=False)[0]
+    assert line[0] == line[-1] == (2.0, 1.0)
+    assert all(math.isclose(math.hypot(x - 1, (y - 1) * 2), 1.0, abs_tol=1e-3) for x, y in line)
+    assert svg_path_data(commands).endswith('Z')
+
+
+@pytest.mark.parametrize("filename", ["test1.vsdx", "test2.vsdx", "test10_nested_shapes.vsdx", "test11_rotate.vsdx",
+                                      "test5_master.vsdx", "test_master_multiple_child_shapes.vsdx"])
+def test_page_polylines(filename: str):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        for page in vis.pages:
+            shapes = {s.ID: s for s in page.all_shapes}
+            assert [p.ID for p in shape_paths(page)] == [s.ID for s in page.all_shapes]  # every shape, in order
+            lines = page_polylines(page, use_numpy=False)
+            svg_paths = page_svg_paths(page)
+            assert set(lines.keys()) == set(svg_paths.keys())
+            for shape_id, shape_lines in lines.items():
+                shape = shapes[shape_id]
+                if shape.parent.parent is page and not shape.begin_x and not float(shape.cell_value('Angle') or 0):
+                    # outline of a shape on the page is within the bounds of the shape
+                    left, bottom, right, top = shape.bounds
+                    points = [p for line in shape_lines for p in line]
+                    assert min(px for px, py in points) >= left - 1e-6 and max(px for px, py in points) <= right + 1e-6
+                    assert min(py for px, py in points) >= bottom - 1e-6 and max(py for px, py in points) <= top + 1e-6
+
+
+def test_page_polylines_rotated():
+    with VisioFile(os.path.join(basedir, "test11_rotate.vsdx")) as vis:
+        page = vis.pages[0]
+        lines = page_polylines(page, use_numpy=False)
+        for shape in page.child_shapes:
+            corners = lines[shape.ID][0][:-1]  # a rectangle turns about its pin
+            assert math.isclose(sum(x for x, y in corners) / 4, shape.x, abs_tol=1e-6)
+            assert math.isclose(sum(y for x, y in corners) / 4, shape.y, abs_tol=1e-6)
+            x0, y0 = corners[0]
+            x1, y1 = corners[1]
+            assert math.isclose(math.atan2(y1 - y0, x1 - x0), float(shape.cell_value('Angle')), abs_tol=1e-6)
+
+
+def test_page_polylines_numpy():
+    numpy = pytest.importorskip("numpy")
+    with VisioFile(os.path.join(basedir, "test1.vsdx")) as vis:
+        page = vis.pages[0]
+        lines = page_polylines(page)
+        expected = page_polylines(page, use_numpy=False)
+        for shape_id, shape_lines in lines.items():
+            for line, expected_line in zip(shape_lines, expected[shape_id]):
+                assert isinstance(line, numpy.ndarray) and line.shape == (len(expected_line), 2)
+                assert numpy.allclose(line, expected_line)
+
+
+@pytest.mark.parametrize("filename", ["test1.vsdx", "test4_connectors.vsdx", "test9_rect_and_line.vsdx"])
+def test_page_svg_paths_after_move(filename: str):
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_page_svg_paths_after_move.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]
+        unmoved = page_svg_paths(page)
+        for shape in page.child_shapes:
+            shape.move(1.0, -0.5)
+        moved = page_svg_paths(page)
+        assert moved != unmoved
+        vis.save_vsdx(out_file)
+
+    with VisioFile(out_file) as vis:  # paths of moved shapes are the same as when saved and opened again
+        assert page_svg_paths(vis.pages[0]) == moved
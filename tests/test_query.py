@@ -0,0 +1,76 @@
+"""Tests for ShapeQuery"""
+import os
+import pytest
+
+from vsdx import Page
+from vsdx import ShapeQuery
+from vsdx import VisioFile
+
+# code to get basedir of this test file in either linux/windows
+basedir = os.path.dirname(os.path.relpath(__file__))
+
+
+@pytest.mark.parametrize(("filename", "page_index", "conditions", "expected_shape_ids"),
+                         [("test4_connectors.vsdx", 0, [("master", "2")], ["6", "7"]),
+                          ("test4_connectors.vsdx", 0, [("master", "Dynamic connector")], ["6", "7"]),
+                          ("test4_connectors.vsdx", 1, [("master", "Dynamic connector"), ("text", "B to")], ["7"]),
+                          ("test4_connectors.vsdx", 2, [("master", "Router"), ("property", "Network Name", "Router01")],
+                           ["6"]),
+                          ("test4_connectors.vsdx", 2, [("property", "Network Name")], ["1", "6", "11", "12"]),
+                          ("test4_connectors.vsdx", 2, [("property", "SubShapeType", "Switch")], ["1"]),
+                          ("test4_connectors.vsdx", 2, [("text_regex", r"^0\d$")], ["11", "12"]),
+                          ("test4_connectors.vsdx", 2, [("text_regex", r"^0\d$"), ("bounds", 2.0, 10.0, 4.0, 12.0)],
+                           ["11"]),
+                          ("test2.vsdx", 0, [("text_regex", r"^Sub-shape \d")], ["7", "8", "10"]),
+                          ("test2.vsdx", 0, [("attribute", "Type", "Group"), ("text", "remove")], ["11"]),
+                          ("test6_shape_properties.vsdx", 2, [("property", "master_Prop", "master prop value")], ["2", "3"]),
+                          ("test6_shape_properties.vsdx", 2, [("property", "master_Prop", "override")], ["4"]),
+                          ])
+def test_query(filename: str, page_index: int, conditions: list, expected_shape_ids: list):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[page_index]  # type: Page
+        query = page.query()
+        for method, *args in conditions:
+            query = getattr(query, method)(*args)
+        shapes = query.all()
+        assert [s.ID for s in shapes] == expected_shape_ids
+        assert all(s.page is page for s in shapes)
+        first = query.first()
+        assert (first.ID if first else None) == (expected_shape_ids[0] if expected_shape_ids else None)
+
+
+@pytest.mark.parametrize(("filename", "page_index", "bounds"),
+                         [("test4_connectors.vsdx", 0, (0.0, 9.0, 3.0, 12.0)),
+                          ("test4_connectors.vsdx", 1, (2.0, 9.0, 6.0, 11.0)),
+                          ("test2.vsdx", 0, (0.0, 0.0, 5.0, 5.0)),
+                          ])
+def test_query_bounds_matches_shape_bounds(filename: str, page_index: int, bounds: tuple):
+    x_min, y_min, x_max, y_max = bounds
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[page_index]  # type: Page
+        for overlap in [False, True]:
+            expected = list()
+            for s in page.all_shapes:
+                bx, by, ex, ey = s.bounds
+                if (bx, by, ex, ey) == (0, 0, 0, 0):
+                    continue
+                left, right, bottom, top = min(bx, ex), max(bx, ex), min(by, ey), max(by, ey)
+                if overlap:
+                    inside = left <= x_max and right >= x_min and bottom <= y_max and top >= y_min
+                else:
+                    inside = left >= x_min and right <= x_max and bottom >= y_min and top <= y_max
+                if inside:
+                    expected.append(s.ID)
+            assert [s.ID for s in page.query().bounds(*bounds, overlap=overlap)] == expected
+
+
+def test_query_all_pages():
+    with VisioFile(os.path.join(basedir, "test4_connectors.vsdx")) as vis:
+        shapes = vis.query().text("Shape B").all()
+        assert [(s.page.name, s.ID) for s in shapes] == [(p.name, "2") for p in vis.pages[:2]]
+        # an unbound query can be run against any page
+        query = ShapeQuery().master("Dynamic connector").where(lambda s: s.text == '')
+        assert [s.ID for s in query.run(vis.pages[0])] == ["6", "7"]
+        assert [s.ID for s in query.run(vis.pages[1])] == []
+        with pytest.raises(ValueError):
+            query.all()
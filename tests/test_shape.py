@@ -4,6 +4,7 @@ import pytest
 
 import vsdx
 from vsdx import DataProperty
+from vsdx import namespace
 from vsdx import Page  # for typing
 from vsdx import Shape
 from vsdx import VisioFile
@@ -371,6 +372,67 @@ def test_set_shape_data_properties(filename: str, page_index: int, shape_name: s
             assert prop.get_attribute('Value', 'F') != 'No Formula'
 
 
+@pytest.mark.parametrize(("filename", "page_index", "shape_name"),
+                         [("test1.vsdx", 0, "Shape Text"),
+                          ("test6_shape_properties.vsdx", 0, "Shape Three"),
+                          ("test6_shape_properties.vsdx", 1, "Shape A"),
+                          ("test6_shape_properties.vsdx", 2, "C"),
+                          ])
+def test_get_shape_data_property_value_does_not_change_xml(filename: str, page_index: int, shape_name: str):
+    """Check that reading DataProperty.value leaves xml unchanged, and that 'No Formula' is removed on save"""
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_data_property_value_no_change.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        shape = vis.pages[page_index].find_shape_by_text(shape_name)  # type: Shape
+        before = vsdx.pretty_print_element(shape.xml)
+        values = [p.value for p in shape.data_properties.values()]
+        assert values
+        assert vsdx.pretty_print_element(shape.xml) == before
+        vis.save_vsdx(out_file)
+
+    with VisioFile(out_file) as vis:
+        shape = vis.pages[page_index].find_shape_by_text(shape_name)  # type: Shape
+        assert [p.value for p in shape.data_properties.values()] == values
+        for prop in shape.data_properties.values():
+            assert prop.get_attribute('Value', 'F') != 'No Formula'
+
+
+def test_shape_data_properties_not_shared_with_master():
+    """Check that shape properties do not leak into master shape properties or shapes with the same master"""
+    with VisioFile(os.path.join(basedir, "test6_shape_properties.vsdx")) as vis:
+        page = vis.pages[2]
+        shape_a = page.find_shape_by_text("A")
+        shape_b = page.find_shape_by_text("B")
+        assert set(shape_b.data_properties.keys()) == {"master_Prop", "shape_prop"}
+        # shape A has the same master as shape B, but not shape B's own property
+        assert set(shape_a.data_properties.keys()) == {"master_Prop"}
+        assert set(shape_a.master_shape.data_properties.keys()) == {"master_Prop"}
+        # master properties are read once per master shape
+        assert shape_a._master_data_properties() is shape_b._master_data_properties()
+
+
+def test_set_inherited_shape_data_property_copy_on_write():
+    """Check that setting an inherited master property value only changes the shape"""
+    filename = "test6_shape_properties.vsdx"
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_set_inherited_data_property.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[2]
+        prop = page.find_shape_by_text("A").data_properties["master_Prop"]
+        assert prop.is_inherited
+        prop.value = "changed in A"
+        assert not prop.is_inherited
+        assert prop.value == "changed in A"
+        assert page.find_shape_by_text("B").data_properties["master_Prop"].value == "master prop value"
+        vis.save_vsdx(out_file)
+
+    with VisioFile(out_file) as vis:
+        page = vis.pages[2]
+        prop = page.find_shape_by_text("A").data_properties["master_Prop"]
+        assert prop.value == "changed in A"
+        assert prop.label == "master_Prop"
+        assert page.find_shape_by_text("B").data_properties["master_Prop"].value == "master prop value"
+        assert page.find_shape_by_text("A").master_shape.data_properties["master_Prop"].value == "master prop value"
+
+
 @pytest.mark.parametrize(("filename", "page_index", "container_shape_name", "expected_shape_name", "property_label"),
                          [("test6_shape_properties.vsdx", 1, "Container", "Shape A", "label_one"),
                           ])
@@ -470,6 +532,81 @@ def test_get_shape_geometry(filename: str, page_index: str, shape_text: str, exp
         assert coords == expected_coords
 
 
+@pytest.mark.parametrize("filename, page_index, shape_text, expected_types, expected_xy", [
+    ("test4_connectors.vsdx", 1, "A to B", ['MoveTo', 'LineTo'],
+     [(1.0, 2.0984251968503944), (1.6358267353988465, 2.0984251968503944)]),
+    ("test2.vsdx", 2, "Already here", ['Ellipse'], [(0.2460629842730571, 0.2519684958956088)]),
+])
+def test_move_shape_geometry(filename: str, page_index: int, shape_text: str, expected_types: list, expected_xy: list):
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_move_shape_geometry.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[page_index]
+        shape = page.find_shape_by_text(shape_text)
+        other = page.find_shape_by_text(shape_text)
+        assert other.geometry.row_types == expected_types  # packed before the move
+        shape.geometry.move(1.0, 2.0)
+        assert shape.geometry.row_types == expected_types
+        assert list(zip(shape.geometry.values('X'), shape.geometry.values('Y'))) == expected_xy
+        # moves are written to xml, and seen by another Shape object of the same shape
+        assert [(r.row_type, r.x, r.y) for r in shape.geometry.rows.values()] == \
+               [(t, x, y) for t, (x, y) in zip(expected_types, expected_xy)]
+        assert list(zip(other.geometry.values('X'), other.geometry.values('Y'))) == expected_xy
+        vis.save_vsdx(out_file)
+
+    with VisioFile(out_file) as vis:
+        geometry = vis.pages[page_index].find_shape_by_text(shape_text).geometry
+        assert [(r.row_type, r.x, r.y) for r in geometry.rows.values()] == \
+               [(t, x, y) for t, (x, y) in zip(expected_types, expected_xy)]
+
+
+@pytest.mark.parametrize("filename, shape_id", [
+    ("test9_rect_and_line.vsdx", "2"),
+    ("test9_rect_and_line.vsdx", "1"),
+])
+def test_move_shape_geometry_then_copy(filename: str, shape_id: str):
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_move_shape_geometry_then_copy_{shape_id}.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]
+        shape = page.find_shape_by_id(shape_id)
+        shape.move(1.0, 0.0)
+        expected_rows = [(r.row_type, r.x, r.y) for r in shape.geometry.rows.values()]
+        copy_id = shape.copy().ID  # a copy made after the move has the moved geometry
+        vis.save_vsdx(out_file)
+
+    with VisioFile(out_file) as vis:
+        page = vis.pages[0]
+        shape = page.find_shape_by_id(shape_id)
+        rows = [(r.row_type, r.x, r.y) for r in shape.geometry.rows.values()]
+        assert rows == expected_rows
+        assert [(r.row_type, r.x, r.y) for r in page.find_shape_by_id(copy_id).geometry.rows.values()] == rows
+        for row in shape.geometry.rows.values():  # cells with a formula have the value calculated after the move
+            x = row.cells['X']
+            if x.formula == 'Width*0':
+                assert row.x == 0.0
+
+
+def test_move_shape_geometry_inherited_rows():
+    with VisioFile(os.path.join(basedir, "test9_rect_and_line.vsdx")) as vis:
+        shape = vis.pages[0].find_shape_by_id("3")  # a connector with MoveTo row IX=1 inherited from its master
+        expected_xy = [(x + 1.0, y + 2.0) for x, y in zip(shape.geometry.values('X'), shape.geometry.values('Y'))]
+        shape.geometry.move(1.0, 2.0)
+        # the inherited row is over-ridden in the shape, in order of index after the section cells
+        rows = [e for e in shape.geometry.xml if e.tag == f"{namespace}Row"]
+        assert [r.attrib['IX'] for r in rows] == ['1', '2', '3']
+        assert all(e.tag != f"{namespace}Row" for e in list(shape.geometry.xml)[:-len(rows)])
+        assert [(r.x, r.y) for r in shape.geometry.rows.values()] == expected_xy
+
+
+def test_shape_geometry_cells_added_when_used():
+    with VisioFile(os.path.join(basedir, "test9_rect_and_line.vsdx")) as vis:
+        shape = vis.pages[0].find_shape_by_id("3")
+        loaded = dict(dict.items(shape.cells))
+        assert not any(key.startswith('Geometry/') for key in loaded)
+        assert shape.cells.get('Geometry/LineTo/X') is not None
+        assert set(shape.cells.keys()) > set(loaded.keys())
+        assert [key for key in shape.cells if key.startswith('Geometry/')]
+
+
 @pytest.mark.parametrize("filename_1, page_index_1, shape_text_1, filename_2, page_index_2, shape_text_2, are_equal", [
     ("test1.vsdx", 0, "Shape Text", "test1.vsdx", 0, "Shape Text", True),
     ("test1.vsdx", 0, "Shape Text", "test2.vsdx", 0, "Shape Text", False),
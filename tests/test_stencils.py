@@ -0,0 +1,58 @@
+"""Tests for importing masters from stencils"""
+import os
+import pytest
+
+from vsdx import cont_types_namespace
+from vsdx import Page
+from vsdx import Stencil
+from vsdx import VisioFile
+
+# code to get basedir of this test file in either linux/windows
+basedir = os.path.dirname(os.path.relpath(__file__))
+
+
+def test_stencil_index():
+    stencil = Stencil.open(os.path.join(basedir, "test4_connectors.vsdx"))
+    assert Stencil.open(os.path.abspath(os.path.join(basedir, "test4_connectors.vsdx"))) is stencil
+    assert stencil.names == ["Dynamic connector", "Switch", "Router"]
+    router = stencil.master("Router")
+    assert stencil.master("{233327F2-0008-0000-8E40-00608CF305B2}") is router
+    assert stencil.master("Modem") is None
+    # styles used by the master follow the styles they are based on
+    assert router.style_ids == ["0", "6", "3"]
+    with VisioFile(os.path.join(basedir, "test1.vsdx")) as vis:
+        with pytest.raises(KeyError):
+            stencil.import_master(vis, "Modem")
+
+
+@pytest.mark.parametrize(("filename", "master_names", "expected_new_masters"),
+                         [("test1.vsdx", ["Router", "Switch", "Router"], ["Router", "Switch"]),
+                          ("test2.vsdx", ["Switch"], ["Switch"]),
+                          ("test4_connectors.vsdx", ["Router", "Dynamic connector"], []),
+                          ])
+def test_stencil_stamp(filename: str, master_names: list, expected_new_masters: list):
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_stencil_stamp.vsdx')
+    stencil = Stencil.open(os.path.join(basedir, "test4_connectors.vsdx"))
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]  # type: Page
+        master_count = len(vis.master_pages)
+        style_names = vis._get_styles_name_list()
+        shapes = [stencil.stamp(page, name, x=1.0 + i, y=2.0) for i, name in enumerate(master_names)]
+        assert [m.name for m in vis.master_pages[master_count:]] == expected_new_masters
+        assert stencil.import_master(vis, "Router") is vis.master_index["Router"]  # remembered for this file
+        vis.save_vsdx(out_file)
+
+    with VisioFile(out_file) as vis:
+        page = vis.pages[0]
+        names = [m.name for m in vis.master_pages]
+        assert len(names) == len(set(names))  # each master once
+        assert vis._get_styles_name_list()[:len(style_names)] == style_names
+        assert len(vis._get_styles_name_list()) == len(set(vis._get_styles_name_list()))
+        part_names = [o.attrib['PartName'] for o in vis.content_types_xml.getroot().iter(f'{cont_types_namespace}Override')]
+        assert len(part_names) == len(set(part_names))
+        for i, (shape, name) in enumerate(zip(shapes, master_names)):
+            stamped = page.find_shape_by_id(shape.ID)
+            assert vis.get_master_page_by_id(stamped.master_page_ID).name == name
+            assert (stamped.x, stamped.y) == (1.0 + i, 2.0)
+            assert stamped.width == stamped.master_shape.width  # inherited from master
+            assert len(stamped.child_shapes) == len(stamped.master_shape.child_shapes)
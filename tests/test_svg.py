@@ -0,0 +1,77 @@
+"""Tests for rendering pages as SVG"""
+import io
+import os
+import pytest
+import re
+import xml.etree.ElementTree as ET
+
+from vsdx import VisioFile
+from vsdx.paths import page_svg_paths, shape_paths
+from vsdx.svg import svg_color
+
+# code to get basedir of this test file in either linux/windows
+basedir = os.path.dirname(os.path.relpath(__file__))
+svg_namespace = '{http://www.w3.org/2000/svg}'
+
+
+@pytest.mark.parametrize("value, expected_color", [
+    ('#ff0000', '#ff0000'), ('2', '#ff0000'), ('1', '#ffffff'), ('Themed', '#123456'), (None, '#123456'),
+    ('99', '#123456'),
+])
+def test_svg_color(value: str, expected_color: str):
+    assert svg_color(value, '#123456') == expected_color
+
+
+@pytest.mark.parametrize("filename", ["test1.vsdx", "test2.vsdx", "test4_connectors.vsdx", "test5_master.vsdx",
+                                      "test10_nested_shapes.vsdx", "test11_rotate.vsdx", "test12_colors.vsdx"])
+def test_page_to_svg(filename: str):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        for page in vis.pages:
+            svg = page.to_svg()
+            file = io.StringIO()
+            assert page.to_svg(file) is None
+            assert file.getvalue() == svg  # same when streamed to a file
+
+            root = ET.fromstring(svg)
+            assert root.tag == f'{svg_namespace}svg'
+            # a path for each shown geometry section, and text for each shape with text
+            paths = root.findall(f'{svg_namespace}path')
+            assert len(paths) == sum(len(s.local_paths) for s in shape_paths(page))
+            texts = ["".join(t.itertext()) for t in root.findall(f'{svg_namespace}text')]
+            assert texts == [s.text.rstrip('\n').replace('\n', '') for s in page.all_shapes if s.text.strip()]
+
+            # paths drawn with a transform start at the same point as the path in page co-ordinates
+            start_points = [(float(x), float(y)) for d in page_svg_paths(page).values()
+                            for x, y in re.findall(r'M(\S+) (\S+)', d)]
+            for path in paths:
+                if 'transform' in path.attrib:
+                    a, b, c, d, e, f = (float(v) for v in path.attrib['transform'][len('matrix('):-1].split(' '))
+                    x, y = (float(v) for v in path.attrib['d'][1:].split(' ')[:2])
+                    px, py = a * x + c * y + e, b * x + d * y + f
+                    assert min(abs(px - sx) + abs(py - sy) for sx, sy in start_points) < 0.001
+
+
+def test_page_to_svg_colors():
+    with VisioFile(os.path.join(basedir, "test12_colors.vsdx")) as vis:
+        root = ET.fromstring(vis.pages[0].to_svg())
+        paths = root.findall(f'{svg_namespace}path')
+        assert [(p.attrib['stroke'], p.attrib['fill']) for p in paths] == \
+               [('#ff0000', '#ffffff'), ('#000000', '#ffffff'), ('#000000', '#ff0000')]
+        assert [t.attrib['fill'] for t in root.findall(f'{svg_namespace}text')] == ['#000000', '#ff0000', '#000000']
+        assert root.attrib['viewBox'] == '0 0 8.2677 11.6929'  # page size in inches
+
+
+@pytest.mark.parametrize("filename", ["test1.vsdx", "test4_connectors.vsdx", "test9_rect_and_line.vsdx"])
+def test_page_to_svg_after_move(filename: str):
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_page_to_svg_after_move.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        page = vis.pages[0]
+        unmoved = page.to_svg()
+        for shape in page.child_shapes:
+            shape.move(1.0, -0.5)
+        svg = page.to_svg()
+        assert svg != unmoved
+        vis.save_vsdx(out_file)
+
+    with VisioFile(out_file) as vis:  # moved shapes are drawn as when saved and opened again
+        assert vis.pages[0].to_svg() == svg
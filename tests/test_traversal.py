@@ -0,0 +1,60 @@
+"""Tests for iterative traversal of nested shapes"""
+import os
+import sys
+import pytest
+
+import xml.etree.ElementTree as ET
+
+from vsdx import namespace
+from vsdx import Page
+from vsdx import VisioFile
+from vsdx.traversal import walk_shape_xml
+
+# code to get basedir of this test file in either linux/windows
+basedir = os.path.dirname(os.path.relpath(__file__))
+
+
+def nested_group_xml(depth: int, first_id: int) -> ET.Element:
+    # create a group shape containing a group shape... to depth, with a Text element in each
+    top = group = ET.Element(f"{namespace}Shape", {'ID': str(first_id), 'Type': 'Group'})
+    ET.SubElement(group, f"{namespace}Text").text = f"level 0"
+    for level in range(1, depth):
+        shapes = ET.SubElement(group, f"{namespace}Shapes")
+        group = ET.SubElement(shapes, f"{namespace}Shape", {'ID': str(first_id + level), 'Type': 'Group'})
+        ET.SubElement(group, f"{namespace}Text").text = f"level {level}"
+    return top
+
+
+@pytest.mark.parametrize(("max_depth", "expected_count"),
+                         [(None, 10), (0, 1), (3, 4)])
+def test_walk_shape_xml_max_depth(max_depth: int, expected_count: int):
+    top = nested_group_xml(10, 1)
+    found = list(walk_shape_xml(top, max_depth=max_depth))
+    assert len(found) == expected_count
+    assert [int(e.attrib['ID']) for e, parent, depth in found] == list(range(1, expected_count + 1))
+    assert all(int(e.attrib['ID']) == depth + 1 for e, parent, depth in found)
+
+
+def test_walk_shape_xml_prune():
+    top = nested_group_xml(10, 1)
+    found = list(walk_shape_xml(top, prune=lambda e: e.attrib['ID'] == '5', include_root=False))
+    assert [e.attrib['ID'] for e, parent, depth in found] == ['2', '3', '4', '5']
+    assert found[1][1] is found[0][0]  # parent of each shape is yielded
+
+
+@pytest.mark.parametrize("depth", [10, sys.getrecursionlimit() + 100])
+def test_deeply_nested_groups(depth: int):
+    with VisioFile(os.path.join(basedir, 'test1.vsdx')) as vis:
+        page = vis.pages[0]  # type: Page
+        shape_count = len(page.all_shapes)
+        max_id = page.set_max_ids()
+        page.xml.find(f"{namespace}Shapes").append(nested_group_xml(depth, max_id + 1))
+
+        assert len(page.all_shapes) == shape_count + depth
+        assert page.set_max_ids() == max_id + depth
+        page.find_replace("level", "depth")
+        assert page.find_shape_by_id(str(max_id + depth)).text == f"depth {depth - 1}"
+
+        copy = vis.copy_shape(page.find_shape_by_id(str(max_id + 1)).xml, page)
+        copied_ids = [int(e.attrib['ID']) for e, parent, d in walk_shape_xml(copy)]
+        assert copied_ids == list(range(max_id + depth + 1, max_id + 2 * depth + 1))
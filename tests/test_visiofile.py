@@ -15,6 +15,7 @@ from vsdx import Page
 from vsdx import PagePosition
 from vsdx import Shape
 from vsdx import VisioFile
+from vsdx.datatable import merge_property_rows
 from vsdx.vsdxfile import file_to_xml
 
 
@@ -81,6 +82,26 @@ def test_open_abs_path_save_abs_path():
     with VisioFile(filename) as vis:
         vis.save_vsdx(output_file)
 
+
+def test_media_cached():
+    # media file is read once and closed, and each Media object returns a copy of the prototype shapes
+    media = Media()
+    assert Media()._media_vsdx is media._media_vsdx
+    assert not media._media_vsdx.file_open
+    assert Media().straight_connector.xml is not media.straight_connector.xml
+    assert ET.tostring(media.rectangle.xml) == \
+           ET.tostring(media._media_vsdx.pages[0].find_shape_by_text(Media.rectangle_text).xml)
+    media.rectangle.text = 'changed'
+    assert Media.rectangle_text in media.rectangle.text  # prototype is unchanged
+    with VisioFile(os.path.join(basedir, 'test1.vsdx')) as vis:
+        box = media.rectangle.copy(vis.pages[0])
+        box.text = 'copy'
+        assert Media.rectangle_text in media.rectangle.text
+    # styles and master files are returned as copies
+    style_id = media.straight_connector.master_shape.line_style_id
+    assert media.style(style_id) is not media.style(style_id)
+    assert 'masters.xml' in media.master_files()
+
 # Helpers
 
 
@@ -500,6 +521,49 @@ def test_copy_shape_other_page(filename: str, shape_name: str):
         assert s.text == shape_text
 
 
+@pytest.mark.parametrize(("formula", "id_map", "expected_formula"),
+                         [("Sheet.1!Width*0.5", {'1': 20}, "Sheet.20!Width*0.5"),
+                          ("GUARD(Sheet.1!PinX+Sheet.15!PinX)", {'1': 20, '15': 21}, "GUARD(Sheet.20!PinX+Sheet.21!PinX)"),
+                          ("Width-Sheet.15!Width", {'1': 20}, "Width-Sheet.15!Width"),
+                          ("_XFTRIGGER(Sheet.2!EventXFMod)", {'2': 3, '3': 4}, "_XFTRIGGER(Sheet.3!EventXFMod)"),
+                          ])
+def test_update_ids(formula: str, id_map: dict, expected_formula: str):
+    with VisioFile(os.path.join(basedir, "test1.vsdx")) as vis:
+        shape_xml = ET.fromstring(f"<Shape xmlns='{namespace[1:-1]}' ID='1'><Cell N='PinX' F='{formula}'/>"
+                                  f"<Shapes><Shape ID='15'><Section N='User'><Row N='Ref'>"
+                                  f"<Cell N='Value' F='{formula}'/></Row></Section></Shape></Shapes></Shape>")
+        vis.update_ids(shape_xml, id_map)
+        # formulae in shape and in sub shapes are updated
+        for cell in shape_xml.iter(f"{namespace}Cell"):
+            assert cell.attrib['F'] == expected_formula
+
+
+@pytest.mark.parametrize(("filename", "conditions", "expected_page_shape_ids"),
+                         [("test4_connectors.vsdx", {"text": "Shape B"}, [(0, "2"), (1, "2")]),
+                          ("test4_connectors.vsdx", {"master": "Dynamic connector", "regex": "to C"}, [(1, "7")]),
+                          ("test4_connectors.vsdx", {"property_label": "Network Name"},
+                           [(2, "1"), (2, "6"), (2, "11"), (2, "12")]),
+                          ("test4_connectors.vsdx", {"property_label": "Network Name", "property_value": "Box02"},
+                           [(2, "12")]),
+                          ("test2.vsdx", {"text": "Shape to copy"}, [(0, "14")]),
+                          ("test2.vsdx", {"text": "no such text"}, []),
+                          ])
+def test_find_shapes_in_all_pages(filename: str, conditions: dict, expected_page_shape_ids: list):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        shapes = vis.find_shapes(**conditions)
+        assert not isinstance(shapes, list)  # results are generated
+        assert [(s.page.index_num, s.ID) for s in shapes] == expected_page_shape_ids
+        shape = vis.find_shape(**conditions)
+        assert (shape.page.index_num, shape.ID) == expected_page_shape_ids[0] if expected_page_shape_ids else shape is None
+
+
+def test_find_shapes_with_query():
+    with VisioFile(os.path.join(basedir, "test4_connectors.vsdx")) as vis:
+        query = vis.query().master("Dynamic connector")
+        assert [(s.page.index_num, s.ID) for s in vis.find_shapes(query, text="to")] == [(1, "6"), (1, "7")]
+        assert len(query.all()) == 4  # query is unchanged by conditions added in find_shapes()
+
+
 def test_load_zip_file_contents():
     with VisioFile(os.path.join(basedir, 'test1.vsdx')) as vis:
         assert vis.zip_file_contents
@@ -514,3 +578,84 @@ def test_load_zip_file_contents():
                 xml = file_to_xml(file_path, vis.zip_file_contents)
                 print(f"xml={type(xml)}")
                 assert isinstance(xml, ET.ElementTree)
+
+
+@pytest.mark.parametrize(("master_rows", "rows", "expected"),
+                         [([("Prop.A", "A", "1")], [("Prop.A", None, "2")], {"Prop.A": ["A", "2"]}),
+                          ([("Prop.A", "A", "1")], [("Prop.A", "B", None)], {"Prop.A": ["B", "1"]}),
+                          ([("Prop.A", "A", "1")], [("Prop.B", None, "2")], {"Prop.A": ["A", "1"], "Prop.B": [None, "2"]}),
+                          ([], [("Prop.A", "A", "")], {"Prop.A": ["A", ""]}),
+                          ])
+def test_merge_property_rows(master_rows: list, rows: list, expected: dict):
+    # data properties of a shape over-ride those of its master, by row name
+    assert merge_property_rows(master_rows, rows) == expected
+
+
+@pytest.mark.parametrize("filename", ["test1.vsdx", "test6_shape_properties.vsdx",
+                                      "test_master_multiple_child_shapes.vsdx"])
+def test_export_data_properties(filename: str):
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        before = [ET.tostring(p.xml.getroot()) for p in vis.pages]
+        table = vis.export_data_properties()
+        # check that export has not altered any page xml
+        assert [ET.tostring(p.xml.getroot()) for p in vis.pages] == before
+        assert len(table) > 0
+        # check that every column has a value for each row
+        for column in table.columns.values():
+            assert len(column) == len(table)
+
+        # check each row matches the properties found through Shape.data_properties
+        for row in table.rows():
+            shape = vis.get_page_by_name(row['page']).find_shape_by_id(row['shape_id'])
+            expected = {label: prop.value for label, prop in shape.data_properties.items()}
+            actual = {label: row[label] for label in table.labels if label in expected}
+            assert actual == expected
+            assert row['master'] == (shape.master_page.name if shape.master_page else None)
+
+
+def test_export_data_properties_to_csv():
+    with VisioFile(os.path.join(basedir, 'test6_shape_properties.vsdx')) as vis:
+        table = vis.export_data_properties()
+        lines = table.to_csv().splitlines()
+        assert lines[0].split(',')[:3] == ['page', 'shape_id', 'master']
+        assert len(lines) == len(table) + 1
+        assert any(line.startswith('master_test,4,data_prop_test,') for line in lines)
+
+
+def test_update_data_properties_from_export():
+    filename = 'test6_shape_properties.vsdx'
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_update_data_properties_from_export.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        table = vis.export_data_properties()
+        # update every exported value, keyed by page and shape ID
+        for label in table.labels:
+            table.columns[label] = [None if v is None else f"{v}_updated" for v in table.columns[label]]
+        assert vis.update_data_properties(table) == []
+        vis.save_vsdx(out_file)
+
+    with VisioFile(out_file) as vis:
+        for row in vis.export_data_properties().rows():
+            shape = vis.get_page_by_name(row['page']).find_shape_by_id(row['shape_id'])
+            for label, prop in shape.data_properties.items():
+                assert prop.value.endswith('_updated')
+
+
+@pytest.mark.parametrize("label", ["page", "shape_id", "master"])
+def test_update_data_properties_labelled_as_key_column(label: str):
+    filename = 'test6_shape_properties.vsdx'
+    out_file = os.path.join(basedir, 'out', f'{filename[:-5]}_test_data_property_labelled_{label}.vsdx')
+    with VisioFile(os.path.join(basedir, filename)) as vis:
+        prop = vis.pages[0].find_shape_by_id('1').data_properties['my_property_label']
+        prop.xml.find(f'{namespace}Cell[@N="Label"]').attrib['V'] = label
+        vis.save_vsdx(out_file)
+
+    with VisioFile(out_file) as vis:
+        table = vis.export_data_properties()
+        # the property has its own column, so the key columns still identify the shape
+        row = [r for r in table.rows() if (r['page'], r['shape_id']) == (vis.pages[0].name, '1')][0]
+        assert row['master'] is None
+        assert row[f'property:{label}'] == prop.value
+        column = table.columns[f'property:{label}']
+        table.columns[f'property:{label}'] = [None if v is None else 'updated' for v in column]
+        assert vis.update_data_properties(table) == []
+        assert vis.pages[0].find_shape_by_id('1').data_properties[label].value == 'updated'
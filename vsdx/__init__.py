@@ -5,6 +5,8 @@ r_namespace = '{http://schemas.openxmlformats.org/officeDocument/2006/relationsh
 document_rels_namespace = "{http://schemas.openxmlformats.org/package/2006/relationships}"
 cont_types_namespace = '{http://schemas.openxmlformats.org/package/2006/content-types}'
 
+style_attributes = ('LineStyle', 'FillStyle', 'TextStyle')  # attributes of Shape, PageSheet and StyleSheet elements
+
 # Ref: https://docs.microsoft.com/en-us/office/client-developer/visio/visio-file-format-reference
 
 import xml.etree.ElementTree as ET
@@ -29,6 +31,9 @@ from .pages import Page
 from .pages import PagePosition
 from .shapes import Shape
 from .formulae import calc_value
+from .datatable import DataPropertyTable
+from .query import ShapeQuery
 from .vsdxfile import VisioFile
 from .media import Media
+from .stencils import Stencil
 from .geometry import Geometry, GeometryRow, GeometryCell
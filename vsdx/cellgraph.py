@@ -0,0 +1,397 @@
+"""Track dependencies between the formula cells of a page, so a changed cell only recalculates the cells that use it
+
+Each formula cell is a node named by (shape ID, ShapeSheet cell name), i.e. ('5', 'Width') or ('5', 'Geometry1.X2'),
+with an edge from each cell referenced in its formula. Connector endpoints glued to a shape (from the page Connects)
+are nodes which depend on the position cells of the shape they are glued to.
+"""
+from __future__ import annotations
+import contextlib
+
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .pages import Page
+    from .shapes import Shape
+
+from xml.etree.ElementTree import Element
+
+import vsdx
+from vsdx import namespace
+from .traversal import walk_shape_xml
+
+Node = Tuple[str, str]  # (shape ID, ShapeSheet cell name)
+
+# cells of a shape which move a connector endpoint glued to the shape, by the glued to cell
+glue_cells = {
+    'PinX': ['PinX', 'PinY'],
+    'Connections': ['PinX', 'PinY', 'LocPinX', 'LocPinY', 'Width', 'Height'],
+}
+# the connector end cells for a Connect FromCell, and the x/y cell names used as graph nodes
+connector_end_cells = {'BeginX': ('BeginX', 'BeginY'), 'EndX': ('EndX', 'EndY')}
+
+
+def cell_ref_name(name: str) -> Optional[str]:
+    """Convert a Shape.cells key, i.e. 'Width' or 'Control/TextPosition/Y', to a ShapeSheet name used by formulae
+
+    Returns None for a name which is ambiguous, such as 'Geometry/LineTo/X'
+    """
+    if name.startswith('Control/'):
+        parts = name.split('/')
+        return f"Controls.{parts[1]}" if parts[2] == 'X' else f"Controls.{parts[1]}.{parts[2]}"
+    if '/' in name:
+        return None
+    return name
+
+
+def _normalise_ref(name: str) -> str:
+    # 'Controls.Row.X' and 'Controls.Row' both refer to the X cell of a control row
+    if name.startswith('Controls.') and name.endswith('.X') and name.count('.') == 2:
+        return name[:-2]
+    return name
+
+
+def shape_formula_cells(shape_xml: Element) -> Iterable[Tuple[str, Element]]:
+    """Yield (ShapeSheet name, Cell element) for each cell with a formula in a Shape element, excluding sub shapes"""
+    for cell in shape_xml.iterfind(f'{namespace}Cell[@F]'):
+        yield cell.attrib.get('N'), cell
+    for section in shape_xml.iterfind(f'{namespace}Section'):
+        section_name = section.attrib.get('N')
+        if section_name == 'Geometry':
+            prefix = f"Geometry{int(section.attrib.get('IX', 0)) + 1}"
+            for row in section.iterfind(f'{namespace}Row'):
+                for cell in row.iterfind(f'{namespace}Cell[@F]'):
+                    yield f"{prefix}.{cell.attrib.get('N')}{row.attrib.get('IX')}", cell
+        elif section_name in ('Control', 'User'):
+            for row in section.iterfind(f'{namespace}Row'):
+                for cell in row.iterfind(f'{namespace}Cell[@F]'):
+                    n = cell.attrib.get('N')
+                    if section_name == 'User':
+                        if n == 'Value':
+                            yield f"User.{row.attrib.get('N')}", cell
+                    else:
+                        yield _normalise_ref(f"Controls.{row.attrib.get('N')}.{n}"), cell
+
+
+class CellGraph:
+    """Dependency graph of the formula cells in a page, built from the page xml when first used
+
+    Use :meth:`recalculate` after changing cells to update only the cells that depend on them, in dependency order.
+    :meth:`Shape.set_cell_value` and :meth:`Shape.set_cell_formula` do this automatically, and changes made inside a
+    :meth:`batch` block are recalculated together when the block ends.
+
+    :param page: the page the graph belongs to
+    :type page: :class:`Page`
+    """
+    def __init__(self, page: Page):
+        self.page = page
+        self._built = False
+        self._batch_depth = 0
+        self._batch_recalculate_changed = list()  # type: List[bool]  # recalculate_changed flag of each open batch
+        self._pending = dict()  # type: Dict[Node, bool]  # changed nodes waiting for end of batch: recalculate node
+        self._rerouting = set()  # IDs of connectors being rerouted after a glued shape moved
+        self._reset()
+
+    def __repr__(self):
+        return f"<CellGraph page={self.page.name} cells={len(self._cells)} >" if self._built else "<CellGraph >"
+
+    def _reset(self):
+        self._cells = dict()  # type: Dict[Node, Element]
+        self._formulas = dict()  # type: Dict[Node, str]  # formula text of each supported formula
+        self._glue = dict()  # type: Dict[Node, Tuple[str, str]]  # connector end node: (to shape ID, to cell)
+        self._dependents = dict()  # type: Dict[Node, Dict[Node, None]]  # ordered set of nodes using a node
+        self._depends_on = dict()  # type: Dict[Node, List[Node]]
+        self._shape_xml = dict()  # type: Dict[str, Tuple[Element, Optional[str]]]  # shape ID: (xml, parent ID)
+        self._master_formulas = dict()  # type: Dict[Tuple[str, Optional[str]], Dict[str, str]]
+
+    def invalidate(self):
+        """Discard the graph, i.e. when shapes or connects are added or removed. It is rebuilt when next used"""
+        self._built = False
+
+    def _build(self):
+        if self._built:
+            return
+        self._reset()
+        shapes_xml = self.page.xml.find(f'{namespace}Shapes')
+        master_ids = dict()  # master page ID by shape element, inherited by sub shapes of a group
+        shapes = walk_shape_xml(shapes_xml, include_root=False) if shapes_xml is not None else []
+        for shape_xml, parent, depth in shapes:
+            shape_id = shape_xml.attrib.get('ID')
+            master_id = master_ids[shape_xml] = shape_xml.attrib.get('Master', master_ids.get(parent))
+            self._shape_xml[shape_id] = (shape_xml, parent.attrib.get('ID') if depth > 1 else None)
+            for name, cell in shape_formula_cells(shape_xml):
+                formula = cell.attrib.get('F')
+                if formula == 'Inh':
+                    formula = self._master_formula(master_id, shape_xml.attrib.get('MasterShape'), name)
+                self._add_node((shape_id, name), cell, formula)
+
+        for connect in self.page.xml.iterfind(f'.//{namespace}Connect'):
+            end_cells = connector_end_cells.get(connect.attrib.get('FromCell'))
+            to_id, to_cell = connect.attrib.get('ToSheet'), connect.attrib.get('ToCell') or ''
+            depends = glue_cells.get(to_cell.split('.')[0])
+            if end_cells is None or depends is None:
+                continue  # only endpoints glued to a shape pin or connection point are tracked
+            for end_cell in end_cells:
+                node = (connect.attrib.get('FromSheet'), end_cell)
+                self._glue[node] = (to_id, to_cell)
+                self._set_depends_on(node, [(to_id, name) for name in depends])
+        self._built = True
+
+    def _master_formula(self, master_id: Optional[str], master_shape_id: Optional[str], name: str) -> Optional[str]:
+        # formula of an inherited top level cell, from the master shape
+        if master_id is None or '.' in name:
+            return None
+        key = (master_id, master_shape_id)
+        if key not in self._master_formulas:
+            formulas = dict()
+            master_xml = vsdx.shapes.master_shape_xml(self.page.vis, master_id, master_shape_id)
+            if master_xml is not None:
+                formulas = {c.attrib.get('N'): c.attrib.get('F') for c in master_xml.iterfind(f'{namespace}Cell[@F]')}
+            self._master_formulas[key] = formulas
+        return self._master_formulas[key].get(name)
+
+    def _add_node(self, node: Node, cell: Element, formula_text: Optional[str]):
+        refs = vsdx.formulae.formula_refs(formula_text) if formula_text else None
+        self._cells[node] = cell
+        if refs is None:
+            self._formulas.pop(node, None)
+            self._set_depends_on(node, [])
+            return
+        self._formulas[node] = formula_text
+        self._set_depends_on(node, [(node[0] if sheet is None else sheet, _normalise_ref(name))
+                                    for sheet, name in refs if sheet != 'ThePage'])
+
+    def _set_depends_on(self, node: Node, depends_on: List[Node]):
+        for d in self._depends_on.get(node, []):
+            self._dependents.get(d, {}).pop(node, None)
+        self._depends_on[node] = depends_on
+        for d in depends_on:
+            self._dependents.setdefault(d, dict())[node] = None
+
+    def dependents(self, shape_id: str, name: str) -> List[Node]:
+        """List the (shape ID, cell name) of cells which directly use the named cell of a shape"""
+        self._build()
+        return list(self._dependents.get((shape_id, _normalise_ref(name)), {}).keys())
+
+    def cell_changed(self, shape: Shape, name: str):
+        """Recalculate cells depending on a cell of shape whose value has been set, or defer until the batch ends
+
+        :param shape: the shape with the changed cell
+        :param name: the name of the cell as used in Shape.cells, i.e. 'PinX' or 'Control/TextPosition/X'
+        """
+        ref_name = cell_ref_name(name)
+        if ref_name is None:
+            return
+        node = (shape.ID, ref_name)
+        if self._batch_depth:
+            self._pending[node] = self._pending.get(node, False) or self._batch_recalculate_changed[-1]
+        else:
+            self.recalculate([node])
+
+    def cell_added(self, shape: Shape, name: str):
+        """Add a cell newly created in shape to the graph, then recalculate cells depending on its value
+
+        Only the node of the new cell is added, so the graph is not rebuilt for each new cell, i.e. when setting a value
+        inherited from a master shape for the first time.
+
+        :param shape: the shape with the new cell
+        :param name: the name of the cell as used in Shape.cells, i.e. 'LineWeight'
+        """
+        ref_name = cell_ref_name(name)
+        cell = shape.cells.get(name)
+        if self._built and ref_name is not None and cell is not None:  # an unbuilt graph will include the cell
+            formula_text = cell.formula
+            if formula_text == 'Inh':
+                formula_text = self._master_formula(shape.master_page_ID, shape.master_shape_ID, ref_name)
+            self._add_node((shape.ID, ref_name), cell.xml, formula_text)
+        self.cell_changed(shape, name)
+
+    def formula_changed(self, shape: Shape, name: str):
+        """Update the graph for a cell of shape whose formula has been set, then recalculate it and its dependents"""
+        ref_name = cell_ref_name(name)
+        cell = shape.cells.get(name)
+        if ref_name is None or cell is None:
+            return
+        self._build()
+        node = (shape.ID, ref_name)
+        formula_text = cell.formula
+        if formula_text == 'Inh':
+            formula_text = self._master_formula(shape.master_page_ID, shape.master_shape_ID, ref_name)
+        self._add_node(node, cell.xml, formula_text)
+        if self._batch_depth:
+            self._pending[node] = True
+        else:
+            self.recalculate([node], include_changed=True)
+
+    @contextlib.contextmanager
+    def batch(self, recalculate_changed: bool = False):
+        """Defer recalculation of changed cells until the end of the block, then recalculate them together
+
+        i.e. ``with page.cell_graph.batch(): shape.x, shape.y = 1, 2``
+
+        :param recalculate_changed: also recalculate cells set in the block from their own formulae
+        """
+        self._batch_depth += 1
+        self._batch_recalculate_changed.append(recalculate_changed)
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            self._batch_recalculate_changed.pop()
+        if not self._batch_depth and self._pending:
+            pending, self._pending = self._pending, dict()
+            self._recalculate(list(pending.keys()), [n for n, recalculate in pending.items() if recalculate])
+
+    def recalculate(self, changed: Iterable[Node], include_changed: bool = False):
+        """Recalculate every cell which depends, directly or indirectly, on the changed cells
+
+        Cells are evaluated in dependency order so each formula sees updated values. Connectors with a glued endpoint
+        that moved are rerouted with :meth:`Shape.set_start_and_finish`.
+
+        :param changed: list of (shape ID, cell name) of changed cells
+        :param include_changed: also recalculate the changed cells themselves from their formulae
+        """
+        changed = list(changed)
+        self._recalculate(changed, changed if include_changed else [])
+
+    def _recalculate(self, changed: List[Node], recalculate_changed: List[Node]):
+        self._build()
+        affected = dict()  # type: Dict[Node, None]
+        affected.update((n, None) for n in recalculate_changed if n in self._formulas)
+        keep = set(changed).difference(recalculate_changed)  # values set explicitly are kept, not recalculated
+        stack = list(changed)
+        visited = set(changed)
+        while stack:
+            for node in self._dependents.get(stack.pop(), {}):
+                if node not in visited:
+                    visited.add(node)
+                    stack.append(node)
+                    if node not in keep:
+                        affected[node] = None
+        if not affected:
+            return
+
+        shapes = dict()  # type: Dict[str, Shape]  # shapes for evaluation, created once per recalculation
+        moved_ends = dict()  # type: Dict[str, Dict[str, float]]  # connector ID: {end cell: value}
+        for node in self._topological_order(affected):
+            shape_id, name = node
+            if node in self._glue:
+                to_shape = self._shape(self._glue[node][0], shapes)
+                point = _glue_point(to_shape, self._glue[node][1]) if to_shape else None
+                if point:
+                    moved_ends.setdefault(shape_id, dict())[name] = point[0 if name.endswith('X') else 1]
+                continue
+            shape = self._shape(shape_id, shapes)
+            value = vsdx.calc_value(shape, self._formulas[node]) if shape else None
+            if value is not None:
+                self._cells[node].attrib['V'] = str(value)
+
+        self._reroute(moved_ends, shapes)
+
+    def reroute(self, shape_ids: Iterable[str] = None) -> List[Shape]:
+        """Reroute connectors glued to shapes, so each glued end is at the pin or connection point it is glued to
+
+        Connectors are found from the glue read from the page Connects when the graph is built, rather than by
+        searching the connects of each shape. Connectors with both ends already in place are not changed.
+
+        :param shape_ids: IDs of shapes which have moved, or None to reroute every glued connector in the page
+        :return: the rerouted connectors
+        """
+        self._build()
+        shape_ids = set(shape_ids) if shape_ids is not None else None
+        shapes = dict()  # type: Dict[str, Shape]
+        moved_ends = dict()  # type: Dict[str, Dict[str, float]]  # connector ID: {end cell: value}
+        for (connector_id, name), (to_id, to_cell) in self._glue.items():
+            if shape_ids is not None and to_id not in shape_ids:
+                continue
+            to_shape = self._shape(to_id, shapes)
+            point = _glue_point(to_shape, to_cell) if to_shape else None
+            if point:
+                moved_ends.setdefault(connector_id, dict())[name] = point[0 if name.endswith('X') else 1]
+        return self._reroute(moved_ends, shapes)
+
+    def _reroute(self, moved_ends: Dict[str, Dict[str, float]], shapes: Dict[str, Shape]) -> List[Shape]:
+        # set the start and finish of connectors with moved ends, returning those changed
+        rerouted = list()
+        for connector_id, ends in moved_ends.items():
+            connector = self._shape(connector_id, shapes)
+            if connector is None or connector.begin_x is None or connector_id in self._rerouting:
+                continue
+            start = (ends.get('BeginX', connector.begin_x), ends.get('BeginY', connector.begin_y))
+            finish = (ends.get('EndX', connector.end_x), ends.get('EndY', connector.end_y))
+            if (start, finish) == ((connector.begin_x, connector.begin_y), (connector.end_x, connector.end_y)):
+                continue  # already in place
+            self._rerouting.add(connector_id)  # connectors glued to each other must not reroute endlessly
+            try:
+                connector.set_start_and_finish(start, finish)
+            finally:
+                self._rerouting.remove(connector_id)
+            rerouted.append(connector)
+        return rerouted
+
+    def _topological_order(self, nodes: Dict[Node, None]) -> List[Node]:
+        # Kahn's algorithm over the affected nodes only, cells in a circular reference are not recalculated
+        in_degree = dict.fromkeys(nodes, 0)
+        for node in nodes:
+            for dependent in self._dependents.get(node, {}):
+                if dependent in in_degree:
+                    in_degree[dependent] += 1
+        ready = [n for n, d in in_degree.items() if d == 0]
+        order = list()
+        while ready:
+            node = ready.pop()
+            order.append(node)
+            for dependent in self._dependents.get(node, {}):
+                if dependent in in_degree:
+                    in_degree[dependent] -= 1
+                    if in_degree[dependent] == 0:
+                        ready.append(dependent)
+        if len(order) < len(nodes) and self.page.vis.debug:
+            print(f"CellGraph.recalculate() skipped circular references: {[n for n in nodes if n not in order]}")
+        return order
+
+    def find_shape(self, shape_id: str) -> Optional[Shape]:
+        """Return the shape in the page with an ID, from the map of shape IDs made when the graph is built
+
+        The page is searched instead for a shape not in the map, or with another ID in the map, as the graph is not
+        updated while shapes are added or their IDs changed in a :meth:`batch`
+
+        :param shape_id: the ID of the shape, i.e. '5' for Sheet.5
+        :return: the :class:`Shape`, or None if not found
+        """
+        self._build()
+        shape_xml, parent_id = self._shape_xml.get(shape_id, (None, None))
+        if shape_xml is None or shape_xml.attrib.get('ID') != shape_id:
+            return self.page.find_shape_by_id(shape_id)
+        return self._shape(shape_id, dict())
+
+    def _shape(self, shape_id: str, shapes: Dict[str, Shape]) -> Optional[Shape]:
+        # create a Shape for an ID, with its parents so that sub shapes inherit master page ID
+        if shape_id not in shapes:
+            shape_xml, parent_id = self._shape_xml.get(shape_id, (None, None))
+            if shape_xml is None:
+                return None
+            parent = self._shape(parent_id, shapes) if parent_id else self.page
+            shapes[shape_id] = vsdx.Shape(xml=shape_xml, parent=parent, page=self.page)
+        return shapes[shape_id]
+
+
+def _glue_point(shape: Shape, to_cell: str) -> Optional[Tuple[float, float]]:
+    # page position of the pin or connection point of a shape that a connector end is glued to
+    if shape.x is None or shape.y is None:
+        return None
+    if to_cell == 'PinX':
+        return shape.x, shape.y
+    row = shape.xml.find(f'{namespace}Section[@N="Connection"]/{namespace}Row[@IX="{int(to_cell[13:]) - 1}"]') \
+        if to_cell[13:].isdigit() else None  # i.e. 'Connections.X1' is Connection row IX=0
+    if row is None:
+        return None
+    x = row.find(f'{namespace}Cell[@N="X"]')
+    y = row.find(f'{namespace}Cell[@N="Y"]')
+    if x is None or y is None:
+        return None
+    return (shape.x - (shape.loc_x or 0.0) + float(x.attrib.get('V', 0)),
+            shape.y - (shape.loc_y or 0.0) + float(y.attrib.get('V', 0)))
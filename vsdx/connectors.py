@@ -3,6 +3,9 @@ import shutil
 import os
 import copy
 
+from typing import Iterable
+from typing import List
+from typing import Tuple
 
 import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import Element
@@ -32,97 +35,126 @@ class Connect:
         :rtype: Shape
         """
         if from_shape and to_shape:  # create new connector shape and connect items between this and the two shapes
-            # create new connect shape and get id
-            media = vsdx.Media()
-            connector_shape = media.straight_connector.copy(page)  # default to straight connector
-            connector_shape.text = ''  # clear text used to find shape
-            if not os.path.exists(page.vis._masters_folder):
-                # Add masters folder to directory if not already present
-                for file_name, file in media._media_vsdx.zip_file_contents.items():
-                    if file_name.startswith(media._media_vsdx._masters_folder):
-                        new_file_name = file_name.replace(media._media_vsdx._masters_folder, page.vis._masters_folder)
-                        page.vis.zip_file_contents[new_file_name] = file
-                page.vis.load_master_pages()  # load copied master page files into VisioFile object
-                # add new master to document relationship
-                page.vis._add_document_rel(rel_type="http://schemas.microsoft.com/visio/2010/relationships/masters",
-                                           target="masters/masters.xml")
-                # create masters/master1 elements in [Content_Types].xml
-                page.vis._add_content_types_override(content_type="application/vnd.ms-visio.masters+xml",
-                                                     part_name_path="/visio/masters/masters.xml")
-                page.vis._add_content_types_override(content_type="application/vnd.ms-visio.master+xml",
-                                                     part_name_path="/visio/masters/master1.xml")
-                # create an initial copy of page_rels from media and attach to this page
-                page_rels_xml = copy.deepcopy(media.rels_xml)
-                page.rels_xml = page_rels_xml
-            elif connector_shape.shape_name not in page.vis._titles_of_parts_list():
-                print(f"Warning: Updating existing Page/Master relationships not yet fully implemented. "
-                      f"This may cause unexpected outputs.")
-                # vsdx has masters - but not this shape
-                # todo: Complete this scenario
-                #print("conn master page", connector_shape.master_shape.page.filename)
-                #print("max page file num", [p.filename[-5:-4] for p in page.vis.master_pages])
-                #print("max page id", [p.page_id for p in page.vis.master_pages])
-                rel_num = max([int(p.filename[-5:-4]) for p in page.vis.master_pages]) +1
-                master_file_path = os.path.join(page.vis.directory, 'visio', 'masters', f'master{rel_num}.xml')
-                #print(f"m_num={rel_num} master_file_path={master_file_path}")
-                shutil.copy(connector_shape.master_shape.page.filename, master_file_path)
-                # todo: ensure master page ID and RId is unique, update shape master_id to refer to new master
-                # todo: update mast file name, and add content type override
-                # todo: update masters.xml file contents?
-                # todo: update visio/pages/_rels/page3.xml.rels - add: <Relationship Id="rId3" Type="http://schemas.microsoft.com/visio/2010/relationships/master" Target="../masters/master1.xml"/>
-                rels = page.rels_xml.getroot()
-                new_rel = ET.fromstring(f'<Relationship  xmlns="{vsdx.document_rels_namespace[1:-1]}" '
-                                        f'Type="http://schemas.microsoft.com/visio/2010/relationships/master" />')
-                new_rel.attrib['Id'] = f"rID{rel_num}"
-                new_rel.attrib['Target'] = f"../masters/master{rel_num}.xml"
-                rels.append(new_rel)
-                page.vis._add_content_types_override(content_type="application/vnd.ms-visio.master+xml",
-                                                     part_name_path=f"/visio/masters/master{rel_num}.xml")
-            else:
-                # vsdx has this master shape, but not related to this page
-                master_page = page.vis.master_index.get(connector_shape.shape_name)  # type: vsdx.Page
-                rel_num = int(master_page.rel_id[-1])
-                rels = page.rels_xml.getroot()
-                new_rel = ET.fromstring(f'<Relationship  xmlns="{vsdx.document_rels_namespace[1:-1]}" '
-                                        f'Type="http://schemas.microsoft.com/visio/2010/relationships/master" />')
-                new_rel.attrib['Id'] = master_page.rel_id
-                new_rel.attrib['Target'] = "../masters/master1.xml"
-                rels.append(new_rel)
-
-            # update HeadingPairs and TitlesOfParts in app.xml
-            if page.vis._get_app_xml_value('Masters') is None:
-                page.vis._set_app_xml_value('Masters', '1')
-
-            if connector_shape.shape_name not in page.vis._titles_of_parts_list():  # todo: replace static string with name from shape
-                page.vis._add_titles_of_parts_item(connector_shape.shape_name)
-
-            # copy style used by new connector shape
-            if not isinstance(page.vis._get_style_by_id(connector_shape.master_shape.line_style_id), Element):
-                # assume same if is ok, todo: use names for match and increment IDs
-                media_style = media._media_vsdx._get_style_by_id(connector_shape.master_shape.line_style_id)
-                page.vis._style_sheets().append(media_style)
-            media._media_vsdx.close_vsdx()
+            return Connect.create_many(page, [(from_shape, to_shape)])[0]
 
+    @staticmethod
+    def create_many(page: vsdx.Page, pairs: Iterable[Tuple[Shape, Shape]]) -> List[Shape]:
+        """Create a new connector shape, and Connect objects, between each (from_shape, to_shape) pair
+
+        The connector master is read from media, and added to the document with its relationships, content types
+        and style, once for all pairs. Connector shapes and Connect elements are then added to the page together.
+
+        :param page: the page to add connectors to
+        :param pairs: (from_shape, to_shape) for each new connector
+        :returns: the new connector shapes, in order of pairs
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return []
+        # create first connector shape, and add its master to the document
+        media = vsdx.Media()
+        connector_shape = media.straight_connector.copy(page)  # default to straight connector
+        connector_shape.text = ''  # clear text used to find shape
+        Connect._add_connector_master(page, media, connector_shape)
+
+        # copy further connector shapes from the first, before it is glued - page.max_id was set by the first copy
+        connector_shapes = [connector_shape]
+        shapes_tag = page.xml.find(f"{vsdx.namespace}Shapes")  # where copy_shape() added the first
+        for i in range(1, len(pairs)):
+            new_shape = copy.deepcopy(connector_shape.xml)
+            page.vis.increment_shape_ids(new_shape, page)
+            shapes_tag.append(new_shape)
+            connector_shapes.append(Shape(xml=new_shape, parent=connector_shape.parent, page=page))
+
+        connects = list()
+        for connector_shape, (from_shape, to_shape) in zip(connector_shapes, pairs):
             # set Begin and End Trigger formulae for the new shape - linking to shapes in destination page
             beg_trigger = connector_shape.cells.get('BegTrigger')
-            beg_trigger.formula = beg_trigger.formula.replace('Sheet.1!', f'Sheet{from_shape.ID}!')
+            beg_trigger.formula = beg_trigger.formula.replace('Sheet.1!', f'Sheet.{from_shape.ID}!')
             end_trigger = connector_shape.cells.get('EndTrigger')
-            end_trigger.formula = end_trigger.formula.replace('Sheet.2!', f'Sheet{to_shape.ID}!')
+            end_trigger.formula = end_trigger.formula.replace('Sheet.2!', f'Sheet.{to_shape.ID}!')
 
             # create connect relationships
             # todo: FromPart="12" and ToPart="3" represent the part of a shape to connection is from/to
             end_connect_xml = f'<Connect xmlns="http://schemas.microsoft.com/office/visio/2012/main" FromSheet="{connector_shape.ID}" FromCell="EndX" FromPart="12" ToSheet="{to_shape.ID}" ToCell="PinX" ToPart="3"/>'
             beg_connect_xml = f'<Connect xmlns="http://schemas.microsoft.com/office/visio/2012/main" FromSheet="{connector_shape.ID}" FromCell="BeginX" FromPart="9" ToSheet="{from_shape.ID}" ToCell="PinX" ToPart="3"/>'
+            connects.append(Connect(xml=ET.fromstring(end_connect_xml), page=page))
+            connects.append(Connect(xml=ET.fromstring(beg_connect_xml), page=page))
 
-            # Add these new connection relationships to the page
-            page.add_connect(Connect(xml=ET.fromstring(end_connect_xml), page=page))
-            page.add_connect(Connect(xml=ET.fromstring(beg_connect_xml), page=page))
-            #print(vsdx.pretty_print_element(connector_shape.xml))
-            #print(connector_shape.geometry)
+        # Add these new connection relationships to the page
+        page.add_connects(connects)
+        with page.cell_graph.batch():  # recalculate cells changed by every connector together
+            for connector_shape, (from_shape, to_shape) in zip(connector_shapes, pairs):
+                connector_shape.set_start_and_finish(from_shape.center_x_y, to_shape.center_x_y)
+        return connector_shapes
 
-            connector_shape.set_start_and_finish(from_shape.center_x_y, to_shape.center_x_y)
-            print([(m.rel_id, m.page_id) for m in page.vis.master_pages])
-            return connector_shape
+    @staticmethod
+    def _add_connector_master(page: vsdx.Page, media: vsdx.Media, connector_shape: Shape):
+        # add master of a connector shape copied from media to the document, with relationships, content types,
+        # app.xml entries and style, if not already present
+        if not os.path.exists(page.vis._masters_folder):
+            # Add masters folder to directory if not already present
+            for file_name, file in media.master_files().items():
+                page.vis.zip_file_contents[f'{page.vis._masters_folder}/{file_name}'] = file
+            page.vis.load_master_pages()  # load copied master page files into VisioFile object
+            # add new master to document relationship
+            page.vis._add_document_rel(rel_type="http://schemas.microsoft.com/visio/2010/relationships/masters",
+                                       target="masters/masters.xml")
+            # create masters/master1 elements in [Content_Types].xml
+            page.vis._add_content_types_override(content_type="application/vnd.ms-visio.masters+xml",
+                                                 part_name_path="/visio/masters/masters.xml")
+            page.vis._add_content_types_override(content_type="application/vnd.ms-visio.master+xml",
+                                                 part_name_path="/visio/masters/master1.xml")
+            # create an initial copy of page_rels from media and attach to this page
+            page_rels_xml = copy.deepcopy(media.rels_xml)
+            page.rels_xml = page_rels_xml
+        elif connector_shape.shape_name not in page.vis._titles_of_parts_list():
+            print(f"Warning: Updating existing Page/Master relationships not yet fully implemented. "
+                  f"This may cause unexpected outputs.")
+            # vsdx has masters - but not this shape
+            # todo: Complete this scenario
+            #print("conn master page", connector_shape.master_shape.page.filename)
+            #print("max page file num", [p.filename[-5:-4] for p in page.vis.master_pages])
+            #print("max page id", [p.page_id for p in page.vis.master_pages])
+            rel_num = max([int(p.filename[-5:-4]) for p in page.vis.master_pages]) +1
+            master_file_path = os.path.join(page.vis.directory, 'visio', 'masters', f'master{rel_num}.xml')
+            #print(f"m_num={rel_num} master_file_path={master_file_path}")
+            shutil.copy(connector_shape.master_shape.page.filename, master_file_path)
+            # todo: ensure master page ID and RId is unique, update shape master_id to refer to new master
+            # todo: update mast file name, and add content type override
+            # todo: update masters.xml file contents?
+            # todo: update visio/pages/_rels/page3.xml.rels - add: <Relationship Id="rId3" Type="http://schemas.microsoft.com/visio/2010/relationships/master" Target="../masters/master1.xml"/>
+            rels = page.rels_xml.getroot()
+            new_rel = ET.fromstring(f'<Relationship  xmlns="{vsdx.document_rels_namespace[1:-1]}" '
+                                    f'Type="http://schemas.microsoft.com/visio/2010/relationships/master" />')
+            new_rel.attrib['Id'] = f"rID{rel_num}"
+            new_rel.attrib['Target'] = f"../masters/master{rel_num}.xml"
+            rels.append(new_rel)
+            page.vis._add_content_types_override(content_type="application/vnd.ms-visio.master+xml",
+                                                 part_name_path=f"/visio/masters/master{rel_num}.xml")
+        else:
+            # vsdx has this master shape, but not related to this page
+            master_page = page.vis.master_index.get(connector_shape.shape_name)  # type: vsdx.Page
+            rel_num = int(master_page.rel_id[-1])
+            rels = page.rels_xml.getroot()
+            new_rel = ET.fromstring(f'<Relationship  xmlns="{vsdx.document_rels_namespace[1:-1]}" '
+                                    f'Type="http://schemas.microsoft.com/visio/2010/relationships/master" />')
+            new_rel.attrib['Id'] = master_page.rel_id
+            new_rel.attrib['Target'] = "../masters/master1.xml"
+            rels.append(new_rel)
+
+        # update HeadingPairs and TitlesOfParts in app.xml
+        if page.vis._get_app_xml_value('Masters') is None:
+            page.vis._set_app_xml_value('Masters', '1')
+
+        # todo: replace static string with name from shape
+        if connector_shape.shape_name not in page.vis._titles_of_parts_list():
+            page.vis._add_titles_of_parts_item(connector_shape.shape_name)
+
+        # copy style used by new connector shape
+        if not isinstance(page.vis._get_style_by_id(connector_shape.master_shape.line_style_id), Element):
+            # assume same if is ok, todo: use names for match and increment IDs
+            page.vis._style_sheets().append(media.style(connector_shape.master_shape.line_style_id))
 
     @property
     def shape_id(self):
@@ -0,0 +1,238 @@
+from __future__ import annotations
+import csv
+import io
+
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .pages import Page
+    from .shapes import Shape
+
+from xml.etree.ElementTree import Element
+
+import vsdx
+from vsdx import namespace
+from .traversal import walk_shape_xml
+
+# fixed columns at the start of every DataPropertyTable, followed by one column per property label
+key_columns = ['page', 'shape_id', 'master']
+# prefix of the column of a property labelled as a key column, i.e. 'property:page', so it cannot overwrite the key
+key_label_prefix = 'property:'
+
+
+def property_column(label: str) -> str:
+    """Column name of a property label in a :class:`DataPropertyTable` - the label, unless it is a key column name"""
+    return key_label_prefix + label if label in key_columns else label
+
+
+def column_label(column: str) -> str:
+    """Property label of a :class:`DataPropertyTable` column, as :func:`property_column` in reverse"""
+    if column.startswith(key_label_prefix) and column[len(key_label_prefix):] in key_columns:
+        return column[len(key_label_prefix):]
+    return column
+
+
+def property_row_values(row: Element) -> Tuple[str, Optional[str], Optional[str]]:
+    """Get (name, label, value) from a Row element in a Property Section, without altering the xml"""
+    label = None
+    value = None
+    for cell in row.iterfind(f'{namespace}Cell'):
+        n = cell.attrib.get('N')
+        if n == 'Label':
+            label = cell.attrib.get('V')
+        elif n == 'Value':
+            value = cell.attrib.get('V')
+            if value is None and cell.text:
+                value = cell.text  # value may be held as element inner text
+    return row.attrib.get('N'), label, value
+
+
+def shape_property_rows(shape_xml: Element) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+    """Yield (name, label, value) for each data property Row in a Shape element"""
+    properties_xml = shape_xml.find(f'{namespace}Section[@N="Property"]')
+    if properties_xml is not None:
+        for row in properties_xml.iterfind(f'{namespace}Row'):
+            yield property_row_values(row)
+
+
+
+def merge_property_rows(master_rows: Iterable[Tuple[str, Optional[str], Optional[str]]],
+                        rows: Iterable[Tuple[str, Optional[str], Optional[str]]]) -> Dict[str, List[Optional[str]]]:
+    """Return [label, value] by property name, for the (name, label, value) rows of a shape over those of its master
+
+    A row over-riding a master property may have no label, or no value, in which case the master label or value is used
+    """
+    properties = {name: [label, value] for name, label, value in master_rows}
+    for name, label, value in rows:
+        inherited = properties.get(name)
+        if inherited:
+            properties[name] = [label or inherited[0], value if value is not None else inherited[1]]
+        else:
+            properties[name] = [label, value]
+    return properties
+
+class DataPropertyTable:
+    """Column based table of Shape data properties, one row per Shape
+
+    Columns are 'page', 'shape_id' and 'master', followed by one column for each property label found. A property
+    labelled 'page', 'shape_id' or 'master' has a column named with a 'property:' prefix, i.e. 'property:page'
+
+    :param columns: dict of column values by column name, each column being a list of the same length
+    :type columns: Dict[str, list]
+    """
+    def __init__(self, columns: Dict[str, list] = None):
+        self.columns = columns if columns is not None else {c: [] for c in key_columns}
+
+    def __repr__(self):
+        return f"<DataPropertyTable rows={len(self)} columns={list(self.columns.keys())} >"
+
+    def __len__(self):
+        return len(self.columns[key_columns[0]]) if self.columns else 0
+
+    @property
+    def labels(self) -> List[str]:
+        """List of the property label column names"""
+        return [c for c in self.columns.keys() if c not in key_columns]
+
+    def append(self, row: dict):
+        """Append a row dict to the table, adding a new column (back filled with None) for any new label"""
+        length = len(self)
+        for name in row.keys():
+            if name not in self.columns:
+                self.columns[name] = [None] * length
+        for name, column in self.columns.items():
+            column.append(row.get(name))
+
+    def rows(self) -> Iterator[dict]:
+        """Yield each row of the table as a dict of values by column name"""
+        names = list(self.columns.keys())
+        for values in zip(*self.columns.values()):
+            yield dict(zip(names, values))
+
+    def to_csv(self, file=None) -> Optional[str]:
+        """Write table as csv to a file path or file like object, or return csv as a string if no file given"""
+        if file is None:
+            out = io.StringIO()
+            self._write_csv(out)
+            return out.getvalue()
+        if isinstance(file, str):
+            with open(file, 'w', newline='', encoding='utf-8') as f:
+                self._write_csv(f)
+        else:
+            self._write_csv(file)
+
+    def _write_csv(self, f):
+        writer = csv.writer(f)
+        writer.writerow(self.columns.keys())
+        writer.writerows(zip(*self.columns.values()))
+
+    def to_pandas(self):
+        """Return table as a pandas.DataFrame - requires pandas to be installed"""
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError("pandas is required for DataPropertyTable.to_pandas()")
+        return pandas.DataFrame(self.columns)
+
+    def to_arrow(self):
+        """Return table as a pyarrow.Table - requires pyarrow to be installed"""
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("pyarrow is required for DataPropertyTable.to_arrow()")
+        return pyarrow.table(self.columns)
+
+
+def page_data_property_rows(page: Page, master_cache: dict) -> Iterator[dict]:
+    """Yield a row dict for each shape in page which has data properties, working directly on page xml
+
+    :param page: the page to read
+    :param master_cache: dict shared across pages to hold master shape properties by (master ID, master shape ID)
+    """
+    shapes_xml = page.xml.find(f'{namespace}Shapes')
+    if shapes_xml is None:
+        return
+    master_ids = dict()  # master page ID by shape element, inherited by sub shapes of a group
+    for shape_xml, parent, depth in walk_shape_xml(shapes_xml, include_root=False):
+        master_id = master_ids[shape_xml] = shape_xml.attrib.get('Master', master_ids.get(parent))
+        master_shape_id = shape_xml.attrib.get('MasterShape')
+
+        master_rows = _master_property_rows(page, master_id, master_shape_id, master_cache) if master_id is not None else []
+        properties = merge_property_rows(master_rows, shape_property_rows(shape_xml))  # name: [label, value]
+
+        if properties:
+            master = _master_name(page, master_id, master_cache)
+            row = {'page': page.name, 'shape_id': shape_xml.attrib.get('ID'), 'master': master}
+            for name, (label, value) in properties.items():
+                row[property_column(label or name)] = value
+            yield row
+
+
+def _master_name(page: Page, master_id: Optional[str], master_cache: dict) -> Optional[str]:
+    if master_id is None:
+        return None
+    key = ('name', master_id)
+    if key not in master_cache:
+        master_page = page.vis.get_master_page_by_id(master_id)
+        master_cache[key] = master_page.name if master_page else None
+    return master_cache[key]
+
+
+def _master_property_rows(page: Page, master_id: str, master_shape_id: Optional[str], master_cache: dict) -> list:
+    key = ('rows', master_id, master_shape_id)
+    if key not in master_cache:
+        master_xml = vsdx.shapes.master_shape_xml(page.vis, master_id, master_shape_id)
+        master_cache[key] = list(shape_property_rows(master_xml)) if master_xml is not None else []
+    return master_cache[key]
+
+
+def data_property_lookup(shapes: Iterable[Shape], key: str) -> Dict[str, List[Shape]]:
+    """Build a dict of shapes by the value of key, which is 'shape_id' or a data property label"""
+    lookup = dict()
+    for shape in shapes:
+        if key == 'shape_id':
+            value = shape.ID
+        else:
+            prop = shape.data_properties.get(key)
+            if prop is None:
+                continue
+            value = prop.value
+        lookup.setdefault(str(value), []).append(shape)
+    return lookup
+
+
+def update_data_properties(rows: Union[Iterable[dict], DataPropertyTable], lookup: Dict[str, List[Shape]],
+                           key: str) -> List[dict]:
+    """Set data property values for each row on the shapes matched in lookup by the row's key value
+
+    Rows with a 'page' value only match shapes in the page with that name.
+    Values of None, and labels not found in a matched shape, are ignored.
+
+    :return: list of rows which did not match any shape
+    """
+    if isinstance(rows, DataPropertyTable):
+        rows = rows.rows()
+    unmatched = list()
+    for row in rows:
+        shapes = lookup.get(str(row.get(key)), [])
+        page_name = row.get('page')
+        if page_name is not None:
+            shapes = [s for s in shapes if s.page.name == page_name]
+        if not shapes:
+            unmatched.append(row)
+            continue
+        for shape in shapes:
+            properties = shape.data_properties
+            for column, value in row.items():
+                if column == key or column in key_columns or value is None:
+                    continue
+                prop = properties.get(column_label(column))
+                if prop is not None:
+                    prop.value = str(value)
+    return unmatched
@@ -1,80 +1,353 @@
+"""Parse and evaluate ShapeSheet formulae, such as 'GUARD((BeginX+EndX)/2)' or 'Sheet.5!Width*0.5'
+
+Each formula text is compiled once to a :class:`Formula`, a tree of python functions, and the compiled formula is
+cached by text so that it is shared by every shape using the same formula (e.g. many shapes of the same master).
+"""
+from __future__ import annotations
+import functools
 import math
+import operator
+import re
+
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+import vsdx
 from vsdx import Shape
 
 
-def width_x_1(shape: Shape):
-    return shape.width
+class FormulaError(Exception):
+    """Error raised when a formula can't be parsed or evaluated, i.e. it uses an unsupported function"""
+    pass
+
+
+# multipliers to convert units to internal units - inches for distance and radians for angles
+units = {
+    'IN': 1.0, 'IN.': 1.0, 'DL': 1.0, 'DP': 1.0, 'IU': 1.0,
+    'FT': 12.0, 'MM': 1 / 25.4, 'CM': 1 / 2.54, 'PT': 1 / 72,
+    'DA': 1.0, 'RAD': 1.0, 'DEG': math.pi / 180,
+}
+
+token_regex = re.compile(r'''
+    \s*(?:
+    (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?P<unit>\s?(?:[A-Za-z]+\.?|%))? |
+    (?P<string>"(?:[^"]|"")*") |
+    (?P<sheet>Sheet\.?\d+|ThePage)! |
+    (?P<name>[A-Za-z_][A-Za-z0-9_.]*) |
+    (?P<op><=|>=|<>|[-+*/^&=<>(),])
+    )''', re.VERBOSE)
+
+geometry_ref_regex = re.compile(r'Geometry(\d+)\.([A-Za-z]+?)(\d+)$')  # i.e. Geometry1.X1
+sheet_ref_regex = re.compile(r'\bSheet\.?(\d+)!')  # i.e. 'Sheet.15!' in a formula, where group 1 is the shape ID
+
+Token = Tuple[str, str, Optional[str]]  # (type, text, unit)
+Evaluator = Callable[[Shape], object]
+
 
+def tokenize(text: str) -> List[Token]:
+    tokens = list()
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = token_regex.match(text, pos)
+        if not m or m.end() == pos:
+            raise FormulaError(f"Unexpected character at {pos} in formula '{text}'")
+        pos = m.end()
+        kind = m.lastgroup if m.lastgroup != 'unit' else 'number'
+        tokens.append((kind, m.group(kind), m.group('unit')))
+    return tokens
 
-def width_x_0(shape: Shape):
-    return 0
 
+class Formula:
+    """A compiled ShapeSheet formula
 
-def middle_x(shape: Shape):
-    # (BeginX+EndX)/2
-    return (shape.begin_x + shape.end_x) / 2
+    :param text: the formula text, i.e. the F attribute of a Cell
+    :param refs: set of (sheet, cell name) referenced by the formula, sheet is None for the shape's own cells,
+        a shape ID for a Sheet.N! reference, or 'ThePage'
+    """
+    def __init__(self, text: str):
+        self.text = text
+        self.refs = set()  # type: Set[Tuple[Optional[str], str]]
+        self._tokens = tokenize(text)
+        self._pos = 0
+        self._evaluate = self._parse_comparison()
+        if self._pos != len(self._tokens):
+            raise FormulaError(f"Unexpected '{self._tokens[self._pos][1]}' in formula '{text}'")
+        del self._tokens
 
+    def __repr__(self):
+        return f"<Formula '{self.text}' refs={sorted(self.refs, key=str)} >"
 
-def middle_y(shape: Shape):
-    # (BeginY+EndY)/2
-    return (shape.begin_y + shape.end_y) / 2
+    def evaluate(self, shape: Shape):
+        """Evaluate the formula for a shape, returning a float (or str), or raise FormulaError"""
+        value = self._evaluate(shape)
+        return float(value) if isinstance(value, bool) else value
 
+    # recursive descent parser, lowest precedence first, each returning a function of shape
+    def _peek(self) -> Optional[Token]:
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
 
-def center_x(shape: Shape):
-    # Width*0.5
-    return shape.width * 0.5
+    def _accept(self, *ops: str) -> Optional[str]:
+        token = self._peek()
+        if token and token[0] == 'op' and token[1] in ops:
+            self._pos += 1
+            return token[1]
 
+    def _expect(self, op: str):
+        if not self._accept(op):
+            raise FormulaError(f"Expected '{op}' in formula '{self.text}'")
 
-def center_y(shape: Shape):
-    # Height*0.5
-    return shape.height * 0.5
+    def _binary(self, parse_operand: Callable, operators: dict) -> Evaluator:
+        left = parse_operand()
+        op = self._accept(*operators)
+        while op:
+            left = _binary_op(operators[op], left, parse_operand())
+            op = self._accept(*operators)
+        return left
 
+    def _parse_comparison(self) -> Evaluator:
+        return self._binary(self._parse_concat, comparison_operators)
 
-def diag_width(shape: Shape):
-    # SQRT((EndX-BeginX)^2+(EndY-BeginY)^2)
-    width = shape.end_x - shape.begin_x
-    height = shape.end_y - shape.begin_y
-    return math.sqrt(width ** 2 + height ** 2)
+    def _parse_concat(self) -> Evaluator:
+        return self._binary(self._parse_sum, {'&': lambda a, b: _str(a) + _str(b)})
 
+    def _parse_sum(self) -> Evaluator:
+        return self._binary(self._parse_product, {'+': _arithmetic(operator.add), '-': _arithmetic(operator.sub)})
 
-def angle(shape: Shape):
-    # ATAN2(EndY-BeginY,EndX-BeginX)
-    w = shape.end_x-shape.begin_x
-    h = shape.end_y-shape.begin_y
-    return math.atan2(w, h)
+    def _parse_product(self) -> Evaluator:
+        return self._binary(self._parse_power, {'*': _arithmetic(operator.mul), '/': _arithmetic(operator.truediv)})
 
+    def _parse_power(self) -> Evaluator:
+        return self._binary(self._parse_unary, {'^': _arithmetic(math.pow)})
 
-def width(shape: Shape):
-    return shape.end_x-shape.begin_x
+    def _parse_unary(self) -> Evaluator:
+        op = self._accept('-', '+')
+        if op:
+            operand = self._parse_unary()
+            return (lambda shape: -_num(operand(shape))) if op == '-' else operand
+        return self._parse_primary()
 
+    def _parse_primary(self) -> Evaluator:
+        token = self._peek()
+        if token is None:
+            raise FormulaError(f"Unexpected end of formula '{self.text}'")
+        kind, text, unit = token
+        self._pos += 1
+        if kind == 'number':
+            value = float(text) * _unit_multiplier(unit)
+            return lambda shape: value
+        if kind == 'string':
+            value = text[1:-1].replace('""', '"')
+            return lambda shape: value
+        if kind == 'op' and text == '(':
+            inner = self._parse_comparison()
+            self._expect(')')
+            return inner
+        if kind == 'sheet':
+            name_token = self._peek()
+            if not name_token or name_token[0] != 'name':
+                raise FormulaError(f"Expected cell name after '{text}!' in formula '{self.text}'")
+            self._pos += 1
+            sheet = 'ThePage' if text == 'ThePage' else text.split('.')[-1].replace('Sheet', '')
+            return self._cell_ref(sheet, name_token[1])
+        if kind == 'name':
+            if self._accept('('):
+                return self._function(text)
+            if text.upper() in constants:
+                value = constants[text.upper()]
+                return lambda shape: value
+            return self._cell_ref(None, text)
+        raise FormulaError(f"Unexpected '{text}' in formula '{self.text}'")
 
-def height(shape: Shape):
-    return shape.end_y-shape.begin_y
+    def _function(self, name: str) -> Evaluator:
+        args = list()
+        if not self._accept(')'):
+            args.append(self._parse_comparison())
+            while self._accept(','):
+                args.append(self._parse_comparison())
+            self._expect(')')
+        name = name.upper()
+        if name == 'IF':  # only evaluate the selected branch
+            if len(args) not in [2, 3]:
+                raise FormulaError(f"IF() expects 2 or 3 arguments in formula '{self.text}'")
+            condition, if_true = args[0], args[1]
+            if_false = args[2] if len(args) == 3 else (lambda shape: 0.0)
+            return lambda shape: if_true(shape) if _num(condition(shape)) else if_false(shape)
+        func = functions.get(name)
+        if func is None:
+            raise FormulaError(f"Unsupported function {name}() in formula '{self.text}'")
+        return lambda shape: func(*[a(shape) for a in args])
+
+    def _cell_ref(self, sheet: Optional[str], name: str) -> Evaluator:
+        self.refs.add((sheet, name))
+        if sheet is None:
+            return lambda shape: shape_cell_value(shape, name)
+        if sheet == 'ThePage':
+            return lambda shape: page_cell_value(shape.page, name)
+        return lambda shape: shape_cell_value(_sheet(shape, sheet), name)
+
+
+def _binary_op(op: Callable, left: Evaluator, right: Evaluator) -> Evaluator:
+    return lambda shape: op(left(shape), right(shape))
+
+
+def _arithmetic(op: Callable) -> Callable:
+    return lambda a, b: op(_num(a), _num(b))
+
+
+def _compare(op: Callable) -> Callable:
+    def compare(a, b):
+        if isinstance(a, str) or isinstance(b, str):
+            return op(_str(a).lower(), _str(b).lower())
+        return op(a, b)
+    return compare
+
+
+comparison_operators = {
+    '=': _compare(operator.eq), '<>': _compare(operator.ne),
+    '<': _compare(operator.lt), '>': _compare(operator.gt),
+    '<=': _compare(operator.le), '>=': _compare(operator.ge),
+}
 
+constants = {'TRUE': 1.0, 'FALSE': 0.0, 'PI': math.pi}
 
-# map func text to functions
-func_map = {
-    'Width*1': width_x_1,
-    'Width*0': width_x_0,
-    '(BeginX+EndX)/2': middle_x,
-    '(BeginY+EndY)/2': middle_y,
-    'Width*0.5': center_x,
-    'Height*0.5': center_y,
-    'SQRT((EndX-BeginX)^2+(EndY-BeginY)^2)': diag_width,
-    'ATAN2(EndY-BeginY,EndX-BeginX)': angle,
-    'GUARD((BeginX+EndX)/2)': middle_x,
-    'GUARD((BeginY+EndY)/2)': middle_y,
-    'GUARD(Width*0.5)': center_x,
-    'GUARD(Height*0.5)': center_y,
-    'GUARD(EndX-BeginX)': width,
-    'GUARD(EndY-BeginY)': height,
+functions = {
+    'GUARD': lambda x: x,
+    'SQRT': lambda x: math.sqrt(_num(x)),
+    'ATAN2': lambda y, x: math.atan2(_num(y), _num(x)),
+    'MIN': lambda *args: min(_num(a) for a in args),
+    'MAX': lambda *args: max(_num(a) for a in args),
+    'ABS': lambda x: abs(_num(x)),
+    'INT': lambda x: float(math.floor(_num(x))),
+    'SIN': lambda x: math.sin(_num(x)),
+    'COS': lambda x: math.cos(_num(x)),
+    'TAN': lambda x: math.tan(_num(x)),
+    'ATAN': lambda x: math.atan(_num(x)),
+    'PI': lambda: math.pi,
+    'NOT': lambda x: float(not _num(x)),
+    'AND': lambda *args: float(all(_num(a) for a in args)),
+    'OR': lambda *args: float(any(_num(a) for a in args)),
+    'MODULUS': lambda x, y: math.fmod(_num(x), _num(y)) % _num(y),
 }
 
 
+def _unit_multiplier(unit: Optional[str]) -> float:
+    if not unit:
+        return 1.0
+    unit = unit.strip().upper()
+    if unit == '%':
+        return 0.01
+    if unit not in units:
+        raise FormulaError(f"Unsupported unit '{unit}'")
+    return units[unit]
+
+
+def _num(value) -> float:
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            raise FormulaError(f"Expected a number, not '{value}'")
+    return value
+
+
+def _str(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _sheet(shape: Shape, sheet_id: str) -> Shape:
+    if shape.ID == sheet_id:
+        return shape
+    sheet = shape.page.cell_graph.find_shape(sheet_id)  # by the graph's map of shape IDs, not a search of the page
+    if sheet is None:
+        raise FormulaError(f"Shape Sheet.{sheet_id} not found")
+    return sheet
+
+
+def shape_cell_value(shape: Shape, name: str) -> float:
+    """Get the value of a cell by ShapeSheet name, such as 'Width', 'Geometry1.X1' or 'Controls.TextPosition.Y'"""
+    value = None
+    if '.' not in name:
+        value = shape.cell_value(name)
+    elif name.startswith('Geometry'):
+        m = geometry_ref_regex.match(name)
+        row = shape.geometry.rows.get(m.group(3)) if m and m.group(1) == '1' and shape.geometry else None
+        cell = row.cells.get(m.group(2)) if row else None
+        value = cell.value if cell else None
+    elif name.startswith('Controls.'):
+        parts = name.split('.')  # Controls.<row name> is X cell, or Controls.<row name>.<cell name>
+        cell_name = parts[2] if len(parts) > 2 else 'X'
+        value = shape.cell_value(f"Control/{parts[1]}/{cell_name}")
+    elif name.startswith('Prop.'):
+        prop = shape._data_properties_by_name().get(name.split('.', 1)[1])
+        value = prop.value if prop else None
+    elif name.startswith('User.'):
+        row = shape.xml.find(f'{vsdx.namespace}Section[@N="User"]/{vsdx.namespace}Row[@N="{name.split(".")[1]}"]')
+        cell = row.find(f'{vsdx.namespace}Cell[@N="Value"]') if row is not None else None
+        value = cell.attrib.get('V') if cell is not None else None
+    if value is None:
+        raise FormulaError(f"Cell '{name}' not found in shape ID={shape.ID}")
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def page_cell_value(page: vsdx.Page, name: str) -> float:
+    cell = page._pagesheet_xml.find(f'{vsdx.namespace}Cell[@N="{name}"]')
+    if cell is None or cell.attrib.get('V') is None:
+        raise FormulaError(f"Cell 'ThePage!{name}' not found")
+    return float(cell.attrib['V'])
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_formula(func_text: str) -> Optional[Formula]:
+    """Compile formula text to a :class:`Formula`, or None if the formula is not supported
+
+    Compiled formulae are cached by text, so the same formula used by many shapes is only parsed once
+    """
+    if not func_text:
+        return None
+    try:
+        return Formula(func_text)
+    except FormulaError:
+        return None
+
+
+def formula_refs(func_text: str) -> Optional[Set[Tuple[Optional[str], str]]]:
+    """Return the cells referenced by formula text, as :attr:`Formula.refs` - or None if the formula is not supported
+
+    Shape IDs of Sheet.N! references are replaced before the formula is compiled, so formulae which only differ in the
+    shapes they reference, i.e. those of each copy of a group shape, are parsed once
+    """
+    sheets = list()  # shape IDs referenced, in order of first reference
+
+    def placeholder(match: re.Match) -> str:
+        if match.group(1) not in sheets:
+            sheets.append(match.group(1))
+        return f"Sheet.{sheets.index(match.group(1))}!"
+
+    formula = compile_formula(sheet_ref_regex.sub(placeholder, func_text)) if func_text else None
+    if formula is None:
+        return None
+    return {(sheets[int(sheet)] if sheet not in (None, 'ThePage') else sheet, name) for sheet, name in formula.refs}
+
+
 def calc_value(shape: Shape, func_text: str):
-    f = func_map.get(func_text)
-    if f:
-        return f(shape=shape)
+    """Calculate the value of formula func_text for shape, or return None if the formula is not supported"""
+    formula = compile_formula(func_text)
+    if formula:
+        try:
+            return formula.evaluate(shape)
+        except (FormulaError, ArithmeticError, ValueError, TypeError) as e:
+            if shape.page.vis.debug:
+                print(f"calc_value(func_text='{func_text}') {e}")
+            return None
     elif shape.page.vis.debug:
         # show any non-matching formulae
         print(f"calc_value(func_text='{func_text}') no method found")
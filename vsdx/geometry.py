@@ -1,36 +1,153 @@
 from __future__ import annotations
+import math
 import xml.etree.ElementTree as ET
+from array import array
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
 from xml.etree.ElementTree import Element
 
 import vsdx
 
 namespace = "{http://schemas.microsoft.com/office/visio/2012/main}"  # visio file name space
+row_tag = f"{namespace}Row"
+cell_tag = f"{namespace}Cell"
+
+
+# cells of geometry rows held as packed arrays of floats by Geometry, see Geometry.values()
+row_cells = ('X', 'Y', 'A', 'B', 'C', 'D')
+
+
+def geometry_rows(section: Element, inherited: Dict[str, Tuple[str, Dict[str, float or str]]] = None
+                  ) -> Dict[str, Tuple[str, Dict[str, float or str]]]:
+    """Read the rows of a Geometry section xml, without creating GeometryRow objects
+
+    :param section: Section element with attr N='Geometry'
+    :param inherited: rows of the master geometry, as returned by this function, to be over-ridden by section rows
+    :return: (type(T), {cell name: value}) of each row by index(IX) - in the order of :attr:`Geometry.rows`. A value
+      is a float, or the V attribute string if it is not a number, i.e. the NURBS() formula of a NURBSTo E cell
+    """
+    rows = dict(inherited) if inherited else dict()
+    for row in section:  # iterate children rather than iterfind(), as this is used for every shape of a page
+        if row.tag != row_tag:
+            continue
+        attrib = row.attrib
+        index = attrib.get('IX')
+        if attrib.get('Del'):  # master row over-ridden with a deleted item
+            rows.pop(index, None)
+            continue
+        inherited_row = rows.get(index)
+        row_type, values = (inherited_row[0], dict(inherited_row[1])) if inherited_row else (None, dict())
+        for cell in row:
+            if cell.tag == cell_tag:
+                values[cell.attrib.get('N')] = _row_value(cell.attrib.get('V'))
+        rows[index] = (attrib.get('T') or row_type, values)
+    return rows
+
+
+def _row_value(value: Optional[str]) -> float or str:
+    try:
+        return float(value)
+    except (TypeError, ValueError):  # no value, or a formula such as NURBS()
+        return value
+
+
+def _packed_value(value: float or str) -> float:
+    return value if type(value) is float else math.nan
 
 
 class Geometry:
-    """ class to represent, and manipulate, the geometry of a shape"""
-    def __init__(self, xml: Element, shape: vsdx.Shape):
-        # get shape master geometry, and append/overwrite with actual shape instance data
+    """ class to represent, and manipulate, the geometry of a shape
 
+    Row types and X, Y, A, B, C, D cell values, including values inherited from the master geometry, are held as packed
+    arrays of floats, read from the xml when first needed and read again after a geometry in the page is moved.
+    :meth:`move` changes the arrays and writes the moved values to the xml. :class:`GeometryRow` and
+    :class:`GeometryCell` objects are only created when :attr:`rows` or :attr:`cells` are used.
+    """
+    def __init__(self, xml: Element, shape: vsdx.Shape):
         self.xml = xml  # expect an Element of Section with attr N='Geometry'
-        self.cells = list()  #list of cells directly under Geometry section
-        self.rows = dict()  # and list of rows with type(T) and index(IX), each containing a list of Cells
         self.shape = shape
+        self._cells = None  # type: Optional[List[GeometryCell]]  # set by cells property
+        self._rows = None  # type: Optional[Dict[str, GeometryRow]]  # set by rows property
+        self._ix = None  # type: Optional[List[str]]  # packed rows: index(IX) of each row, set by _pack()
+        self._types = None  # type: Optional[List[str]]  # type(T) of each row
+        self._values = None  # type: Optional[Dict[str, array]]  # array of floats by cell name, nan if no value
+        self._packed_moves = None  # type: Optional[int]  # page._geometry_moves when packed
 
-        if shape.master_shape and shape.master_shape.geometry:
-            self.cells = shape.master_shape.geometry.cells
+    @property
+    def _master_geometry(self) -> Optional[Geometry]:
+        master_shape = self.shape.master_shape
+        return master_shape.geometry if master_shape else None
+
+    @property
+    def cells(self) -> List[GeometryCell]:
+        """list of cells directly under Geometry section, with cells of the master geometry"""
+        if self._cells is None:
+            self._materialize()
+        return self._cells
 
+    @property
+    def rows(self) -> Dict[str, GeometryRow]:
+        """rows with type(T) and index(IX), each containing a list of Cells, by index - with rows of the master geometry"""
+        if self._rows is None:
+            self._materialize()
+        return self._rows
+
+    def _materialize(self):
+        # get shape master geometry, and append/overwrite with actual shape instance data
+        master_geometry = self._master_geometry
+        self._cells = list(master_geometry.cells) if master_geometry else list()
         for cell in self.xml.findall(f"{namespace}Cell"):
-            self.cells.append(GeometryCell(parent=self, xml=cell))
+            self._cells.append(GeometryCell(parent=self, xml=cell))
 
-        if shape.master_shape and shape.master_shape.geometry:
-            self.rows = shape.master_shape.geometry.rows  # type: dict
+        self._rows = dict(master_geometry.rows) if master_geometry else dict()  # type: dict
         for row in self.xml.findall(f"{namespace}Row"):
             index = row.attrib.get('IX')
-            g_row = GeometryRow(geometry=self, xml=row, master_geometry_row=self.rows.get(index))
-            self.rows[g_row.index] = g_row
+            g_row = GeometryRow(geometry=self, xml=row, master_geometry_row=self._rows.get(index))
+            self._rows[g_row.index] = g_row
             if g_row.del_bool:  # remove if master row over-ridden with a  deleted item
-                del self.rows[g_row.index]
+                del self._rows[g_row.index]
+        self._ix = self._types = self._values = None  # rows may change the xml, so pack again when next needed
+
+    def _pack(self):
+        # read row types and cell values to packed arrays, from master geometry and then shape instance xml
+        moves = self.shape.page._geometry_moves
+        if self._ix is not None and self._packed_moves == moves:
+            return  # packed, and no geometry in the page moved since - possibly by another Shape of the same shape
+        self._packed_moves = moves
+        inherited = None
+        master_geometry = self._master_geometry
+        if master_geometry:
+            inherited = {index: (row_type, {name: master_geometry._values[name][i] for name in row_cells
+                                            if not math.isnan(master_geometry._values[name][i])})
+                         for i, (index, row_type) in enumerate(zip(master_geometry.row_indexes,
+                                                                   master_geometry.row_types))}
+        rows = geometry_rows(self.xml, inherited)
+        self._ix = list(rows.keys())
+        self._types = [row_type for row_type, values in rows.values()]
+        self._values = {name: array('d', [_packed_value(values.get(name)) for row_type, values in rows.values()])
+                        for name in row_cells}
+
+    @property
+    def row_indexes(self) -> List[str]:
+        """index(IX) of each row, in the same order as :attr:`row_types` and :meth:`values`"""
+        self._pack()
+        return self._ix
+
+    @property
+    def row_types(self) -> List[str]:
+        """type(T) of each row, i.e. ['MoveTo', 'LineTo', 'LineTo'], including rows inherited from master geometry"""
+        self._pack()
+        return self._types
+
+    def values(self, name: str) -> array:
+        """array of float values of cell name in each row, nan where a row has no value - do not change the array
+
+        :param name: one of 'X', 'Y', 'A', 'B', 'C' or 'D'
+        """
+        self._pack()
+        return self._values[name]
 
     def start_pos(self) -> tuple:
         # find start position of shape based on first MoveTo or RelMoveTo row in geometry
@@ -42,13 +159,45 @@ class Geometry:
                 return self.shape.x, self.shape.y
 
     def move(self, x_delta: float, y_delta: float):
-        # update any absolute references to co-ordinates
-        for r in self.rows.values():  # type: GeometryRow
-            print(f"r={type(r)} {r}")
-            if r.row_type.lower() in ['moveto', 'lineto']:  # todo: include other absolute row types
-                r.x = r.x + x_delta if type(r.x) is float else None
-                r.y = r.y + y_delta if type(r.y) is float else None
-                print(f"r={type(r)} {r} after move {x_delta}, {y_delta}")
+        # update any absolute references to co-ordinates - in packed arrays and in xml
+        self._pack()
+        xs, ys = self._values['X'], self._values['Y']
+        changed = list()  # indexes of packed rows changed
+        for i, row_type in enumerate(self._types):
+            if str(row_type).lower() in ['moveto', 'lineto']:  # todo: include other absolute row types
+                xs[i] += x_delta  # a missing value stays nan
+                ys[i] += y_delta
+                changed.append(i)
+        if changed:
+            self._write(changed)
+            self._cells = self._rows = None  # created again from xml, to include rows added to over-ride master rows
+            self.shape.page._geometry_moves += 1  # other Geometry objects of the page pack again from xml
+            self._packed_moves = self.shape.page._geometry_moves  # arrays of this geometry are up to date
+
+    def _write(self, changed: List[int]):
+        # write X and Y values of changed packed rows to the Geometry section xml of the shape, finding each Row
+        # element by index(IX) from one pass over the section
+        rows_xml = {row.attrib.get('IX'): row for row in self.xml if row.tag == row_tag}
+        added = False
+        for i in changed:
+            index = self._ix[i]
+            row = rows_xml.get(index)
+            if row is None:  # row inherited from master, so over-ride it in the shape instance
+                row = rows_xml[index] = ET.SubElement(self.xml, row_tag, {'T': self._types[i], 'IX': index})
+                added = True
+            cells = {cell.attrib.get('N'): cell for cell in row if cell.tag == cell_tag}
+            for name in ('X', 'Y'):
+                value = self._values[name][i]
+                if math.isnan(value):
+                    continue
+                cell = cells.get(name)
+                if cell is None:
+                    cell = ET.SubElement(row, cell_tag, {'N': name})
+                cell.attrib['V'] = str(value)
+        if added:  # rows in order of index, after the cells of the section
+            others = [e for e in self.xml if e.tag != row_tag]
+            rows = sorted(rows_xml.values(), key=lambda row: vsdx.shapes.to_float(row.attrib.get('IX')) or 0.0)
+            self.xml[:] = others + rows
 
     def set_move_to(self, x: int, y: int, move_to_index: int=0):
         move_tos = [r for r in self.rows.values() if r.row_type.lower() == 'moveto']
@@ -57,7 +206,7 @@ class Geometry:
             move_to = move_tos[move_to_index]  # type: GeometryRow
             if move_to.geometry.shape.master_page_ID != self.shape.master_page_ID:
                 move_to = GeometryRow(geometry=self, xml=None, master_geometry_row=move_to, T='MoveTo', IX=move_to.index)
-                print(f"set_move_to() created: {move_to}")
+                #print(f"set_move_to() created: {move_to}")
             move_to.x = x
             move_to.y = y
             #print(f"move_to[{move_to_index}]={move_to.x},{move_to.y}")
@@ -69,7 +218,7 @@ class Geometry:
             line_to = line_tos[line_to_index]  # type: GeometryRow
             if line_to.geometry.shape.master_page_ID != self.shape.master_page_ID:
                 line_to = GeometryRow(geometry=self, xml=None, master_geometry_row=line_to, T='LineTo', IX=line_to.index)
-                print(f"set_line_to() created: {line_to}")
+                #print(f"set_line_to() created: {line_to}")
             line_to.x = x
             line_to.y = y
             #print(f"line_to[{line_to_index}]={line_to.x},{line_to.y}")
@@ -136,7 +285,7 @@ class GeometryRow:
         if not x_cell or (type(x_cell.parent) is GeometryRow and x_cell.parent.geometry.shape.master_page_ID!=self.geometry.shape.master_page_ID):
             # create new cell if none exists, or if existing cell is from master shape
             x_cell = GeometryCell(parent=self, xml=None, name='X', value=value)
-            print(f"x_cell={x_cell}")
+            #print(f"x_cell={x_cell}")
         x_cell.value = value
 
     @property
@@ -150,7 +299,7 @@ class GeometryRow:
         if not y_cell or (type(y_cell.parent) is GeometryRow and y_cell.parent.geometry.shape.master_page_ID != self.geometry.shape.master_page_ID):
             # create new cell if none exists, or if existing cell is from master shape
             y_cell = GeometryCell(parent=self, xml=None, name='Y', value=value)
-            print(f"y_cell={y_cell}")
+            #print(f"y_cell={y_cell}")
         y_cell.value = value
 
     @property
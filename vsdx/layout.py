@@ -0,0 +1,448 @@
+"""Layout of shapes in grids, rows and columns, and of connected shapes as a graph
+
+Positions for all shapes are calculated together, in one pass, then applied with one batch of cell changes for each
+page - so cells which depend on the moved shapes, including glued connectors, are updated once, not after every shape.
+
+Force directed layout uses numpy if it is installed, which is much faster for large graphs.
+"""
+from __future__ import annotations
+import collections
+import contextlib
+import math
+import random
+
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Tuple
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .pages import Page
+    from .shapes import Shape
+
+try:
+    import numpy
+except ImportError:  # numpy is optional
+    numpy = None
+
+from vsdx import namespace
+
+
+def grid_positions(sizes: List[Tuple[float, float]], columns: int = None, rows: int = None,
+                   spacing: float or Tuple[float, float] = 0.0, origin: Tuple[float, float] = (0.0, 0.0),
+                   max_width: float = None, order: str = 'rows', uniform: bool = True) -> List[Tuple[float, float]]:
+    """Calculate the top left position of each item in a grid, with y increasing up the page as in Visio
+
+    :param sizes: (width, height) of each item
+    :param columns: number of columns, or None to calculate from rows or max_width - or a single row if neither is set
+    :param rows: number of rows, used if columns is not set
+    :param spacing: space between cells, as a single value or (x, y)
+    :param origin: (x, y) of the top left of the grid
+    :param max_width: if columns and rows are not set, wrap to a new row rather than be wider than max_width
+    :param order: 'rows' to fill each row left to right, or 'columns' to fill each column top to bottom
+    :param uniform: give every cell the size of the largest item, or if False size each column to its widest item
+      and each row to its tallest item
+    :return: (x, y) of the top left of each item, in the order of sizes
+    """
+    count = len(sizes)
+    if not count:
+        return []
+    if order not in ('rows', 'columns'):
+        raise ValueError(f"order must be 'rows' or 'columns', not '{order}'")
+    spacing_x, spacing_y = spacing if isinstance(spacing, tuple) else (spacing, spacing)
+    max_item_width = max(w for w, h in sizes)
+    max_item_height = max(h for w, h in sizes)
+
+    if columns:
+        rows = math.ceil(count / columns)
+    elif rows:
+        columns = math.ceil(count / rows)
+    elif max_width is not None:
+        columns = max(1, min(count, int((max_width + spacing_x) // (max_item_width + spacing_x))))
+        rows = math.ceil(count / columns)
+    else:
+        columns, rows = count, 1
+
+    # (column, row) of each item
+    if order == 'rows':
+        cells = [(i % columns, i // columns) for i in range(count)]
+    else:
+        cells = [(i // rows, i % rows) for i in range(count)]
+
+    widths = [max_item_width] * columns
+    heights = [max_item_height] * rows
+    if not uniform:
+        widths, heights = [0.0] * columns, [0.0] * rows
+        for (column, row), (w, h) in zip(cells, sizes):
+            widths[column] = max(widths[column], w)
+            heights[row] = max(heights[row], h)
+
+    # left of each column and top of each row, as running totals
+    lefts, tops = [origin[0]], [origin[1]]
+    for w in widths[:-1]:
+        lefts.append(lefts[-1] + w + spacing_x)
+    for h in heights[:-1]:
+        tops.append(tops[-1] - h - spacing_y)
+    return [(lefts[column], tops[row]) for column, row in cells]
+
+
+def shape_box(shape: Shape) -> Tuple[float, float, float, float]:
+    """Return (left, top, width, height) of a shape, from :attr:`Shape.bounds` in the coordinates of its parent"""
+    bx, by, ex, ey = shape.bounds
+    return min(bx, ex), max(by, ey), abs(ex - bx), abs(ey - by)
+
+
+def move_shapes(moves: List[Tuple[Shape, float, float]]):
+    """Move shapes by (x delta, y delta), setting Pin and Begin/End cells in one batch of changes for each page
+
+    :param moves: list of (shape, x delta, y delta)
+    """
+    pages = dict()  # type: Dict[int, Page]
+    for shape, dx, dy in moves:
+        pages[id(shape.page)] = shape.page
+    with contextlib.ExitStack() as stack:
+        for page in pages.values():
+            stack.enter_context(page.cell_graph.batch())
+        for shape, dx, dy in moves:
+            if not dx and not dy:
+                continue
+            if shape.begin_x is not None:  # a 1D shape, i.e. a line or connector
+                shape.begin_x, shape.begin_y = shape.begin_x + dx, shape.begin_y + dy
+                shape.end_x, shape.end_y = shape.end_x + dx, shape.end_y + dy
+            shape.x, shape.y = shape.x + dx, shape.y + dy
+
+
+def layout_grid(shapes: List[Shape], columns: int = None, rows: int = None,
+                spacing: float or Tuple[float, float] = 0.0, origin: Tuple[float, float] = None,
+                max_width: float = None, wrap: bool = False, order: str = 'rows',
+                uniform: bool = True) -> List[Tuple[float, float]]:
+    """Arrange shapes in a grid, in the order of the list, i.e. ``layout_grid(page.find_shapes_by_text('Port'), columns=4)``
+
+    Shapes should have the same parent, as positions are in the coordinates of the parent shape or page.
+
+    :param shapes: the shapes to arrange
+    :param origin: (x, y) of the top left of the grid, or None for the top left of the first shape
+    :param wrap: if True and max_width is not set, wrap at the right edge of the page of the first shape
+    :return: (x, y) of the top left of each shape
+
+    See :func:`grid_positions` for other parameters
+    """
+    if not shapes:
+        return []
+    boxes = [shape_box(s) for s in shapes]
+    if origin is None:
+        origin = boxes[0][:2]
+    if wrap and max_width is None:
+        max_width = shapes[0].page.width - origin[0]
+    positions = grid_positions([(w, h) for left, top, w, h in boxes], columns=columns, rows=rows, spacing=spacing,
+                               origin=origin, max_width=max_width, order=order, uniform=uniform)
+    move_shapes([(s, x - left, y - top) for s, (left, top, w, h), (x, y) in zip(shapes, boxes, positions)])
+    return positions
+
+
+def layout_row(shapes: List[Shape], spacing: float = 0.0, origin: Tuple[float, float] = None,
+               uniform: bool = False) -> List[Tuple[float, float]]:
+    """Arrange shapes left to right in a single row, see :func:`layout_grid`"""
+    return layout_grid(shapes, rows=1, spacing=spacing, origin=origin, uniform=uniform)
+
+
+def layout_column(shapes: List[Shape], spacing: float = 0.0, origin: Tuple[float, float] = None,
+                  uniform: bool = False) -> List[Tuple[float, float]]:
+    """Arrange shapes top to bottom in a single column, see :func:`layout_grid`"""
+    return layout_grid(shapes, columns=1, spacing=spacing, origin=origin, uniform=uniform)
+
+
+def connect_graph(page: Page) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Read the graph of shapes joined by connectors from the Connects of a page
+
+    :param page: the page
+    :return: list of shape IDs, in order of first use, and list of (begin shape ID, end shape ID) for each connector
+      glued at both ends
+    """
+    ends = dict()  # type: Dict[str, Dict[str, str]]  # connector ID: {'BeginX' or 'EndX': shape ID}
+    for connect in page.xml.iterfind(f'.//{namespace}Connects/{namespace}Connect'):
+        from_cell = connect.attrib.get('FromCell')
+        if from_cell in ('BeginX', 'EndX'):
+            ends.setdefault(connect.attrib.get('FromSheet'), dict())[from_cell] = connect.attrib.get('ToSheet')
+    edges = [(e['BeginX'], e['EndX']) for e in ends.values() if 'BeginX' in e and 'EndX' in e]
+    nodes = list(dict.fromkeys(node for edge in edges for node in edge))
+    return nodes, edges
+
+
+def layered_positions(nodes: List[str], edges: List[Tuple[str, str]], spacing: float or Tuple[float, float] = 1.0,
+                      origin: Tuple[float, float] = (0.0, 0.0), direction: str = 'down',
+                      sweeps: int = 4) -> Dict[str, Tuple[float, float]]:
+    """Calculate positions for a layered (hierarchical) layout, with edges pointing down or right where possible
+
+    Cycles are broken by reversing edges back to a node being visited, nodes are placed in the layer after the longest
+    path to them, and nodes within each layer are ordered by the mean position of their neighbours, to reduce crossings.
+
+    :param nodes: node IDs
+    :param edges: (from ID, to ID) of each edge
+    :param spacing: distance between nodes in a layer, and between layers, as a single value or (x, y)
+    :param origin: (x, y) of the top left node position
+    :param direction: 'down' for a layer per row, or 'right' for a layer per column
+    :param sweeps: number of passes down and up the layers to reduce crossings
+    :return: (x, y) of each node by ID
+    """
+    spacing_x, spacing_y = spacing if isinstance(spacing, tuple) else (spacing, spacing)
+    successors = {n: list() for n in nodes}  # type: Dict[str, List[str]]
+    for a, b in edges:
+        if a != b:
+            successors.setdefault(a, list()).append(b)
+            successors.setdefault(b, list())
+    nodes = list(successors)
+
+    # break cycles, with an iterative depth first search reversing back edges
+    state = dict()  # node: 1 while on the search path, 2 when done
+    dag = {n: list() for n in nodes}  # type: Dict[str, List[str]]
+    for root in nodes:
+        if root in state:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                state[node] = 2
+                stack.pop()
+            elif state.get(child) == 1:
+                dag[child].append(node)  # reverse a back edge
+            else:
+                dag[node].append(child)
+                if child not in state:
+                    state[child] = 1
+                    stack.append((child, iter(successors[child])))
+
+    # longest path layering, in topological order
+    in_degree = dict.fromkeys(nodes, 0)
+    for children in dag.values():
+        for child in children:
+            in_degree[child] += 1
+    layer_of = dict.fromkeys(nodes, 0)
+    ready = collections.deque(n for n in nodes if in_degree[n] == 0)
+    while ready:
+        node = ready.popleft()
+        for child in dag[node]:
+            layer_of[child] = max(layer_of[child], layer_of[node] + 1)
+            in_degree[child] -= 1
+            if not in_degree[child]:
+                ready.append(child)
+    layers = [list() for _ in range(max(layer_of.values(), default=-1) + 1)]  # type: List[List[str]]
+    for node in nodes:
+        layers[layer_of[node]].append(node)
+
+    # order each layer by the mean index of neighbours in the layer above, then below
+    above = {n: list() for n in nodes}  # type: Dict[str, List[str]]
+    below = dag
+    for node, children in dag.items():
+        for child in children:
+            above[child].append(node)
+    index = {n: i for layer in layers for i, n in enumerate(layer)}
+    for sweep in range(sweeps):
+        neighbours, order = (above, layers[1:]) if sweep % 2 == 0 else (below, layers[-2::-1])
+        for layer in order:
+            layer.sort(key=lambda n: sum(index[m] for m in neighbours[n]) / len(neighbours[n])
+                       if neighbours[n] else index[n])
+            index.update((n, i) for i, n in enumerate(layer))
+
+    widest = max((len(layer) for layer in layers), default=0)
+    positions = dict()
+    for layer_number, layer in enumerate(layers):
+        offset = (widest - len(layer)) / 2  # centre each layer
+        for i, node in enumerate(layer):
+            along, across = (offset + i), layer_number
+            if direction == 'right':
+                positions[node] = (origin[0] + across * spacing_x, origin[1] - along * spacing_y)
+            else:
+                positions[node] = (origin[0] + along * spacing_x, origin[1] - across * spacing_y)
+    return positions
+
+
+def force_positions(nodes: List[str], edges: List[Tuple[str, str]], spacing: float = 1.0,
+                    origin: Tuple[float, float] = (0.0, 0.0), iterations: int = 50, seed: int = 0,
+                    use_numpy: bool = None) -> Dict[str, Tuple[float, float]]:
+    """Calculate positions for a force directed (Fruchterman-Reingold) layout
+
+    Connected nodes attract each other, and every node repels nodes within twice spacing - found from a grid of cells,
+    rather than by comparing every pair of nodes. Nodes start in a square grid, with some random jitter from seed, so
+    results are repeatable.
+
+    :param nodes: node IDs
+    :param edges: (from ID, to ID) of each edge
+    :param spacing: ideal distance between connected nodes
+    :param origin: (x, y) of the top left node position
+    :param iterations: number of iterations, each moving nodes by less than the last
+    :param seed: random seed for initial positions
+    :param use_numpy: use numpy, or None to use numpy if it is installed
+    :return: (x, y) of each node by ID
+    """
+    nodes = list(dict.fromkeys(list(nodes) + [n for edge in edges for n in edge]))
+    if not nodes:
+        return dict()
+    index = {n: i for i, n in enumerate(nodes)}
+    edge_index = [(index[a], index[b]) for a, b in edges if a != b]
+    rng = random.Random(seed)
+    side = math.ceil(math.sqrt(len(nodes)))
+    xs = [(i % side + rng.uniform(-0.25, 0.25)) * spacing for i in range(len(nodes))]
+    ys = [(i // side + rng.uniform(-0.25, 0.25)) * spacing for i in range(len(nodes))]
+
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if use_numpy:
+        if numpy is None:
+            raise ImportError("force_positions(use_numpy=True) requires numpy")
+        xs, ys = _force_iterations_numpy(xs, ys, edge_index, spacing, iterations)
+    else:
+        xs, ys = _force_iterations(xs, ys, edge_index, spacing, iterations)
+
+    # translate so the top left node position is at origin
+    dx, dy = origin[0] - min(xs), origin[1] - max(ys)
+    return {n: (xs[i] + dx, ys[i] + dy) for n, i in index.items()}
+
+
+# cell offsets to compare with each grid cell, so each pair of neighbouring cells is compared once
+_neighbour_cells = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def _force_iterations(xs: List[float], ys: List[float], edges: List[Tuple[int, int]], k: float,
+                      iterations: int) -> Tuple[List[float], List[float]]:
+    count = len(xs)
+    cutoff = 2 * k
+    temperature = k * math.sqrt(count) / 4
+    for iteration in range(iterations):
+        disp_x, disp_y = [0.0] * count, [0.0] * count
+        cells = collections.defaultdict(list)  # type: Dict[Tuple[int, int], List[int]]
+        for i in range(count):
+            cells[(math.floor(xs[i] / cutoff), math.floor(ys[i] / cutoff))].append(i)
+        for (cx, cy), members in cells.items():
+            for ox, oy in _neighbour_cells:
+                others = cells.get((cx + ox, cy + oy))
+                if not others:
+                    continue
+                for a, i in enumerate(members):
+                    for j in (members[a + 1:] if ox == oy == 0 else others):
+                        dx, dy = xs[i] - xs[j], ys[i] - ys[j]
+                        distance = math.hypot(dx, dy) or 0.01 * k
+                        if distance < cutoff:
+                            force = k * k / distance / distance  # repulsion k²/d, applied to the unit vector
+                            disp_x[i] += dx * force
+                            disp_y[i] += dy * force
+                            disp_x[j] -= dx * force
+                            disp_y[j] -= dy * force
+        for i, j in edges:
+            dx, dy = xs[i] - xs[j], ys[i] - ys[j]
+            force = math.hypot(dx, dy) / k  # attraction d²/k, applied to the unit vector
+            disp_x[i] -= dx * force
+            disp_y[i] -= dy * force
+            disp_x[j] += dx * force
+            disp_y[j] += dy * force
+        for i in range(count):
+            length = math.hypot(disp_x[i], disp_y[i])
+            if length:
+                step = min(length, temperature) / length
+                xs[i] += disp_x[i] * step
+                ys[i] += disp_y[i] * step
+        temperature *= 1 - 1 / (iterations - iteration + 1)
+    return xs, ys
+
+
+def _force_iterations_numpy(xs: List[float], ys: List[float], edges: List[Tuple[int, int]], k: float,
+                            iterations: int) -> Tuple[List[float], List[float]]:
+    # as _force_iterations(), with pairs of nodes in neighbouring cells found with array operations
+    count = len(xs)
+    cutoff = 2 * k
+    temperature = k * math.sqrt(count) / 4
+    x, y = numpy.array(xs, dtype=float), numpy.array(ys, dtype=float)
+    edge_array = numpy.array(edges, dtype=numpy.int64).reshape(-1, 2)
+
+    def accumulate(i, j, fx, fy):
+        # add force to node i and subtract it from node j, summing forces on each node with bincount
+        return (numpy.bincount(i, fx, count) - numpy.bincount(j, fx, count),
+                numpy.bincount(i, fy, count) - numpy.bincount(j, fy, count))
+
+    for iteration in range(iterations):
+        disp_x, disp_y = numpy.zeros(count), numpy.zeros(count)
+        cell_x = numpy.floor(x / cutoff).astype(numpy.int64)
+        cell_y = numpy.floor(y / cutoff).astype(numpy.int64)
+        cell_x -= cell_x.min() - 1  # keep cell coordinates positive, with a margin for neighbour offsets
+        cell_y -= cell_y.min() - 1
+        width = int(cell_x.max()) + 2
+        keys = cell_y * width + cell_x
+        order = numpy.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        for ox, oy in _neighbour_cells:
+            neighbour_keys = keys + oy * width + ox
+            starts = numpy.searchsorted(sorted_keys, neighbour_keys, side='left')
+            counts = numpy.searchsorted(sorted_keys, neighbour_keys, side='right') - starts
+            total = int(counts.sum())
+            if not total:
+                continue
+            # every (i, j) for node i and node j in the neighbouring cell of i
+            i = numpy.repeat(numpy.arange(count), counts)
+            j = order[numpy.repeat(starts - (numpy.cumsum(counts) - counts), counts) + numpy.arange(total)]
+            if ox == oy == 0:
+                keep = i < j  # each pair in the same cell once
+                i, j = i[keep], j[keep]
+            dx, dy = x[i] - x[j], y[i] - y[j]
+            distance_squared = dx * dx + dy * dy
+            distance_squared[distance_squared == 0] = (0.01 * k) ** 2
+            near = distance_squared < cutoff * cutoff
+            force = k * k / distance_squared[near]  # repulsion k²/d, applied to the unit vector
+            fx, fy = accumulate(i[near], j[near], dx[near] * force, dy[near] * force)
+            disp_x += fx
+            disp_y += fy
+        if len(edge_array):
+            i, j = edge_array[:, 0], edge_array[:, 1]
+            dx, dy = x[i] - x[j], y[i] - y[j]
+            force = numpy.hypot(dx, dy) / k  # attraction d²/k, applied to the unit vector
+            fx, fy = accumulate(i, j, dx * force, dy * force)
+            disp_x -= fx
+            disp_y -= fy
+        length = numpy.hypot(disp_x, disp_y)
+        step = numpy.where(length > 0, numpy.minimum(length, temperature) / numpy.where(length > 0, length, 1), 0)
+        x += disp_x * step
+        y += disp_y * step
+        temperature *= 1 - 1 / (iterations - iteration + 1)
+    return x.tolist(), y.tolist()
+
+
+def layout_connected(page: Page, method: str = 'layered', shape_ids: Iterable[str] = None,
+                     spacing: float or Tuple[float, float] = None, origin: Tuple[float, float] = None,
+                     **options) -> Dict[str, Tuple[float, float]]:
+    """Arrange the shapes joined by connectors in a page, then reroute the connectors glued to them
+
+    Shape pins are set in one batch, and connectors glued to moved shapes are rerouted with
+    :meth:`Shape.set_start_and_finish` when the batch ends, i.e. ``layout_connected(page, 'force', spacing=2.0)``
+
+    :param page: the page
+    :param method: 'layered' for :func:`layered_positions` or 'force' for :func:`force_positions`
+    :param shape_ids: IDs of shapes to include as well as connected shapes, i.e. to place shapes with no connections
+    :param spacing: distance between shapes, or None for twice the largest shape width or height
+    :param origin: (x, y) of the top left shape pin, or None to keep the top left of the current shape pins
+    :param options: other options for the layout method
+    :return: (x, y) pin position of each shape by ID
+    """
+    nodes, edges = connect_graph(page)
+    nodes = list(dict.fromkeys(nodes + list(shape_ids or [])))
+    node_ids = set(nodes)
+    shapes = {s.ID: s for shapes in page._shapes
+              for s in shapes._iter_shapes(lambda xml, master_id: xml.attrib.get('ID') in node_ids)}
+    nodes = [n for n in nodes if n in shapes and shapes[n].x is not None]  # skip missing or 1D shapes
+    edges = [(a, b) for a, b in edges if a in shapes and b in shapes]
+    if not nodes:
+        return dict()
+    if spacing is None:
+        spacing = 2 * max(max(s.width or 0, s.height or 0) for s in (shapes[n] for n in nodes)) or 1.0
+    if origin is None:
+        origin = (min(shapes[n].x for n in nodes), max(shapes[n].y for n in nodes))
+    if method == 'layered':
+        positions = layered_positions(nodes, edges, spacing=spacing, origin=origin, **options)
+    elif method == 'force':
+        positions = force_positions(nodes, edges, spacing=spacing if not isinstance(spacing, tuple) else spacing[0],
+                                    origin=origin, **options)
+    else:
+        raise ValueError(f"method must be 'layered' or 'force', not '{method}'")
+    move_shapes([(shapes[n], x - shapes[n].x, y - shapes[n].y) for n, (x, y) in positions.items()])
+    return positions
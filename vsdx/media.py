@@ -1,18 +1,64 @@
+from __future__ import annotations
+import copy
+import io
 import os
+import threading
+
+from typing import Dict
+from typing import Optional
+
+from xml.etree.ElementTree import Element
+
+from .shapes import Shape
 from .vsdxfile import VisioFile
 
 
 class Media:
+    """Prototype shapes, masters and styles from the media.vsdx file bundled with vsdx
+
+    The media file is read once per process, when a Media object is first created, and closed once its contents are
+    held in memory, to be shared by every Media object. Prototype shapes and their master shapes are found when the file
+    is read, so properties such as :attr:`straight_connector` return without searching. Each property returns a new
+    copy of the prototype shape, so changing it does not change the prototype, i.e. ``Media().rectangle.copy(page)``
+    """
     straight_connector_text = 'STRAIGHT_CONNECTOR'
     curved_connector_text = 'CURVED_CONNECTOR'
     rectangle_text = "RECTANGLE"
     circle_text = "CIRCLE"
 
+    _media_vsdx_cache = None  # type: Optional[VisioFile]  # media file, shared by all Media objects
+    _prototypes = dict()  # type: Dict[str, Shape]  # prototype shape by text
+    _lock = threading.Lock()
+
     def __init__(self):
-        basedir = str(os.path.relpath(__file__))
-        file_path = os.sep.join(basedir.split(os.sep)[:-1])
-        file_path = os.path.join(file_path, 'media', 'media.vsdx')
-        self._media_vsdx = VisioFile(file_path)
+        self._media_vsdx = Media._load()
+
+    @staticmethod
+    def _load() -> VisioFile:
+        with Media._lock:  # open the media file once, even if first used by several threads
+            if Media._media_vsdx_cache is None:
+                basedir = str(os.path.relpath(__file__))
+                file_path = os.sep.join(basedir.split(os.sep)[:-1])
+                file_path = os.path.join(file_path, 'media', 'media.vsdx')
+                media_vsdx = VisioFile(file_path)
+                shapes = [(shape, shape.text) for shape in media_vsdx.pages[0].all_shapes]
+                for text in (Media.straight_connector_text, Media.curved_connector_text, Media.rectangle_text,
+                             Media.circle_text):
+                    # as Page.find_shape_by_text() - the first shape containing text
+                    shape = next((shape for shape, shape_text in shapes if text in shape_text), None)
+                    if shape is not None:
+                        shape.master_shape  # resolve master shape once, cached by its master page
+                    Media._prototypes[text] = shape
+                media_vsdx.close_vsdx()  # contents are held in memory
+                Media._media_vsdx_cache = media_vsdx
+        return Media._media_vsdx_cache
+
+    def _prototype(self, text: str) -> Optional[Shape]:
+        # a copy of the prototype shape, in the media page, so that the shared prototype xml is not changed
+        shape = Media._prototypes.get(text)
+        if shape is None:
+            return None
+        return Shape(xml=copy.deepcopy(shape.xml), parent=shape.parent, page=shape.page)
 
     @property
     def rels_xml(self):
@@ -20,16 +66,31 @@ class Media:
 
     @property
     def straight_connector(self):
-        return self._media_vsdx.pages[0].find_shape_by_text(Media.straight_connector_text)
+        return self._prototype(Media.straight_connector_text)
 
     @property
     def curved_connector(self):
-        return self._media_vsdx.pages[0].find_shape_by_text(Media.straight_connector_text)
+        return self._prototype(Media.straight_connector_text)
 
     @property
     def rectangle(self):
-        return self._media_vsdx.pages[0].find_shape_by_text(Media.rectangle_text)
+        return self._prototype(Media.rectangle_text)
 
     @property
     def circle(self):
-        return self._media_vsdx.pages[0].find_shape_by_text(Media.circle_text)
+        return self._prototype(Media.circle_text)
+
+    def master_files(self) -> Dict[str, io.BytesIO]:
+        """Return a copy of each master file in media, by its path relative to the masters folder
+
+        :return: dict of file like objects by path, i.e. {'masters.xml': BytesIO, 'master1.xml': BytesIO, ...}
+        """
+        masters_folder = self._media_vsdx._masters_folder + '/'
+        return {file_name[len(masters_folder):]: io.BytesIO(file.getvalue())
+                for file_name, file in self._media_vsdx.zip_file_contents.items()
+                if file_name.startswith(masters_folder)}
+
+    def style(self, style_id: str) -> Optional[Element]:
+        """Return a copy of a StyleSheet element from media, by ID, or None if not found"""
+        style = self._media_vsdx._get_style_by_id(style_id)
+        return copy.deepcopy(style) if style is not None else None
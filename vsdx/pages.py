@@ -1,7 +1,12 @@
 from __future__ import annotations
 from enum import IntEnum
 
+from typing import IO
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Tuple
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from .vsdxfile import VisioFile
@@ -11,8 +16,15 @@ import xml.etree.ElementTree as ET
 
 import deprecation
 
+from .cellgraph import CellGraph
 from .connectors import Connect
+from .datatable import data_property_lookup
+from .datatable import update_data_properties
+from .query import ShapeQuery
 from .shapes import Shape
+from .svg import page_svg
+from .svg import write_svg
+from .traversal import walk_shape_xml
 # from .vsdxfile import file_to_xml  # todo: refactor this away - defined in set_name() to break circular imports
 
 from vsdx import namespace, pretty_print_element
@@ -49,6 +61,9 @@ class Page:
         self.rels_xml = None  # type: ET.ElementTree
         self.vis = vis
         self.max_id = 0
+        self._master_data_properties = dict()  # when a master page, master shape properties by master shape ID
+        self._cell_graph = CellGraph(self)  # formula cell dependencies, built when first used
+        self._geometry_moves = 0  # number of Geometry.move() calls in this page, so packed geometry is read again
         # todo: add page id - from pages_xml - PageSheet[ID]
 
     def __repr__(self):
@@ -138,6 +153,12 @@ class Page:
     @xml.setter
     def xml(self, value):
         self._xml = value
+        self._cell_graph.invalidate()
+
+    @property
+    def cell_graph(self) -> CellGraph:
+        """Dependency graph of formula cells in this page, used to recalculate only the cells affected by a change"""
+        return self._cell_graph
 
     @property
     def _shapes(self):
@@ -192,13 +213,48 @@ class Page:
         return self.vis.pages.index(self) if self in self.vis.pages else None
 
     def add_connect(self, connect: Connect):
-        connects = self.xml.find(f".//{namespace}Connects")
-        if connects is None:
-            connects = ET.fromstring(f"<Connects xmlns='{namespace[1:-1]}' xmlns:r='http://schemas.openxmlformats.org/officeDocument/2006/relationships'/>")
-            self.xml.getroot().append(connects)
-            connects = self.xml.find(f".//{namespace}Connects")
+        self.add_connects([connect])
+
+    def add_connects(self, connects: List[Connect]):
+        """Add Connect objects to the page, creating the Connects element if needed"""
+        connects_xml = self.xml.find(f".//{namespace}Connects")
+        if connects_xml is None:
+            connects_xml = ET.fromstring(f"<Connects xmlns='{namespace[1:-1]}' "
+                                         f"xmlns:r='http://schemas.openxmlformats.org/officeDocument/2006/relationships'/>")
+            self.xml.getroot().append(connects_xml)
+            connects_xml = self.xml.find(f".//{namespace}Connects")
+
+        connects_xml.extend(connect.xml for connect in connects)
+        self._cell_graph.invalidate()
+
+    def connect_many(self, pairs: Iterable[Tuple[Shape, Shape]]) -> List[Shape]:
+        """Create a connector between each (from_shape, to_shape) pair of shapes in this page
+
+        Much faster than calling :meth:`Connect.create` for each pair, as the connector master is added to the
+        document once, and connector shapes and Connect elements are added together.
+
+        :param pairs: (from_shape, to_shape) for each new connector
+        :type pairs: iterable of (:class:`Shape`, :class:`Shape`)
 
-        connects.append(connect.xml)
+        :return: list of new connector :class:`Shape` objects, in order of pairs
+        """
+        return Connect.create_many(page=self, pairs=pairs)
+
+    def reroute_connectors(self, moved_shapes: Iterable[Shape] = None) -> List[Shape]:
+        """Reroute connectors glued to moved shapes, so each glued end is at the shape pin or connection point again
+
+        Use after changing shape positions without rerouting, i.e. by editing cell values in xml. Connectors are
+        found from the Connects of the page, read once, rather than from the connects of each moved shape.
+
+        :param moved_shapes: shapes which have moved, including their sub shapes, or None to reroute all connectors
+        :type moved_shapes: iterable of :class:`Shape`
+
+        :return: list of rerouted connector :class:`Shape` objects
+        """
+        shape_ids = None
+        if moved_shapes is not None:
+            shape_ids = {xml.attrib.get('ID') for s in moved_shapes for xml, parent, depth in walk_shape_xml(s.xml)}
+        return self._cell_graph.reroute(shape_ids)
 
     def get_connects(self):
         elements = self.xml.findall(f".//{namespace}Connect")  # search recursively
@@ -274,6 +330,37 @@ class Page:
         # return all shapes in page
         return self._shapes[0].all_shapes if len(self._shapes) else []
 
+    def iter_shapes(self, master: str = None, shape_type: str = None, max_depth: int = None) -> Iterator[Shape]:
+        """Iterate shapes in page at any depth, in document order, creating each Shape only when reached
+
+        :param master: only shapes of this master, by master page ID or master name
+        :type master: str
+        :param shape_type: only shapes with this Type, i.e. 'Group' or 'Shape'
+        :type shape_type: str
+        :param max_depth: only shapes up to max_depth levels deep, where top level shapes are depth 1
+        :type max_depth: int
+        """
+        for shapes in self._shapes:
+            yield from shapes.iter_shapes(master=master, shape_type=shape_type, max_depth=max_depth)
+
+    def query(self) -> ShapeQuery:
+        """Start a :class:`ShapeQuery` for shapes in this page, i.e. ``page.query().master('Router').text('R1').all()``"""
+        return ShapeQuery(self)
+
+    def to_svg(self, file: IO[str] = None, precision: int = 4) -> Optional[str]:
+        """Render the page as SVG, i.e. for a preview - with the outline, colors and text of each shape
+
+        Shapes are read from the page xml in one pass, and SVG is written as each shape is read, so a large page can
+        be streamed to a file or response. See :mod:`vsdx.svg`
+
+        :param file: text file like object to write SVG to, or None to return SVG as a string
+        :param precision: number of decimal places of co-ordinates, which are in inches from the top left of the page
+        :return: SVG string, or None if written to file
+        """
+        if file is None:
+            return page_svg(self, precision)
+        write_svg(self, file, precision)
+
     def find_shape_by_property_label(self, property_label: str) -> Shape:
         """Search for shapes in this page's top shape by property label"""
         # note: use label rather than name as label is more easily visible in diagram
@@ -304,3 +391,19 @@ class Page:
             if found:
                 shapes.extend(found)
         return shapes
+
+    def update_data_properties(self, rows, key: str = 'shape_id') -> List[dict]:
+        """Update data property values of many shapes in this page from rows of a table
+
+        Shapes are looked up once by key, then each row is joined to matching shapes, and each other
+        value in the row is set on the data property with that label.
+
+        :param rows: iterable of dicts of values by property label, or a :class:`DataPropertyTable`
+        :type rows: Iterable[dict] or DataPropertyTable
+        :param key: 'shape_id' or the label of the data property used to match rows to shapes
+        :type key: str
+
+        :return: list of rows which did not match any shape
+        """
+        lookup = data_property_lookup(self.all_shapes, key)
+        return update_data_properties(rows, lookup, key)
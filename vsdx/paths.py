@@ -0,0 +1,498 @@
+"""Export of shape outlines as SVG path data or polylines, for all shapes of a page in one pass
+
+Geometry rows of each shape, including rows inherited from its master shape, are converted to path commands in the
+shape's local co-ordinates, then transformed to page co-ordinates by the shape's PinX, PinY, LocPinX, LocPinY, Angle,
+FlipX and FlipY cells, and those of each group containing it. Arcs, ellipses and quadratic curves become cubic Bézier
+curves, and NURBS and polyline rows become lines.
+
+Rows of master shape geometry are read once per master shape, and the local path of a shape which uses its master
+geometry unchanged is made once per master shape and size - so instances of a master share the path.
+
+Polylines are numpy arrays if numpy is installed.
+"""
+from __future__ import annotations
+import math
+import re
+
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .pages import Page
+
+try:
+    import numpy
+except ImportError:  # numpy is optional
+    numpy = None
+
+from xml.etree.ElementTree import Element
+
+from vsdx import namespace
+from .geometry import geometry_rows
+from .shapes import master_shape_xml
+from .shapes import to_float
+from .traversal import walk_shape_xml
+
+# a path command, one of ('M', (x, y)), ('L', (x, y)) or ('C', (x1, y1, x2, y2, x, y)) - as in SVG path data
+Command = Tuple[str, Tuple[float, ...]]
+# an affine transform (a, b, c, d, e, f), as in SVG matrix(): x' = a*x + c*y + e, y' = b*x + d*y + f
+Transform = Tuple[float, float, float, float, float, float]
+# rows of a Geometry section, as (type(T), {cell name: value}) in order of index(IX)
+Rows = List[Tuple[str, Dict[str, float or str]]]
+
+identity = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)  # type: Transform
+number_regex = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+cell_tag = f'{namespace}Cell'
+section_tag = f'{namespace}Section'
+shapes_tag = f'{namespace}Shapes'
+
+
+class ShapePath:
+    """Outline of a shape, in page co-ordinates - as yielded by :func:`shape_paths`
+
+    :param xml: the Shape element
+    :param master_xml: the master Shape element, or None if the shape has no master
+    :param cells: V attribute of each Cell of the shape by name, including cells inherited from the master shape
+    :param transform: transform from shape local co-ordinates to page co-ordinates
+    :param local_paths: (commands, no_fill, no_line) of each shown Geometry section, in shape local co-ordinates
+    :param depth: 1 for a shape on the page, 2 for a sub shape of a group on the page, and so on
+    :param shared: True if local_paths is shared with other shapes of the same master shape and size
+    """
+    def __init__(self, xml: Element, master_xml: Optional[Element], cells: Dict[str, Optional[str]],
+                 transform: Transform, local_paths: List[Tuple[List[Command], bool, bool]], depth: int,
+                 shared: bool = False):
+        self.xml = xml
+        self.master_xml = master_xml
+        self.cells = cells
+        self.transform = transform
+        self.local_paths = local_paths
+        self.depth = depth
+        self.shared = shared
+        self._paths = None  # type: Optional[List[Tuple[List[Command], bool, bool]]]  # set by paths property
+
+    @property
+    def paths(self) -> List[Tuple[List[Command], bool, bool]]:
+        """(commands, no_fill, no_line) of each shown Geometry section, with commands in page co-ordinates"""
+        if self._paths is None:
+            self._paths = [(transform_path(commands, self.transform), no_fill, no_line)
+                           for commands, no_fill, no_line in self.local_paths]
+        return self._paths
+
+    def __repr__(self):
+        return f"<ShapePath ID={self.ID} paths={len(self.paths)} >"
+
+    @property
+    def ID(self) -> Optional[str]:
+        return self.xml.attrib.get('ID')
+
+    def cell_value(self, name: str) -> Optional[float]:
+        """Value of a cell of the shape as a float, or None if the shape has no such cell"""
+        return to_float(self.cells.get(name))
+
+
+def shape_transform(cells: Dict[str, Optional[str]], parent: Transform = identity) -> Transform:
+    """Transform from shape local co-ordinates to the co-ordinates of parent - the page or containing group
+
+    :param cells: V attribute of each Cell of the shape by name - using PinX, PinY, LocPinX, LocPinY, Angle, FlipX
+      and FlipY, where a missing cell is 0
+    :param parent: transform of the containing group, to return a transform to page co-ordinates
+    """
+    def value(name):
+        return to_float(cells.get(name)) or 0.0
+    angle = value('Angle')  # radians
+    cos, sin = math.cos(angle), math.sin(angle)
+    flip_x = -1.0 if value('FlipX') else 1.0  # flips are about the local pin, before rotation
+    flip_y = -1.0 if value('FlipY') else 1.0
+    a, b, c, d = cos * flip_x, sin * flip_x, -sin * flip_y, cos * flip_y
+    loc_x, loc_y = value('LocPinX'), value('LocPinY')
+    return compose(parent, (a, b, c, d, value('PinX') - a * loc_x - c * loc_y, value('PinY') - b * loc_x - d * loc_y))
+
+
+def compose(outer: Transform, inner: Transform) -> Transform:
+    """Transform applying inner, then outer"""
+    a1, b1, c1, d1, e1, f1 = outer
+    a2, b2, c2, d2, e2, f2 = inner
+    return (a1 * a2 + c1 * b2, b1 * a2 + d1 * b2, a1 * c2 + c1 * d2, b1 * c2 + d1 * d2,
+            a1 * e2 + c1 * f2 + e1, b1 * e2 + d1 * f2 + f1)
+
+
+def transform_path(commands: List[Command], transform: Transform) -> List[Command]:
+    """Return path commands with every point transformed"""
+    a, b, c, d, e, f = transform
+    result = []
+    for op, points in commands:
+        if len(points) == 2:
+            x, y = points
+            result.append((op, (a * x + c * y + e, b * x + d * y + f)))
+        else:
+            transformed = []
+            for x, y in zip(points[0::2], points[1::2]):
+                transformed.append(a * x + c * y + e)
+                transformed.append(b * x + d * y + f)
+            result.append((op, tuple(transformed)))
+    return result
+
+
+def geometry_path(rows: Rows, width: float, height: float) -> List[Command]:
+    """Convert the rows of a Geometry section to path commands, in shape local co-ordinates
+
+    SplineStart and SplineKnot rows are drawn as lines to each knot, and InfiniteLine rows are not drawn.
+
+    :param rows: (type(T), {cell name: value}) of each row, in order of index(IX)
+    :param width: shape width, for Rel rows and relative NURBS and polyline points
+    :param height: shape height
+    """
+    commands = []  # type: List[Command]
+    x0 = y0 = 0.0  # current point
+    for row_type, values in rows:
+        def value(name):
+            v = values.get(name)
+            return v if type(v) is float else 0.0
+        x, y = value('X'), value('Y')
+        if row_type and row_type.startswith('Rel'):
+            x, y = x * width, y * height
+        if row_type not in ('MoveTo', 'RelMoveTo', 'Ellipse', 'InfiniteLine') and not commands:
+            commands.append(('M', (x0, y0)))  # path starts at local origin if there is no MoveTo row
+
+        if row_type in ('MoveTo', 'RelMoveTo'):
+            commands.append(('M', (x, y)))
+        elif row_type in ('LineTo', 'RelLineTo', 'SplineStart', 'SplineKnot'):
+            commands.append(('L', (x, y)))
+        elif row_type == 'ArcTo':
+            bow = value('A')
+            chord = math.hypot(x - x0, y - y0)
+            if abs(bow) < 1e-12 or chord < 1e-12:
+                commands.append(('L', (x, y)))
+            else:  # positive bow is counter clockwise, so the arc midpoint is to the right of the chord
+                mid = ((x0 + x) / 2 + bow * (y - y0) / chord, (y0 + y) / 2 - bow * (x - x0) / chord)
+                commands.extend(_arc_commands((x0, y0), mid, (x, y)))
+        elif row_type in ('EllipticalArcTo', 'RelEllipticalArcTo'):
+            control = (value('A'), value('B'))
+            if row_type == 'RelEllipticalArcTo':
+                control = (control[0] * width, control[1] * height)
+            commands.extend(_elliptical_arc_commands((x0, y0), control, (x, y), value('C'), value('D')))
+        elif row_type == 'RelCubBezTo':
+            commands.append(('C', (value('A') * width, value('B') * height, value('C') * width,
+                                   value('D') * height, x, y)))
+        elif row_type == 'RelQuadBezTo':
+            qx, qy = value('A') * width, value('B') * height
+            commands.append(('C', (x0 + 2 / 3 * (qx - x0), y0 + 2 / 3 * (qy - y0),
+                                   x + 2 / 3 * (qx - x), y + 2 / 3 * (qy - y), x, y)))
+        elif row_type == 'PolylineTo':
+            for point in _polyline_points(values.get('A'), width, height):
+                commands.append(('L', point))
+            commands.append(('L', (x, y)))
+        elif row_type == 'NURBSTo':
+            for point in _nurbs_points((x0, y0), (x, y), values, width, height):
+                commands.append(('L', point))
+        elif row_type == 'Ellipse':  # a closed path of its own, centre X, Y, through A, B and C, D
+            ux, uy, vx, vy = value('A') - x, value('B') - y, value('C') - x, value('D') - y
+            commands.extend(_ellipse_commands((x, y), (ux, uy), (vx, vy)))
+            continue  # current point is unchanged
+        else:
+            continue  # InfiniteLine, or not a drawing row
+        x0, y0 = x, y
+    return commands
+
+
+def _arc_commands(start: Tuple[float, float], through: Tuple[float, float],
+                  end: Tuple[float, float]) -> List[Command]:
+    # arc of the circle through three points, from start to end through the middle point, as cubic Bézier curves
+    (x1, y1), (x2, y2), (x3, y3) = start, through, end
+    det = 2 * (x1 * (y2 - y3) + x2 * (y3 - y1) + x3 * (y1 - y2))
+    if abs(det) < 1e-12:  # points in a line
+        return [('L', end)]
+    s1, s2, s3 = x1 * x1 + y1 * y1, x2 * x2 + y2 * y2, x3 * x3 + y3 * y3
+    cx = (s1 * (y2 - y3) + s2 * (y3 - y1) + s3 * (y1 - y2)) / det
+    cy = (s1 * (x3 - x2) + s2 * (x1 - x3) + s3 * (x2 - x1)) / det
+    radius = math.hypot(x1 - cx, y1 - cy)
+    a1, a2, a3 = (math.atan2(y - cy, x - cx) for x, y in (start, through, end))
+    sweep = (a3 - a1) % (2 * math.pi)
+    if (a2 - a1) % (2 * math.pi) > sweep:  # clockwise, to pass through the middle point
+        sweep -= 2 * math.pi
+    count = max(1, math.ceil(abs(sweep) / (math.pi / 2) - 1e-9))
+    step = sweep / count
+    k = 4 / 3 * math.tan(step / 4) * radius
+    commands = []
+    angle = a1
+    for i in range(count):
+        next_angle = angle + step
+        px, py = cx + radius * math.cos(angle), cy + radius * math.sin(angle)
+        qx, qy = (cx + radius * math.cos(next_angle), cy + radius * math.sin(next_angle)) if i < count - 1 else end
+        commands.append(('C', (px - k * math.sin(angle), py + k * math.cos(angle),
+                               qx + k * math.sin(next_angle), qy - k * math.cos(next_angle), qx, qy)))
+        angle = next_angle
+    return commands
+
+
+def _elliptical_arc_commands(start: Tuple[float, float], control: Tuple[float, float], end: Tuple[float, float],
+                             angle: float, ratio: float) -> List[Command]:
+    # arc of an ellipse from start to end through control, with major axis at angle and ratio of major to minor axis
+    if not ratio or math.isnan(ratio):
+        return [('L', end)]
+    cos, sin = math.cos(angle), math.sin(angle)
+    # to and from co-ordinates where the ellipse is a circle - major axis along x, scaled by 1 / ratio
+    to_circle = (cos / ratio, -sin, sin / ratio, cos, 0.0, 0.0)
+    from_circle = (cos * ratio, sin * ratio, -sin, cos, 0.0, 0.0)
+    points = transform_path([('M', start + control + end)], to_circle)[0][1]
+    commands = _arc_commands(points[0:2], points[2:4], points[4:6])
+    commands = transform_path(commands, from_circle)
+    op, points = commands[-1]
+    commands[-1] = (op, points[:-2] + tuple(end))  # end exactly at end point
+    return commands
+
+
+def _ellipse_commands(centre: Tuple[float, float], u: Tuple[float, float], v: Tuple[float, float]) -> List[Command]:
+    # closed ellipse centre + u*cos(t) + v*sin(t), as four cubic Bézier curves
+    k = 4 / 3 * (math.sqrt(2) - 1)
+    cx, cy = centre
+    points = [(u[0], u[1]), (v[0], v[1]), (-u[0], -u[1]), (-v[0], -v[1]), (u[0], u[1])]
+    commands = [('M', (cx + u[0], cy + u[1]))]
+    for (px, py), (qx, qy) in zip(points, points[1:]):
+        # tangent at p is in the direction of q, and at q in the direction of -p
+        commands.append(('C', (cx + px + k * qx, cy + py + k * qy, cx + qx + k * px, cy + qy + k * py,
+                               cx + qx, cy + qy)))
+    return commands
+
+
+def _formula_numbers(formula: Optional[str], name: str) -> List[float]:
+    # numbers in a NURBS() or POLYLINE() formula, or [] if the formula is missing or another function
+    if type(formula) is not str or not formula.strip().upper().startswith(name):
+        return []
+    return [float(n) for n in number_regex.findall(formula)]
+
+
+def _polyline_points(formula: Optional[str], width: float, height: float) -> List[Tuple[float, float]]:
+    # points of POLYLINE(xType, yType, x1, y1, x2, y2, ...), where type 0 is relative to width or height
+    numbers = _formula_numbers(formula, 'POLYLINE')
+    if len(numbers) < 2:
+        return []
+    x_scale = width if numbers[0] == 0 else 1.0
+    y_scale = height if numbers[1] == 0 else 1.0
+    return [(x * x_scale, y * y_scale) for x, y in zip(numbers[2::2], numbers[3::2])]
+
+
+def _nurbs_points(start: Tuple[float, float], end: Tuple[float, float], values: Dict[str, float or str],
+                  width: float, height: float, steps: int = 8) -> List[Tuple[float, float]]:
+    # points along a NURBSTo row, from E = NURBS(knotLast, degree, xType, yType, x1, y1, knot1, weight1, ...), with
+    # first knot C and weight D at start, and second to last knot A and last weight B at end (X, Y)
+    numbers = _formula_numbers(values.get('E'), 'NURBS')
+    if len(numbers) < 4:
+        return [end]
+
+    def value(name, default):
+        v = values.get(name)
+        return v if type(v) is float else default
+    knot_last, degree = numbers[0], int(numbers[1])
+    x_scale = width if numbers[2] == 0 else 1.0
+    y_scale = height if numbers[3] == 0 else 1.0
+    quads = numbers[4:]
+    points = [start] + [(x * x_scale, y * y_scale) for x, y in zip(quads[0::4], quads[1::4])] + [end]
+    weights = [value('D', 1.0)] + quads[3::4] + [value('B', 1.0)]
+    knots = [value('C', 0.0)] + quads[2::4] + [value('A', knot_last)] + [knot_last] * (degree + 1)
+    count = len(points)
+    if degree < 1 or len(weights) != count or len(knots) != count + degree + 1:
+        return [end]
+
+    result = []
+    for span in range(degree, count):
+        low, high = knots[span], knots[span + 1]
+        if high <= low:
+            continue
+        for step in range(1, steps + 1):
+            u = low + (high - low) * step / steps
+            # de Boor's algorithm, in homogeneous co-ordinates
+            d = [(points[j][0] * weights[j], points[j][1] * weights[j], weights[j])
+                 for j in range(span - degree, span + 1)]
+            for r in range(1, degree + 1):
+                for j in range(degree, r - 1, -1):
+                    left, right = knots[j + span - degree], knots[j + 1 + span - r]
+                    alpha = (u - left) / (right - left) if right > left else 0.0
+                    d[j] = tuple((1 - alpha) * p + alpha * q for p, q in zip(d[j - 1], d[j]))
+            x, y, w = d[degree]
+            result.append((x / w, y / w) if w else end)
+    if result:
+        result[-1] = end
+    return result or [end]
+
+
+def _shape_parts(xml: Optional[Element]) -> Tuple[Dict[str, Optional[str]], List[Element], bool]:
+    # (cell values by name, Geometry Section elements, True if a group) of a Shape element, in one pass over its children
+    cells = dict()
+    sections = []
+    group = False
+    if xml is None:
+        return cells, sections, group
+    for child in xml:
+        tag = child.tag
+        if tag == cell_tag:
+            attrib = child.attrib
+            cells[attrib.get('N')] = attrib.get('V')
+        elif tag == section_tag:
+            if child.attrib.get('N') == 'Geometry':
+                sections.append(child)
+        elif tag == shapes_tag:
+            group = True
+    return cells, sections, group
+
+
+def _geometry_sections(sections: List[Element], inherited: Dict[str, tuple] = None) -> Dict[str, tuple]:
+    # ({section cell name: value}, rows by IX) of each Geometry section of a shape by section IX, over-riding inherited
+    result = dict(inherited) if inherited else dict()
+    for section in sections:
+        index = section.attrib.get('IX', '0')
+        if section.attrib.get('Del'):
+            result.pop(index, None)
+            continue
+        section_cells, rows = result.get(index, (dict(), None))
+        section_cells = dict(section_cells)
+        section_cells.update(_shape_parts(section)[0])
+        result[index] = (section_cells, geometry_rows(section, rows))
+    return result
+
+
+def _local_paths(sections: Dict[str, tuple], width: float, height: float) -> List[Tuple[List[Command], bool, bool]]:
+    # (commands, no_fill, no_line) of each shown section, in order of section IX
+    paths = []
+    for index, (section_cells, rows) in sorted(sections.items(), key=lambda s: to_float(s[0]) or 0.0):
+        if to_float(section_cells.get('NoShow')):
+            continue
+        ordered = [row for ix, row in sorted(rows.items(), key=lambda r: to_float(r[0]) or 0.0)]
+        commands = geometry_path(ordered, width, height)
+        if commands:
+            paths.append((commands, bool(to_float(section_cells.get('NoFill'))),
+                          bool(to_float(section_cells.get('NoLine')))))
+    return paths
+
+
+def shape_paths(page: Page, transform: Transform = identity) -> Iterator[ShapePath]:
+    """Yield a :class:`ShapePath` for each shape of a page, and each sub shape of a group, in document order
+
+    Shapes are read from the page xml in one pass, without creating :class:`Shape` objects. Paths in page
+    co-ordinates are only made when :attr:`ShapePath.paths` is used.
+
+    :param page: the :class:`Page`
+    :param transform: transform from page co-ordinates to output co-ordinates, i.e. (1, 0, 0, -1, 0, page.height)
+      for SVG co-ordinates with y down the page
+    """
+    vis = page.vis
+    masters = dict()  # (master ID, master shape ID): (master shape xml, cells, geometry sections)
+    local_paths = dict()  # (master ID, master shape ID, width, height): local paths of shapes using master geometry
+    parents = dict()  # group Shape element: (transform, master ID), for its sub shapes
+    for shapes in page.xml.findall(f'{namespace}Shapes'):
+        for xml, parent, depth in walk_shape_xml(shapes, include_root=False):
+            parent_transform, master_id = parents.get(parent, (transform, None))
+            master_id = xml.attrib.get('Master', master_id)
+            key = (master_id, xml.attrib.get('MasterShape'))
+            if key not in masters:
+                master_xml = master_shape_xml(vis, master_id, key[1]) if master_id is not None else None
+                master_cells, master_sections, master_group = _shape_parts(master_xml)
+                masters[key] = (master_xml, master_cells, _geometry_sections(master_sections))
+            master_xml, master_cells, master_sections = masters[key]
+
+            shape_cells, sections, group = _shape_parts(xml)
+            cells = dict(master_cells)
+            cells.update(shape_cells)
+            shape_to_page = shape_transform(cells, parent_transform)
+            width, height = to_float(cells.get('Width')) or 0.0, to_float(cells.get('Height')) or 0.0
+            if not sections:  # master geometry unchanged
+                path_key = key + (width, height)
+                if path_key not in local_paths:
+                    local_paths[path_key] = _local_paths(master_sections, width, height)
+                paths = local_paths[path_key]
+            else:
+                paths = _local_paths(_geometry_sections(sections, master_sections), width, height)
+
+            if group:
+                parents[xml] = (shape_to_page, master_id)
+            yield ShapePath(xml=xml, master_xml=master_xml, cells=cells, transform=shape_to_page, local_paths=paths,
+                            depth=depth, shared=not sections)
+
+
+def svg_number(value: float, precision: int = 4) -> str:
+    """Format a number for svg, rounded to precision decimal places, i.e. 1 rather than 1.0, and 0 rather than -0.0"""
+    text = repr(round(value, precision) + 0.0)
+    return text[:-2] if text.endswith('.0') else text
+
+
+def svg_path_data(commands: Iterable[Command], precision: int = 4) -> str:
+    """SVG path data for path commands, i.e. 'M0 0 L1 0 L1 1 Z', closing each sub path which ends where it starts
+
+    :param commands: path commands, as from :func:`geometry_path` or :attr:`ShapePath.paths`
+    :param precision: number of decimal places
+    """
+    parts = []
+    start = None
+    last = None
+    for op, points in commands:
+        if op == 'M':
+            if start is not None and last == start:
+                parts.append('Z')
+            start = points
+        parts.append(op + ' '.join([svg_number(v, precision) for v in points]))
+        last = points[-2:]
+    if start is not None and last == start and len(parts) > 1:
+        parts.append('Z')
+    return ' '.join(parts)
+
+
+def polylines(commands: Iterable[Command], curve_points: int = 8, use_numpy: bool = None) -> list:
+    """Points of each sub path of path commands, with curves as curve_points lines
+
+    :param commands: path commands, as from :func:`geometry_path` or :attr:`ShapePath.paths`
+    :param curve_points: number of points along each cubic Bézier curve
+    :param use_numpy: return numpy arrays of shape (points, 2), or lists of (x, y) if False - or None to use numpy if
+      it is installed
+    :return: list of sub paths
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if use_numpy and numpy is None:
+        raise ImportError("polylines(use_numpy=True) requires numpy")
+    lines = []
+    line = None
+    for op, points in commands:
+        if op == 'M' or line is None:
+            line = [points[-2:]]
+            lines.append(line)
+        elif op == 'L':
+            line.append(points)
+        else:  # cubic Bézier curve from the last point
+            (x0, y0), (x1, y1, x2, y2, x3, y3) = line[-1], points
+            for i in range(1, curve_points + 1):
+                t = i / curve_points
+                s = 1 - t
+                line.append((s * s * s * x0 + 3 * s * s * t * x1 + 3 * s * t * t * x2 + t * t * t * x3,
+                             s * s * s * y0 + 3 * s * s * t * y1 + 3 * s * t * t * y2 + t * t * t * y3))
+    if use_numpy:
+        return [numpy.array(line, dtype=float).reshape(-1, 2) for line in lines]
+    return lines
+
+
+def page_svg_paths(page: Page, precision: int = 4) -> Dict[str, str]:
+    """SVG path data of each shape of a page with a shown geometry, by shape ID - in SVG co-ordinates, in inches from
+    the top left of the page. Paths of each Geometry section of a shape are joined in one path.
+
+    :param page: the :class:`Page`
+    :param precision: number of decimal places
+    """
+    return {shape.ID: ' '.join(svg_path_data(commands, precision) for commands, no_fill, no_line in shape.paths)
+            for shape in shape_paths(page, transform=(1.0, 0.0, 0.0, -1.0, 0.0, page.height)) if shape.paths}
+
+
+def page_polylines(page: Page, curve_points: int = 8, use_numpy: bool = None) -> Dict[str, list]:
+    """Polylines of each shape of a page with a shown geometry, by shape ID - in page co-ordinates, with y up the page
+
+    :param page: the :class:`Page`
+    :param curve_points: number of points along each curve
+    :param use_numpy: see :func:`polylines`
+    :return: list of polylines of each shape, each a numpy array of shape (points, 2) or list of (x, y)
+    """
+    return {shape.ID: [line for commands, no_fill, no_line in shape.paths
+                       for line in polylines(commands, curve_points, use_numpy)]
+            for shape in shape_paths(page) if shape.paths}
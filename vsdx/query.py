@@ -0,0 +1,205 @@
+from __future__ import annotations
+import re
+
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .pages import Page
+    from .shapes import Shape
+    from .vsdxfile import VisioFile
+
+from xml.etree.ElementTree import Element
+
+import vsdx
+from vsdx import namespace
+from .datatable import merge_property_rows
+from .datatable import shape_property_rows
+from .shapes import master_shape_xml
+
+# a compiled condition, called with (shape xml, master page ID, master shape xml lookup)
+Condition = Callable[[Element, Optional[str], Callable[[Element, Optional[str]], Optional[Element]]], bool]
+
+
+class ShapeQuery:
+    """A query for shapes matching all of a set of conditions, tested in a single pass over the shape xml
+
+    Build a query by chaining condition methods, then iterate over it, or use :meth:`first` or :meth:`all`::
+
+        routers = page.query().master('Router').property('Site', 'X').text_regex(r'^R\\d+').all()
+
+    Conditions are compiled into functions of the shape xml, which include values inherited from the master shape,
+    and are tested cheapest first. A :class:`Shape` is only created for a shape that matches every condition.
+
+    :param target: the :class:`Page`, :class:`VisioFile` or :class:`Shape` to search, or None to pass it to :meth:`run`
+    """
+    def __init__(self, target: Page or VisioFile or Shape = None):
+        self.target = target
+        self._conditions = list()  # type: List[Tuple[int, Callable]]  # (cost, function to compile condition)
+        self._filters = list()  # type: List[Callable[[Shape], bool]]
+
+    def __repr__(self):
+        return f"<ShapeQuery target={self.target} conditions={len(self._conditions) + len(self._filters)} >"
+
+    def __iter__(self) -> Iterator[Shape]:
+        return self.run()
+
+    def master(self, master: str) -> ShapeQuery:
+        """Match shapes of a master, by master page ID or master name"""
+        def compile_condition(vis: VisioFile) -> Condition:
+            master_page = vis.master_index.get(master)
+            master_ids = {master, master_page.page_id} if master_page else {master}
+            return lambda xml, master_id, masters: master_id in master_ids
+        self._conditions.append((0, compile_condition))
+        return self
+
+    def name(self, name: str) -> ShapeQuery:
+        """Match shapes by name, using the NameU (universal name) attribute, or Name if no NameU"""
+        self._conditions.append((0, lambda vis: lambda xml, master_id, masters:
+                                 (xml.attrib.get('NameU') or xml.attrib.get('Name')) == name))
+        return self
+
+    def attribute(self, attr: str, value: str) -> ShapeQuery:
+        """Match shapes with a Shape element attribute value, i.e. attribute('Type', 'Group')"""
+        self._conditions.append((0, lambda vis: lambda xml, master_id, masters: str(xml.attrib.get(attr)) == value))
+        return self
+
+    def text(self, text: str) -> ShapeQuery:
+        """Match shapes whose text contains text"""
+        self._conditions.append((1, lambda vis: lambda xml, master_id, masters:
+                                 text in _shape_text(xml, masters(xml, master_id))))
+        return self
+
+    def text_regex(self, regex: str) -> ShapeQuery:
+        """Match shapes whose text matches a regular expression, using re.search()"""
+        pattern = re.compile(regex)
+        self._conditions.append((1, lambda vis: lambda xml, master_id, masters:
+                                 pattern.search(_shape_text(xml, masters(xml, master_id))) is not None))
+        return self
+
+    def property(self, label: str, value: str = None) -> ShapeQuery:
+        """Match shapes with a data property label, and if value is given, with that property value"""
+        def condition(xml: Element, master_id: Optional[str], masters) -> bool:
+            properties = _shape_properties(xml, masters(xml, master_id))
+            if label not in properties:
+                return False
+            return value is None or str(properties[label]) == str(value)
+        self._conditions.append((2, lambda vis: condition))
+        return self
+
+    def bounds(self, x_min: float, y_min: float, x_max: float, y_max: float, overlap: bool = False) -> ShapeQuery:
+        """Match shapes within a rectangle, or overlapping it if overlap is True, using the same bounds as
+        :attr:`Shape.bounds`
+        """
+        def condition(xml: Element, master_id: Optional[str], masters) -> bool:
+            shape_bounds = _shape_bounds(xml, masters(xml, master_id))
+            if shape_bounds is None:
+                return False
+            bx, by, ex, ey = shape_bounds
+            left, right, bottom, top = min(bx, ex), max(bx, ex), min(by, ey), max(by, ey)
+            if overlap:
+                return left <= x_max and right >= x_min and bottom <= y_max and top >= y_min
+            return left >= x_min and right <= x_max and bottom >= y_min and top <= y_max
+        self._conditions.append((3, lambda vis: condition))
+        return self
+
+    def copy(self) -> ShapeQuery:
+        """Return a new query with the same target and conditions, which can be extended without changing this one"""
+        query = ShapeQuery(self.target)
+        query._conditions = list(self._conditions)
+        query._filters = list(self._filters)
+        return query
+
+    def where(self, predicate: Callable[[Shape], bool]) -> ShapeQuery:
+        """Match shapes where predicate(shape) is True - tested on Shape objects, after all other conditions"""
+        self._filters.append(predicate)
+        return self
+
+    def compile(self, vis: VisioFile) -> Callable[[Element, Optional[str]], bool]:
+        """Compile the xml conditions of the query for a VisioFile, to a function of (shape xml, master page ID)"""
+        conditions = [compile_condition(vis) for cost, compile_condition in
+                      sorted(self._conditions, key=lambda c: c[0])]  # stable sort keeps order of equal cost
+        master_shapes = dict()  # type: Dict[Tuple[str, str], Optional[Element]]
+
+        def masters(xml: Element, master_id: Optional[str]) -> Optional[Element]:
+            # master shape xml of a shape, looked up once per master shape
+            key = (master_id, xml.attrib.get('MasterShape'))
+            if key not in master_shapes:
+                master_shapes[key] = master_shape_xml(vis, master_id, key[1])
+            return master_shapes[key]
+
+        return lambda xml, master_id: all(c(xml, master_id, masters) for c in conditions)
+
+    def run(self, target: Page or VisioFile or Shape = None) -> Iterator[Shape]:
+        """Iterate the shapes in target, or in the query target, matching the query"""
+        target = target if target is not None else self.target
+        if target is None:
+            raise ValueError("ShapeQuery.run() requires a Page, VisioFile or Shape to search")
+        if isinstance(target, vsdx.VisioFile):
+            vis, roots = target, [s for page in target.pages for s in page._shapes]
+        elif isinstance(target, vsdx.Page):
+            vis, roots = target.vis, target._shapes
+        else:
+            vis, roots = target.page.vis, [target]
+        match = self.compile(vis)
+        for root in roots:
+            for shape in root._iter_shapes(match):
+                if all(f(shape) for f in self._filters):
+                    yield shape
+
+    def first(self) -> Optional[Shape]:
+        """Return the first matching shape, or None - without searching any further"""
+        return next(self.run(), None)
+
+    def all(self) -> List[Shape]:
+        """Return a list of all matching shapes"""
+        return list(self.run())
+
+    def all_in(self, target: Page or VisioFile or Shape) -> List[Shape]:
+        """Return a list of all matching shapes in target"""
+        return list(self.run(target))
+
+
+def _shape_text(xml: Element, master_xml: Optional[Element]) -> str:
+    # as Shape.text - the text of the shape, or of its master shape
+    for e in (xml, master_xml):
+        text_xml = e.find(f'{namespace}Text') if e is not None else None
+        if text_xml is not None:
+            return "".join(text_xml.itertext())
+    return ""
+
+
+def _shape_properties(xml: Element, master_xml: Optional[Element]) -> Dict[str, Optional[str]]:
+    # as Shape.data_properties - property values by label, with values and labels inherited from master shape
+    master_rows = shape_property_rows(master_xml) if master_xml is not None else []
+    rows = merge_property_rows(master_rows, shape_property_rows(xml))  # name: [label, value]
+    return {label: value for label, value in rows.values() if label}
+
+
+def _cell_value(xml: Element, master_xml: Optional[Element], name: str) -> Optional[float]:
+    for e in (xml, master_xml):
+        cell = e.find(f'{namespace}Cell[@N="{name}"]') if e is not None else None
+        if cell is not None:
+            return vsdx.shapes.to_float(cell.attrib.get('V'))
+    return None
+
+
+def _shape_bounds(xml: Element, master_xml: Optional[Element]) -> Optional[Tuple[float, float, float, float]]:
+    # as Shape.bounds, or None if the shape has no bounds
+    def cell(name):
+        return _cell_value(xml, master_xml, name)
+    begin_x, x, loc_x = cell('BeginX'), cell('PinX'), cell('LocPinX')
+    if begin_x is None and x is None and loc_x is None:
+        return None
+    try:
+        bx = begin_x or (x - loc_x)
+        by = cell('BeginY') or (cell('PinY') - cell('LocPinY'))
+        ex = cell('EndX') or (bx + cell('Width'))
+        ey = cell('EndY') or (by + cell('Height'))
+    except TypeError:  # a cell needed is missing
+        return None
+    return bx, by, ex, ey
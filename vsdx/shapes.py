@@ -2,15 +2,22 @@ from __future__ import annotations
 
 import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import Element
+import copy
 import re
+import weakref
 
+from typing import Callable
 from typing import Dict
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Tuple
 
 import deprecation
 import vsdx
 from vsdx import namespace
+from .traversal import walk
+from .traversal import walk_shape_xml
 
 shape_type_names = {  # a map from English language shape to a list of know names for that Shape type
     # note that Shape names may be appended with a number e.g. 'Dynamischer Verbinder.2'
@@ -62,71 +69,113 @@ class Cell:
 
 
 class DataProperty:
-    """Represents a single Data Property item associated with a Shape object"""
-    def __init__(self, *, xml: Element, shape: Shape):
-        """init a DataProperty from a property xml element in a Shape object"""
-        name = xml.attrib.get('N')
-        # get Cell element for each property of DataProperty
-        label_cell = xml.find(f'{namespace}Cell[@N="Label"]')
+    """Represents a single Data Property item associated with a Shape object
 
+    A property inherited from a master shape, without a Row in the shape xml, has xml of None and reads the
+    master property value. Setting the value of an inherited property creates a Row in the shape (copy on write),
+    so the master shape and other shapes using the same master are unchanged.
+    """
+    def __init__(self, *, xml: Optional[Element], shape: Shape, master_property: Optional[DataProperty] = None):
+        """init a DataProperty from a property xml element in a Shape object
+
+        :param xml: the Row element of the property in the shape, or None for a property inherited from master
+        :param master_property: the matching master shape property, if known - otherwise looked up by name if needed
+        """
         # initialise empty DataProperty properties
         self.shape = shape  # reference back to Shape object
         self.xml = xml  # reference to xml used to create DataProperty
-        self.name = name
+        self.name = xml.attrib.get('N') if xml is not None else master_property.name
         self.value_type = None
         self.label = None
         self.prompt = None
         self.sort_key = None
+        self.master_property = master_property
+        self._value = DataProperty._not_read  # cached value, read on first access
 
-        self.shape = shape  # reference back to Shape object
-        self.xml = xml  # reference to xml used to create DataProperty
-
-        if isinstance(label_cell, Element):
-            value_type_cell = xml.find(f'{namespace}Cell[@N="Type"]')
-            prompt_cell = xml.find(f'{namespace}Cell[@N="Prompt"]')
-            sort_key_cell = xml.find(f'{namespace}Cell[@N="SortKey"]')
+        # get Cell element for each property of DataProperty, in one pass of the row
+        self._cells = {c.attrib.get('N'): c for c in xml.iterfind(f'{namespace}Cell')} \
+            if xml is not None else dict()  # type: Dict[str, Element]
 
+        if 'Label' in self._cells:
             # get values from each Cell Element
-            self.value_type = value_type_cell.attrib.get('V') if isinstance(value_type_cell, Element) else None
-            self.label = label_cell.attrib.get('V') if isinstance(label_cell, Element) else None
-            self.prompt = prompt_cell.attrib.get('V') if isinstance(prompt_cell, Element) else None
-            self.sort_key = sort_key_cell.attrib.get('V') if isinstance(sort_key_cell, Element) else None
+            self.value_type = self._cell_value('Type')
+            self.label = self._cell_value('Label')
+            self.prompt = self._cell_value('Prompt')
+            self.sort_key = self._cell_value('SortKey')
         else:
             # over-ridden master shape properties have no label - only a name and value
-            master_props = [p for p in shape.master_shape.data_properties.values()
-                           if p.name == name]
-            if master_props:
-                # get first match 0 - there should always be one item
-                master_prop = master_props[0]  # type: DataProperty
+            if self.master_property is None and shape.master_shape:
+                self.master_property = shape.master_shape._data_properties_by_name().get(self.name)
+            master_prop = self.master_property
+            if master_prop:
                 self.label = master_prop.label
                 self.value_type = master_prop.value_type
                 self.prompt = master_prop.prompt
                 self.sort_key = master_prop.sort_key
 
+    _not_read = object()  # marker for a value not yet read from xml
+
+    def _cell_value(self, name: str) -> Optional[str]:
+        cell = self._cells.get(name)
+        return cell.attrib.get('V') if cell is not None else None
+
+    @property
+    def is_inherited(self) -> bool:
+        """True if the value of this property is read from the master shape property"""
+        return 'Value' not in self._cells and self.master_property is not None
+
     @property
     def value(self):
-        """Get the value of the data property"""
-        value_cell = self.xml.find(f'{namespace}Cell[@N="Value"]')
-        value = None
+        """Get the value of the data property - reading the value does not alter the xml"""
+        if self.is_inherited:
+            return self.master_property._read_value()  # not cached, so master changes are always seen
+        if self._value is DataProperty._not_read:
+            self._value = self._read_value()
+        return self._value
+
+    def _read_value(self):
+        value_cell = self._cells.get('Value')
         if isinstance(value_cell, Element):
             if value_cell.attrib.get('V') is not None:
-                value = value_cell.attrib.get('V')  # populate value from V attribute
-                if self.get_attribute('Value', 'F') == 'No Formula':
-                    self.remove_attribute('Value', 'F')  # clean up 'No Formula' attribute if present
-                    self.set_attribute('Value', 'U', 'STR')  # set type to string
+                return value_cell.attrib.get('V')  # populate value from V attribute
             elif value_cell.text:
-                value = value_cell.text  # populate value from element inner text
-        return value
+                return value_cell.text  # populate value from element inner text
+        elif self.master_property:
+            return self.master_property._read_value()
 
     @value.setter
     def value(self, value):
         """Set the value of the data property"""
-        value_cell = self.xml.find(f'{namespace}Cell[@N="Value"]')
+        if self.is_inherited:
+            self._create_value_cell()
+        value_cell = self._cells.get('Value')
         if isinstance(value_cell, Element):
             if value_cell.attrib.get('V') is not None:
                 value_cell.attrib['V'] = value  # populate value in V attribute
             elif value_cell.text:
                 value_cell.text = value  # populate value in element inner text
+            normalize_value_cell(value_cell)
+        self._value = DataProperty._not_read
+
+    def _create_value_cell(self):
+        # copy on write - add a Row (if needed) and Value Cell to the shape, based on the master Value Cell
+        if self.xml is None:
+            section = self.shape.xml.find(f'{namespace}Section[@N="Property"]')
+            if section is None:
+                section = Element(f'{namespace}Section', {'N': 'Property'})
+                text = self.shape.xml.find(f'{namespace}Text')  # Sections are placed before any Text element
+                if text is not None:
+                    self.shape.xml.insert(list(self.shape.xml).index(text), section)
+                else:
+                    self.shape.xml.append(section)
+            self.xml = ET.SubElement(section, f'{namespace}Row', {'N': self.name})
+        master_cell = self.master_property._cells.get('Value')
+        value_cell = copy.deepcopy(master_cell) if master_cell is not None else Element(f'{namespace}Cell', {'N': 'Value'})
+        value_cell.attrib.pop('F', None)  # instance value replaces any master formula
+        if value_cell.attrib.get('V') is None and not value_cell.text:
+            value_cell.attrib['V'] = ''
+        self.xml.append(value_cell)
+        self._cells['Value'] = value_cell
 
     def get_attribute(self, name: str, attrib: str) -> Optional[str]:
         """Get the attribute value of the cell element"""
@@ -139,6 +188,7 @@ class DataProperty:
         element = self._get_element(name)
         if isinstance(element, Element):
             element.attrib[attrib] = value
+            self._value = DataProperty._not_read
             return True
         return False
         
@@ -148,13 +198,110 @@ class DataProperty:
         if isinstance(element, Element):
             if attrib in element.attrib:
                 del element.attrib[attrib]
+                self._value = DataProperty._not_read
                 return True
         return False
 
     def _get_element(self, name: str) -> Optional[Element]:
         """Get the value of the data property as an xml element"""
-        element = self.xml.find(f'{namespace}Cell[@N="{name}"]')
-        return element
+        return self._cells.get(name)
+
+
+def normalize_value_cell(value_cell: Element):
+    """Clean up 'No Formula' attribute if present in a data property Value Cell, setting type to string"""
+    if value_cell.attrib.get('F') == 'No Formula' and value_cell.attrib.get('V') is not None:
+        del value_cell.attrib['F']
+        value_cell.attrib['U'] = 'STR'
+
+
+def master_shape_xml(vis: vsdx.VisioFile, master_id: Optional[str], master_shape_id: Optional[str]) -> Optional[Element]:
+    """Get the Shape element in a master page for a shape's Master and MasterShape attributes, without creating Shapes"""
+    master_page = vis.get_master_page_by_id(master_id) if master_id is not None else None
+    if master_page is None:
+        return None
+    xml = master_page.xml.find(f'{namespace}Shapes/{namespace}Shape')  # single top master shape
+    if xml is not None and master_shape_id is not None:
+        xml = xml.find(f'.//{namespace}Shape[@ID="{master_shape_id}"]')
+    return xml
+
+
+def normalize_data_properties_xml(xml: Element):
+    """Clean up 'No Formula' attributes in all data property Value Cells within xml - applied when saving"""
+    for value_cell in xml.iterfind(f'.//{namespace}Section[@N="Property"]/{namespace}Row/'
+                                   f'{namespace}Cell[@N="Value"][@F="No Formula"]'):
+        normalize_value_cell(value_cell)
+
+
+class ShapeCells(dict):
+    """Cells of a :class:`Shape` by name, as :attr:`Shape.cells`
+
+    Cells of the geometry section, i.e. 'Geometry/LineTo/X', are added when a geometry cell is first used, or all cells
+    are listed - so a shape only holds its geometry as the packed arrays of :class:`Geometry` until then.
+    """
+    def __init__(self, shape: Shape):
+        super().__init__()
+        self._shape = weakref.ref(shape)  # no reference cycle, so an unused Shape is freed with its last reference
+        self._geometry_added = False
+
+    def _add_geometry(self):
+        # add a Cell for each cell of each typed row of the geometry section, once
+        if self._geometry_added:
+            return
+        self._geometry_added = True
+        shape = self._shape()
+        if shape is None or shape._geometry_xml is None:
+            return
+        cells = dict()
+        for r in shape._geometry_xml.findall(f"{namespace}Row"):
+            row_type = r.attrib['T']
+            if row_type:
+                for e in r.findall(f"{namespace}Cell"):
+                    cell = Cell(xml=e, shape=shape)
+                    cells[f"Geometry/{row_type}/{cell.name}"] = cell  # the last row of each type, as listed before
+        for key, cell in cells.items():
+            self.setdefault(key, cell)  # keep a cell already set by name
+
+    def _uses_geometry(self, key) -> bool:
+        return not self._geometry_added and isinstance(key, str) and key.startswith('Geometry/')
+
+    def get(self, key, default=None):
+        if self._uses_geometry(key):
+            self._add_geometry()
+        return super().get(key, default)
+
+    def __getitem__(self, key):
+        if self._uses_geometry(key):
+            self._add_geometry()
+        return super().__getitem__(key)
+
+    def __contains__(self, key) -> bool:
+        if self._uses_geometry(key):
+            self._add_geometry()
+        return super().__contains__(key)
+
+    def __iter__(self):
+        self._add_geometry()
+        return super().__iter__()
+
+    def __len__(self) -> int:
+        self._add_geometry()
+        return super().__len__()
+
+    def keys(self):
+        self._add_geometry()
+        return super().keys()
+
+    def values(self):
+        self._add_geometry()
+        return super().values()
+
+    def items(self):
+        self._add_geometry()
+        return super().items()
+
+    def __repr__(self):
+        self._add_geometry()
+        return super().__repr__()
 
 
 class Shape:
@@ -173,23 +320,14 @@ class Shape:
         self.shape_name = xml.attrib.get('NameU') or xml.get('Name')
         self.page = page
 
-        # get Cells in Shape
-        self.cells = dict()
-        self.geometry = None
+        # get Cells in Shape - geometry cells are added when first used, see ShapeCells
+        self.cells = ShapeCells(self)
+        self._geometry = None  # type: Optional[vsdx.Geometry]  # set by geometry property
         for e in self.xml.findall(f"{namespace}Cell"):
             cell = Cell(xml=e, shape=self)
             self.cells[cell.name] = cell
         geometry = self.xml.find(f'{namespace}Section[@N="Geometry"]')
-        if type(geometry) is Element:
-            # print(f"geometry({type(geometry)}):{geometry}")
-            self.geometry = vsdx.Geometry(xml=geometry, shape=self)
-            for r in geometry.findall(f"{namespace}Row"):
-                row_type = r.attrib['T']
-                if row_type:
-                    for e in r.findall(f"{namespace}Cell"):
-                        cell = vsdx.Cell(xml=e, shape=self)
-                        key = f"Geometry/{row_type}/{cell.name}"
-                        self.cells[key] = cell
+        self._geometry_xml = geometry if type(geometry) is Element else None
 
         control = self.xml.find(f'{namespace}Section[@N="Control"]')
         if type(control) is Element:
@@ -202,6 +340,14 @@ class Shape:
                         self.cells[key] = cell
 
         self._data_properties = None  # internal field to hold Shape.data_propertes, set by property
+        self._data_properties_by_name_cache = None  # internal field set by _data_properties_by_name()
+
+    @property
+    def geometry(self) -> Optional[vsdx.Geometry]:
+        """The Geometry of the shape, or None if the shape has no Geometry section - created when first used"""
+        if self._geometry is None and self._geometry_xml is not None:
+            self._geometry = vsdx.Geometry(xml=self._geometry_xml, shape=self)
+        return self._geometry
 
     def __repr__(self):
         return f"<Shape tag={self.tag} ID={self.ID} is_master=({self.is_master_shape}) type={self.shape_type} text='{self.text}' >"
@@ -290,23 +436,47 @@ class Shape:
 
         :return: Dict[str, DataProperty]
         """
-        if self._data_properties:
+        if self._data_properties is not None:
             # return cached dict if present
             return self._data_properties
 
+        # instance properties are layered over inherited master properties, which are shared by all shapes
+        # with the same master and not altered by the shape - see DataProperty
         properties = dict()
-        if self.master_shape:  # start with master data properties or empty dict
-            properties = self.master_shape.data_properties
+        master_properties, master_properties_by_name = self._master_data_properties()
+        for label, master_prop in master_properties.items():
+            properties[label] = DataProperty(xml=None, shape=self, master_property=master_prop)
         properties_xml = self.xml.find(f'{namespace}Section[@N="Property"]')
         if type(properties_xml) is Element:
             property_rows = properties_xml.findall(f'{namespace}Row')
             for prop in property_rows:
-                data_prop = DataProperty(xml=prop, shape=self)
+                data_prop = DataProperty(xml=prop, shape=self,
+                                         master_property=master_properties_by_name.get(prop.attrib.get('N')))
                 # add properties to dict to allow fast lookup by property.label
                 properties[data_prop.label] = data_prop
         self._data_properties = properties  # cache for next call
         return properties
 
+    def _master_data_properties(self) -> Tuple[Dict[str, DataProperty], Dict[str, DataProperty]]:
+        # master shape data properties by label and by name, created once per master shape and held by master page
+        master_page = self.master_page
+        if not master_page:
+            return dict(), dict()
+        cache = master_page._master_data_properties
+        if self.master_shape_ID not in cache:
+            master_shape = self.master_shape
+            if master_shape:
+                cache[self.master_shape_ID] = master_shape.data_properties, master_shape._data_properties_by_name()
+            else:
+                cache[self.master_shape_ID] = dict(), dict()
+        return cache[self.master_shape_ID]
+
+    def _data_properties_by_name(self) -> Dict[str, DataProperty]:
+        # data properties indexed by property name (rather than label), used to match master properties
+        if self._data_properties_by_name_cache is None:
+            self._data_properties_by_name_cache = {p.name: p for p in self.data_properties.values()}
+        return self._data_properties_by_name_cache
+
     def shape_value(self, name: str):
         return self.xml.attrib.get(name, None)
 
@@ -327,9 +497,11 @@ class Shape:
             return self.master_shape.cell_formula(name)
 
     def set_cell_value(self, name: str, value: str):
+        """Set the value of a cell, then recalculate cells in the page which depend on it"""
         cell = self.cells.get(name)
         if cell:  # only set value of existing item
             cell.value = value
+            self.page.cell_graph.cell_changed(self, name)
             return
         cell_xml = None
         if self.master_page_ID is not None and self.master_shape:
@@ -348,11 +520,14 @@ class Shape:
             self.xml.insert(list(self.xml).index(cells[-1])+1, cell_xml)  # insert after last Cell
         else:
             self.xml.insert(0, cell_xml)
+        self.page.cell_graph.cell_added(self, name)  # new cell may have a formula copied from master
 
     def set_cell_formula(self, name: str, value: str):
+        """Set the formula of a cell, then recalculate the cell and cells in the page which depend on it"""
         cell = self.cells.get(name)
         if cell:  # only set value of existing item
             cell.formula = value
+            self.page.cell_graph.formula_changed(self, name)
             return
         cell_xml = None
         if self.master_page_ID is not None and self.master_shape:
@@ -362,7 +537,7 @@ class Shape:
                 print("creating cell from:", ET.tostring(master_cell_xml))
                 cell_xml = ET.fromstring(ET.tostring(master_cell_xml))
         if cell_xml is None:  # create a new Cell
-            cell_xml = ET.fromstring(f'<Cell xmlns:ns0="{namespace[1:-1]}" N="{name}" />')
+            cell_xml = ET.fromstring(f'<Cell xmlns="{namespace[1:-1]}" N="{name}" />')
         # create new Cell from xml
         self.cells[name] = Cell(xml=cell_xml, shape=self)
         self.cells[name].formula = value
@@ -371,6 +546,7 @@ class Shape:
             self.xml.insert(list(self.xml).index(cells[-1]) + 1, cell_xml)  # insert after last Cell
         else:
             self.xml.insert(0, cell_xml)
+        self.page.cell_graph.formula_changed(self, name)
 
     @property
     def line_style_id(self):
@@ -538,14 +714,17 @@ class Shape:
         self.set_cell_value('EndY', str(value))
 
     def move(self, x_delta: float, y_delta: float):
-        if self.geometry:
-            self.geometry.move(x_delta, y_delta)
-        if self.begin_x:
-            self.begin_x = self.begin_x + x_delta
-        self.x = self.x + x_delta
-        if self.begin_y:
-            self.begin_y = self.begin_y + y_delta
-        self.y = self.y + y_delta
+        with self.page.cell_graph.batch():  # recalculate dependent cells once all position cells are moved
+            if self.geometry:
+                self.geometry.move(x_delta, y_delta)
+            if self.begin_x:
+                self.begin_x = self.begin_x + x_delta
+                self.end_x = self.end_x + x_delta
+            self.x = self.x + x_delta
+            if self.begin_y:
+                self.begin_y = self.begin_y + y_delta
+                self.end_y = self.end_y + y_delta
+            self.y = self.y + y_delta
 
     @property
     def height(self):
@@ -609,7 +788,10 @@ class Shape:
 
     def set_start_and_finish(self, start, finish):
         # set start and finish of a simple line or connector
-        if self.begin_x is not None:  # only apply changes to lines and connector shapes
+        if self.begin_x is None:  # only apply changes to lines and connector shapes
+            return
+        # cells set here, and cells depending on them, are recalculated from their formulae when the batch ends
+        with self.page.cell_graph.batch(recalculate_changed=True):
             self.x, self.y = start
             # lines/connectors are defined in different ways
             # Check whether shape is a connector based on name in known languages
@@ -636,28 +818,12 @@ class Shape:
                 self.set_cell_value(name='Control/TextPosition/Y', value=txt_pin_y.value)
                 self.set_cell_value(name='Control/TextPosition/XDyn', value=txt_pin_x.value)
                 self.set_cell_value(name='Control/TextPosition/YDyn', value=txt_pin_y.value)
-                # print(cp1.cells.keys())
-            cells = list(self.cells.values()) + self.geometry.cells
-            for r in self.geometry.rows.values():
-                cells.extend(r.cells.values())
-            # print(cells)
-            for c in cells:  # type: Cell
-                v = None
-                formula = c.formula
-                if formula:
-                    if formula == 'Inh' and self.master_shape:
-                        master_c = self.master_shape.cells.get(c.name)
-                        formula = master_c.formula if master_c else formula
-                    v = vsdx.calc_value(self, formula)
-                    if v is not None:
-                        c.value = v
 
     @staticmethod
     def clear_all_text_from_xml(x: Element):
-        x.text = ''
-        x.tail = ''
-        for i in x:
-            Shape.clear_all_text_from_xml(i)
+        for e in x.iter():  # x and all elements within it, without recursion
+            e.text = ''
+            e.tail = ''
 
     @property
     def text(self):
@@ -714,25 +880,64 @@ class Shape:
         return self._all_shapes()
 
     def _all_shapes(self, shapes: List[Shape] = None) -> List[Shape]:
-        # recursively search for shapes and return all found
+        # search for shapes within groups, at any depth, and return all found
         if not shapes:
             shapes = list()
-        for shape in self.child_shapes:  # type: Shape
-            shapes.append(shape)
-            if shape.shape_type == 'Group':
-                found = shape.all_shapes
-                if found:
-                    shapes.extend(found)
+        shapes.extend(self.iter_shapes())
         return shapes
 
+    def iter_shapes(self, master: str = None, shape_type: str = None, max_depth: int = None) -> Iterator[Shape]:
+        """Iterate shapes within this shape at any depth, in document order, creating each Shape only when reached
+
+        Stops walking the shape tree as soon as iteration stops, i.e. when searching for a first match
+
+        :param master: only shapes of this master, by master page ID or master name
+        :type master: str
+        :param shape_type: only shapes with this Type, i.e. 'Group' or 'Shape'
+        :type shape_type: str
+        :param max_depth: only shapes up to max_depth levels below this shape, where child shapes are depth 1
+        :type max_depth: int
+        """
+        master_ids = None
+        if master is not None:  # match by master ID, or by ID of a master page with this name
+            master_page = self.page.vis.master_index.get(master)
+            master_ids = {master, master_page.page_id} if master_page else {master}
+
+        def match(xml: Element, master_id: Optional[str]) -> bool:
+            return (master_ids is None or master_id in master_ids) and \
+                (shape_type is None or xml.attrib.get('Type') == shape_type)
+
+        return self._iter_shapes(match, max_depth=max_depth)
+
+    def _iter_shapes(self, match: Callable[[Element, Optional[str]], bool] = None,
+                     max_depth: int = None) -> Iterator[Shape]:
+        # walk Shape elements within this shape, yielding a Shape for each element where match(xml, master ID) is
+        # True - so no Shape is created for elements which don't match, except the parents of those which do
+        master_ids = {self.xml: self.master_page_ID}  # master page ID by element, inherited by sub shapes
+        parents = dict()  # parent element by element
+        shapes = {self.xml: self}  # Shape objects created, by element
+        for xml, parent, depth in walk_shape_xml(self.xml, max_depth=max_depth, include_root=False):
+            master_id = master_ids[xml] = xml.attrib.get('Master', master_ids[parent])
+            parents[xml] = parent
+            if match is None or match(xml, master_id):
+                yield self._shape_for_xml(xml, parents, shapes)
+
+    def _shape_for_xml(self, xml: Element, parents: Dict[Element, Element], shapes: Dict[Element, Shape]) -> Shape:
+        # create Shape for xml, creating any of its parents that have not been created yet
+        missing = list()
+        while xml not in shapes:
+            missing.append(xml)
+            xml = parents[xml]
+        for xml in reversed(missing):
+            shapes[xml] = Shape(xml=xml, parent=shapes[parents[xml]], page=self.page)
+        return shapes[xml]
+
+    def _walk(self, max_depth: int = None, include_root: bool = True):
+        # iterate (shape, parent, depth) for this shape and shapes within it, see vsdx.traversal.walk()
+        return walk(self, lambda s: s.child_shapes, max_depth=max_depth, include_root=include_root)
+
     def get_max_id(self):
-        max_id = int(self.ID)
-        if self.shape_type == 'Group':
-            for shape in self.child_shapes:
-                new_max = shape.get_max_id()
-                if new_max > max_id:
-                    max_id = new_max
-        return max_id
+        return max(int(e.attrib.get('ID', 0)) for e, parent, depth in walk_shape_xml(self.xml))
 
     def find_shape_by_id(self, shape_id: str) -> Shape:  # returns Shape
         """
@@ -741,14 +946,13 @@ class Shape:
         :param shape_id:
         :return: vsdx.Shape
         """
-        # recursively search for shapes by text and return first match
-        for shape in self.all_shapes:  # type: Shape
-            if shape.ID == shape_id:
-                return shape
+        # search for shapes by ID, only creating a Shape for the match
+        for shape in self._iter_shapes(lambda xml, master_id: xml.attrib.get('ID') == shape_id):  # type: Shape
+            return shape
 
     def find_shapes_by_id(self, shape_id: str) -> List[Shape]:
-        # recursively search for shapes by ID and return all matches
-        return [s for s in self.all_shapes if s.ID == shape_id]
+        # search for shapes by ID and return all matches, only creating a Shape for each match
+        return list(self._iter_shapes(lambda xml, master_id: xml.attrib.get('ID') == shape_id))
 
     def find_shape_by_attr(self, attr: str, attr_value: str) -> Shape:  # returns Shape
         """
@@ -759,18 +963,18 @@ class Shape:
         :return: vsdx.Shape
         """
         #  xml.attrib.get('NameU') or xml.get('Name')
-        # recursively search for shapes by text and return first match
-        for shape in self.all_shapes:  # type: Shape
-            if str(shape.xml.attrib.get(attr)) == attr_value:
-                return shape
+        # search for shapes by attribute, only creating a Shape for the match
+        for shape in self._iter_shapes(lambda xml, master_id: str(xml.attrib.get(attr)) == attr_value):  # type: Shape
+            return shape
 
     def find_shapes_by_master(self, master_page_ID: str, master_shape_ID: str) -> List[Shape]:
-        # recursively search for shapes by master ID and return all matches
-        return [s for s in self.all_shapes if s.master_shape_ID == master_shape_ID and s.master_page_ID == master_page_ID]
+        # search for shapes by master ID and return all matches, only creating a Shape for each match
+        return list(self._iter_shapes(lambda xml, master_id: master_id == master_page_ID and
+                                      xml.attrib.get('MasterShape') == master_shape_ID))
 
     def find_shape_by_text(self, text: str) -> Shape:  # returns Shape
-        # recursively search for shapes by text and return first match
-        for shape in self.all_shapes:  # type: Shape
+        # search for shapes by text and return first match
+        for shape in self.iter_shapes():  # type: Shape
             if text in shape.text:
                 return shape
 
@@ -783,8 +987,8 @@ class Shape:
         return [shape for shape in self.all_shapes if re.search(regex, shape.text)]
 
     def find_shape_by_property_label(self, property_label: str) -> Shape:  # returns Shape
-        # recursively search for shapes by property name and return first match
-        for shape in self.all_shapes:  # type: Shape
+        # search for shapes by property name and return first match
+        for shape in self.iter_shapes():  # type: Shape
             if property_label in shape.data_properties.keys():
                 return shape
 
@@ -793,8 +997,8 @@ class Shape:
         return [s for s in self.all_shapes if property_label in s.data_properties.keys()]
 
     def find_shape_by_property_label_value(self, property_label: str, property_value: str) -> Shape:  # returns Shape
-        # recursively search for shapes by property label and value, and return first match
-        for shape in self.all_shapes:  # type: Shape
+        # search for shapes by property label and value, and return first match
+        for shape in self.iter_shapes():  # type: Shape
             if property_label in shape.data_properties.keys() and \
                     str(shape.data_properties[property_label].value) == property_value:
                 return shape
@@ -805,32 +1009,29 @@ class Shape:
                     str(s.data_properties[property_label].value) == property_value]
 
     def apply_text_filter(self, context: dict):
-        # check text against all context keys
-        text = self.text
-        for key in context.keys():
-            r_key = "{{" + key + "}}"
-            text = text.replace(r_key, str(context[key]))
-        self.text = text
-
-        for s in self.child_shapes:
-            s.apply_text_filter(context)
+        # check text of this shape and sub shapes against all context keys
+        for shape, parent, depth in self._walk():
+            text = shape.text
+            for key in context.keys():
+                r_key = "{{" + key + "}}"
+                text = text.replace(r_key, str(context[key]))
+            shape.text = text
 
     def find_replace(self, old: str, new: str):
         # find and replace text in this shape and sub shapes
-        text = self.text
-        self.text = text.replace(old, new)
-
-        for s in self.child_shapes:
-            s.find_replace(old, new)
+        for shape, parent, depth in self._walk():
+            shape.text = shape.text.replace(old, new)
 
     def remove(self):
         self.parent.xml.remove(self.xml)
+        self.page.cell_graph.invalidate()
 
     def append_shape(self, append_shape: Shape):
         # insert shape into shapes tag, and return updated shapes tag
         id_map = self.page.vis.increment_shape_ids(append_shape.xml, self.page)
         self.page.vis.update_ids(append_shape.xml, id_map)
         self.xml.append(append_shape.xml)
+        self.page.cell_graph.invalidate()
 
     @property
     def connects(self):
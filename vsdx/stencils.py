@@ -0,0 +1,386 @@
+"""Stencils - masters from a stencil (.vssx), or any other Visio file, ready to import into other files
+
+A stencil is opened once per process with :meth:`Stencil.open`, which indexes its masters by NameU, Name and
+UniqueID. Importing a master adds it to a file with its relationships, content type overrides and styles - reusing any
+the file already has - and the imported master is remembered for each file, so it is only looked up once::
+
+    stencil = Stencil.open('network.vssx')
+    with VisioFile('diagram.vsdx') as vis:
+        router = stencil.stamp(vis.pages[0], 'Router', x=2.0, y=3.0)
+        vis.save_vsdx('out.vsdx')
+"""
+from __future__ import annotations
+import copy
+import io
+import os
+import posixpath
+import re
+import threading
+import weakref
+
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .pages import Page
+    from .shapes import Shape
+
+import xml.etree.ElementTree as ET
+from xml.etree.ElementTree import Element
+
+import vsdx
+from vsdx import namespace
+from vsdx import r_namespace
+from vsdx import document_rels_namespace
+from vsdx import cont_types_namespace
+from vsdx import style_attributes
+from .traversal import walk_shape_xml
+from .vsdxfile import VisioFile
+from .vsdxfile import file_to_xml
+from .vsdxfile import xml_to_file
+
+master_rel_type = "http://schemas.microsoft.com/visio/2010/relationships/master"
+masters_rel_type = "http://schemas.microsoft.com/visio/2010/relationships/masters"
+masters_content_type = "application/vnd.ms-visio.masters+xml"
+master_content_type = "application/vnd.ms-visio.master+xml"
+
+
+class StencilMaster:
+    """A master in a stencil, with everything needed to import it into another file
+
+    :param master_xml: the Master element from masters.xml, with the master name, IDs and icon
+    :param contents: the master file contents
+    :param rels: (Type, Target, contents) of each relationship of the master file, i.e. to an image - Target is a
+      path from the masters folder
+    :param style_ids: IDs of the styles used by the master, and of styles they are based on - base styles first
+    """
+    def __init__(self, master_xml: Element, contents: bytes, rels: List[Tuple[str, str, bytes]], style_ids: List[str]):
+        self.master_xml = master_xml
+        self.contents = contents
+        self.rels = rels
+        self.style_ids = style_ids
+
+    def __repr__(self):
+        return f"<StencilMaster name={self.name} unique_id={self.unique_id} >"
+
+    @property
+    def name(self) -> str:
+        return self.master_xml.attrib.get('NameU') or self.master_xml.attrib.get('Name') or 'Unknown'
+
+    @property
+    def unique_id(self) -> Optional[str]:
+        return self.master_xml.attrib.get('UniqueID')
+
+    @property
+    def key(self) -> str:
+        # identifies the master across files
+        return self.unique_id or self.name
+
+
+class Stencil:
+    """Masters from a stencil file, indexed by NameU, Name and UniqueID, to import into other files
+
+    Use :meth:`Stencil.open` to open each stencil file once per process.
+
+    :param filename: the stencil (.vssx) or other Visio file (.vsdx, .vstx) to read masters from
+    """
+    _stencils = dict()  # type: Dict[str, Stencil]  # by absolute path of stencil file
+    _lock = threading.Lock()
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.masters = list()  # type: List[StencilMaster]
+        self._index = dict()  # type: Dict[str, StencilMaster]  # by NameU, Name and UniqueID
+        self._styles = dict()  # type: Dict[str, Element]  # StyleSheet element by ID
+        self._content_types = dict()  # type: Dict[str, str]  # default content type by file extension, i.e. 'emf'
+        # master page ID by StencilMaster.key, for each file masters have been imported into
+        self._imported = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary[VisioFile, Dict[str, str]]
+        self._load(VisioFile(filename))  # file contents are held in memory, so there is nothing to close
+
+    def __repr__(self):
+        return f"<Stencil file={self.filename} masters={len(self.masters)} >"
+
+    @staticmethod
+    def open(filename: str) -> Stencil:
+        """Return the Stencil for a file, opening and indexing it if this is the first time it is used"""
+        path = os.path.abspath(filename)
+        with Stencil._lock:
+            if path not in Stencil._stencils:
+                Stencil._stencils[path] = Stencil(filename)
+            return Stencil._stencils[path]
+
+    def _load(self, vis: VisioFile):
+        style_sheets = vis._style_sheets()
+        for style in style_sheets.findall(f'{namespace}StyleSheet') if style_sheets is not None else []:
+            self._styles[style.attrib.get('ID')] = style
+        for default in vis.content_types_xml.getroot().findall(f'{cont_types_namespace}Default'):
+            self._content_types[default.attrib.get('Extension', '').lower()] = default.attrib.get('ContentType')
+
+        master_elements = {m.attrib.get('ID'): m for m in vis.masters_xml}
+        masters_folder = vis._masters_folder
+        for master_page in vis.master_pages:
+            master_xml = master_elements[master_page.page_id]
+            file_name = posixpath.basename(master_page.filename)
+            rels = list()
+            rels_xml = file_to_xml(f'{masters_folder}/_rels/{file_name}.rels', vis.zip_file_contents)
+            for rel in rels_xml.getroot() if rels_xml else []:
+                target = rel.attrib.get('Target')
+                target_path = posixpath.normpath(f'{masters_folder}/{target}')
+                if target_path in vis.zip_file_contents:
+                    rels.append((rel.attrib.get('Type'), target, vis.zip_file_contents[target_path].getvalue()))
+
+            used = set()  # style IDs used by the master
+            for e in [master_xml.find(f'{namespace}PageSheet')] + list(master_page.xml.iter()):
+                if e is not None:
+                    used.update(e.attrib[a] for a in style_attributes if a in e.attrib)
+            master = StencilMaster(master_xml, vis.zip_file_contents[master_page.filename].getvalue(), rels,
+                                   self._based_on_first(used))
+            self.masters.append(master)
+            for key in (master.unique_id, master_xml.attrib.get('NameU'), master_xml.attrib.get('Name')):
+                if key and key not in self._index:
+                    self._index[key] = master
+
+    def _based_on_first(self, style_ids: set) -> List[str]:
+        # style IDs, with styles they are based on added, ordered so each style follows the styles it is based on
+        ordered = list()
+        done = set()
+        visiting = set()  # styles whose base styles are being added - a style may be based on itself
+        for root in sorted(style_ids):
+            stack = [(root, False)]
+            while stack:
+                style_id, expanded = stack.pop()
+                if style_id in done or style_id not in self._styles:
+                    continue
+                if expanded:
+                    done.add(style_id)
+                    ordered.append(style_id)
+                    continue
+                if style_id in visiting:
+                    continue
+                visiting.add(style_id)
+                stack.append((style_id, True))
+                style = self._styles[style_id]
+                stack.extend((style.attrib[a], False) for a in style_attributes
+                             if a in style.attrib and style.attrib[a] not in done)
+        return ordered
+
+    @property
+    def names(self) -> List[str]:
+        """Names of the masters in the stencil"""
+        return [m.name for m in self.masters]
+
+    def master(self, key: str) -> Optional[StencilMaster]:
+        """Find a master by NameU, Name or UniqueID, or return None"""
+        return self._index.get(key)
+
+    def import_master(self, vis: VisioFile, key: str) -> Page:
+        """Import a master into a VisioFile, unless the file already has it, and return its master page
+
+        A master already in the file, with the same UniqueID (or name if the master has no UniqueID), is used rather
+        than adding a copy. Styles used by the master are matched to the file's styles by name, and only added if
+        missing. The master page is remembered for each file, so later imports of the same master return at once.
+
+        :param vis: the file to import the master into
+        :param key: the NameU, Name or UniqueID of the master
+        :return: the master :class:`Page` in vis
+        """
+        master = self._index.get(key)
+        if master is None:
+            raise KeyError(f"No master '{key}' in stencil {self.filename}")
+        imported = self._imported.setdefault(vis, dict())
+        master_page = vis.get_master_page_by_id(imported.get(master.key))
+        if master_page is None:
+            master_page = _find_master_page(vis, master) or self._add_master(vis, master)
+            imported[master.key] = master_page.page_id
+        return master_page
+
+    def stamp(self, page: Page, key: str, x: float, y: float) -> Shape:
+        """Add an instance of a master to a page at pin position x, y, importing the master if needed
+
+        The new shape, and the sub shapes of a group master, inherit every cell and their text from the master.
+
+        :param page: the page to add the shape to
+        :param key: the NameU, Name or UniqueID of the master
+        :param x: the PinX of the new shape
+        :param y: the PinY of the new shape
+        :return: the new :class:`Shape`
+        """
+        master_page = self.import_master(page.vis, key)
+        _add_page_master_rel(page, master_page)
+        master_shape = master_page.xml.find(f'{namespace}Shapes/{namespace}Shape')
+        page.set_max_ids()
+        instances = dict()  # type: Dict[Element, Element]  # instance shape element by master shape element
+        for e, parent, depth in walk_shape_xml(master_shape):
+            page.max_id += 1
+            instance = Element(f'{namespace}Shape', {'ID': str(page.max_id), 'Type': e.attrib.get('Type', 'Shape')})
+            if parent is None:
+                instance.attrib['Master'] = master_page.page_id
+                ET.SubElement(instance, f'{namespace}Cell', {'N': 'PinX', 'V': str(x)})
+                ET.SubElement(instance, f'{namespace}Cell', {'N': 'PinY', 'V': str(y)})
+            else:
+                instance.attrib['MasterShape'] = e.attrib.get('ID')
+                parent_instance = instances[parent]
+                shapes = parent_instance.find(f'{namespace}Shapes')
+                if shapes is None:
+                    shapes = ET.SubElement(parent_instance, f'{namespace}Shapes')
+                shapes.append(instance)
+            instances[e] = instance
+
+        shapes_tag = page.xml.find(f'{namespace}Shapes')
+        if shapes_tag is None:
+            shapes_tag = ET.SubElement(page.xml.getroot(), f'{namespace}Shapes')
+        shapes_tag.append(instances[master_shape])
+        page.cell_graph.invalidate()
+        return vsdx.Shape(xml=instances[master_shape], parent=page._shapes[0], page=page)
+
+    def _add_master(self, vis: VisioFile, master: StencilMaster) -> Page:
+        masters_folder = vis._masters_folder
+        masters_path = f'{masters_folder}/masters.xml'
+        masters_rels_path = f'{masters_folder}/_rels/masters.xml.rels'
+        if not isinstance(vis.masters_xml, Element):  # the file has no masters yet
+            vis.masters_xml = ET.fromstring(f"<Masters xmlns='{namespace[1:-1]}' xmlns:r='{r_namespace[1:-1]}' "
+                                            f"xml:space='preserve'/>")
+        if not any(r.attrib.get('Type') == masters_rel_type for r in vis.document_rels()):
+            vis._add_document_rel(rel_type=masters_rel_type, target="masters/masters.xml")
+        _add_content_types_override(vis, '/visio/masters/masters.xml', masters_content_type)
+        masters_rels = file_to_xml(masters_rels_path, vis.zip_file_contents)
+        if masters_rels is None:
+            masters_rels = ET.ElementTree(Element(f'{document_rels_namespace}Relationships'))
+
+        # new master ID, file name and relationship ID - keeping the stencil master ID if it is free
+        master_ids = {m.attrib.get('ID') for m in vis.masters_xml}
+        master_id = master.master_xml.attrib.get('ID')
+        if master_id in master_ids:
+            master_id = str(max(int(i) for i in master_ids) + 1)
+        file_num = 1 + max((int(n) for n in re.findall(r'master(\d+)\.xml', ' '.join(
+            [r.attrib.get('Target', '') for r in masters_rels.getroot()] + list(vis.zip_file_contents)))), default=0)
+        file_name = f'master{file_num}.xml'
+        rel_id = f"rId{1 + max((_rel_num(r) for r in masters_rels.getroot()), default=0)}"
+
+        style_map = self._import_styles(vis, master)
+        master_xml = copy.deepcopy(master.master_xml)
+        master_xml.attrib['ID'] = master_id
+        master_xml.find(f'{namespace}Rel').attrib[f'{r_namespace}id'] = rel_id
+        contents = ET.ElementTree(ET.fromstring(master.contents))
+        for e in [master_xml.find(f'{namespace}PageSheet')] + list(contents.iter()):
+            if e is not None:
+                _map_styles(e, style_map)
+
+        # relationships of the master file, i.e. to images, reusing an identical part already in vis
+        if master.rels:
+            rels = Element(f'{document_rels_namespace}Relationships')
+            for n, (rel_type, target, data) in enumerate(master.rels, start=1):
+                extension = posixpath.splitext(target)[1][1:].lower()
+                target = _add_part(vis, target, data, self._content_types.get(extension, 'application/octet-stream'))
+                rels.append(Element(f'{document_rels_namespace}Relationship',
+                                    {'Id': f'rId{n}', 'Type': rel_type, 'Target': target}))
+            xml_to_file(ET.ElementTree(rels), f'{masters_folder}/_rels/{file_name}.rels', vis.zip_file_contents)
+
+        master_path = f'{masters_folder}/{file_name}'
+        xml_to_file(contents, master_path, vis.zip_file_contents)
+        _add_content_types_override(vis, f'/visio/masters/{file_name}', master_content_type)
+        masters_rels.getroot().append(Element(f'{document_rels_namespace}Relationship',
+                                              {'Id': rel_id, 'Type': master_rel_type, 'Target': file_name}))
+        xml_to_file(masters_rels, masters_rels_path, vis.zip_file_contents)
+        vis.masters_xml.append(master_xml)
+        xml_to_file(ET.ElementTree(vis.masters_xml), masters_path, vis.zip_file_contents)
+
+        # update HeadingPairs and TitlesOfParts in app.xml
+        if vis.app_xml is not None and vis._heading_pairs() is not None and vis._titles_of_parts() is not None:
+            count = vis._get_app_xml_value('Masters')
+            vis._set_app_xml_value('Masters', str(int(count) + 1) if count else '1')
+            vis._add_titles_of_parts_item(master.name)
+
+        master_page = vsdx.Page(contents, master_path, master.name, master_id, rel_id, vis)
+        master_page.master_unique_id = master.unique_id
+        master_page.master_base_id = master.master_xml.attrib.get('BaseID')
+        vis.master_pages.append(master_page)
+        vis.master_index.setdefault(master.name, master_page)
+        return master_page
+
+    def _import_styles(self, vis: VisioFile, master: StencilMaster) -> Dict[str, str]:
+        # add styles used by master to vis, unless vis has a style of the same name - return new ID by stencil ID
+        style_map = dict()
+        style_sheets = vis._style_sheets()
+        if style_sheets is None:
+            return style_map
+        ids_by_name = dict()
+        for style in style_sheets.findall(f'{namespace}StyleSheet'):
+            ids_by_name.setdefault(style.attrib.get('NameU') or style.attrib.get('Name'), style.attrib.get('ID'))
+        next_id = 1 + max((int(i) for i in ids_by_name.values() if i and i.isdigit()), default=-1)
+        for style_id in master.style_ids:  # base styles first, so their new IDs are known
+            style = self._styles[style_id]
+            name = style.attrib.get('NameU') or style.attrib.get('Name')
+            if name not in ids_by_name:
+                new_style = copy.deepcopy(style)
+                new_style.attrib['ID'] = str(next_id)
+                next_id += 1
+                _map_styles(new_style, style_map)
+                style_sheets.append(new_style)
+                ids_by_name[name] = new_style.attrib['ID']
+            style_map[style_id] = ids_by_name[name]
+        return style_map
+
+
+def _find_master_page(vis: VisioFile, master: StencilMaster) -> Optional[Page]:
+    # a master page in vis with the same UniqueID as master, or with the same name if master has no UniqueID
+    for master_page in vis.master_pages:
+        if master.unique_id and getattr(master_page, 'master_unique_id', None) == master.unique_id:
+            return master_page
+    if not master.unique_id:
+        return vis.master_index.get(master.name)
+
+
+def _map_styles(e: Element, style_map: Dict[str, str]):
+    for a in style_attributes:
+        if e.attrib.get(a) in style_map:
+            e.attrib[a] = style_map[e.attrib[a]]
+
+
+def _rel_num(rel: Element) -> int:
+    # 3 from Id='rId3'
+    digits = re.sub(r'\D', '', rel.attrib.get('Id', ''))
+    return int(digits) if digits else 0
+
+
+def _add_content_types_override(vis: VisioFile, part_name: str, content_type: str):
+    if vis.content_types_xml.getroot().find(f"{cont_types_namespace}Override[@PartName='{part_name}']") is None:
+        vis._add_content_types_override(part_name_path=part_name, content_type=content_type)
+
+
+def _add_part(vis: VisioFile, target: str, data: bytes, content_type: str) -> str:
+    # add a part related to a master, i.e. an image, returning its target from the masters folder
+    base, ext = posixpath.splitext(target)
+    n = 1
+    while True:
+        path = posixpath.normpath(f'{vis._masters_folder}/{target}')
+        existing = vis.zip_file_contents.get(path)
+        if existing is None:
+            vis.zip_file_contents[path] = io.BytesIO(data)
+            break
+        if existing.getvalue() == data:  # same part already in vis
+            break
+        n += 1
+        target = f'{base}_{n}{ext}'
+    types = vis.content_types_xml.getroot()
+    extension = ext[1:].lower()
+    if extension and types.find(f"{cont_types_namespace}Default[@Extension='{extension}']") is None:
+        types.insert(0, Element(f'{cont_types_namespace}Default', {'Extension': extension,
+                                                                      'ContentType': content_type}))
+    return target
+
+
+def _add_page_master_rel(page: Page, master_page: Page):
+    # relate a page to a master used by shapes in the page, as Visio does
+    target = f"../masters/{posixpath.basename(master_page.filename)}"
+    if page.rels_xml is None:
+        page.rels_xml_filename = f"{page.vis.directory}/visio/pages/_rels/{posixpath.basename(page.filename)}.rels"
+        page.rels_xml = ET.ElementTree(Element(f'{document_rels_namespace}Relationships'))
+    rels = page.rels_xml.getroot()
+    if any(r.attrib.get('Target') == target for r in rels):
+        return
+    rels.append(Element(f'{document_rels_namespace}Relationship',
+                        {'Id': f"rId{1 + max((_rel_num(r) for r in rels), default=0)}", 'Type': master_rel_type,
+                         'Target': target}))
@@ -0,0 +1,241 @@
+"""Render a page as SVG, for previews and thumbnails without Visio
+
+Shapes are read in one pass with :func:`vsdx.paths.shape_paths`, so master geometry is read once per master shape,
+and SVG is written to a file like object as each shape is read. The path of a shape using its master geometry
+unchanged is written once per master shape and size, and drawn with the transform of each shape. Each shape is drawn
+with its outline, line and fill color, line weight and text - with values inherited from its master shape and its line,
+fill and text styles.
+
+Text is drawn horizontally at the text pin of the shape, in the color and size of its first Character row, and theme
+colors are drawn in the default color.
+"""
+from __future__ import annotations
+import io
+
+from typing import Dict
+from typing import IO
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .pages import Page
+    from .vsdxfile import VisioFile
+
+from xml.etree.ElementTree import Element
+from xml.sax.saxutils import escape
+
+from vsdx import namespace
+from vsdx import style_attributes
+from .paths import shape_paths
+from .paths import svg_number
+from .paths import svg_path_data
+from .shapes import to_float
+
+# Visio default color palette, by color index
+palette = ['#000000', '#ffffff', '#ff0000', '#00ff00', '#0000ff', '#ffff00', '#ff00ff', '#00ffff',
+           '#800000', '#008000', '#000080', '#808000', '#800080', '#008080', '#c0c0c0', '#e6e6e6',
+           '#cdcdcd', '#b3b3b3', '#9a9a9a', '#808080', '#666666', '#4d4d4d', '#333333', '#1a1a1a']
+
+default_line_weight = 0.01041666666666667  # inches, 0.75pt
+default_font_size = 1 / 6  # inches, 12pt
+
+# cells drawn, by the style attribute of a shape to inherit them from
+style_cells = {'LineStyle': ('LinePattern', 'LineColor', 'LineWeight'),
+               'FillStyle': ('FillPattern', 'FillForegnd'),
+               'TextStyle': ('Char.Size', 'Char.Color')}
+paint_cells = ('LinePattern', 'LineColor', 'LineWeight', 'FillPattern', 'FillForegnd')
+font_cells = ('Char.Size', 'Char.Color')
+
+cell_tag = f'{namespace}Cell'
+row_tag = f'{namespace}Row'
+section_tag = f'{namespace}Section'
+text_tag = f'{namespace}Text'
+no_attributes = dict()
+
+
+def svg_color(value: Optional[str], default: str) -> str:
+    """SVG color of a Visio color cell value, i.e. '#ff0000' or a palette index such as '2' - or default for any
+    other value, such as a theme color
+    """
+    if value is None:
+        return default
+    if value.startswith('#'):
+        return value
+    try:
+        return palette[int(float(value))]
+    except (ValueError, IndexError):
+        return default
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    # float value of a cell, or None if missing or not a number, i.e. 'Themed'
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class StyleCells:
+    """Cell values of the style sheets of a VisioFile, read once per style and the styles it is based on
+
+    :param vis: the :class:`VisioFile`
+    """
+    def __init__(self, vis: VisioFile):
+        style_sheets = vis._style_sheets()
+        self._styles = {s.attrib.get('ID'): s for s in style_sheets.iterfind(f'{namespace}StyleSheet')} \
+            if style_sheets is not None else dict()
+        self._cells = dict()  # type: Dict[Tuple[str, str], Dict[str, Optional[str]]]
+
+    def cells(self, style_id: Optional[str], attribute: str) -> Dict[str, Optional[str]]:
+        """Cell values of a style, including values of the styles it is based on through attribute
+
+        :param style_id: ID of the style sheet, i.e. the LineStyle attribute of a shape
+        :param attribute: 'LineStyle', 'FillStyle' or 'TextStyle'
+        """
+        key = (style_id, attribute)
+        if key not in self._cells:
+            chain = []
+            while style_id in self._styles and style_id not in chain:  # styles based on each other are ignored
+                chain.append(style_id)
+                style_id = self._styles[style_id].attrib.get(attribute)
+            cells = dict()
+            for based_on in reversed(chain):
+                cells.update(_cells(self._styles[based_on]))
+            self._cells[key] = cells
+        return self._cells[key]
+
+
+def _cells(xml: Optional[Element]) -> Dict[str, Optional[str]]:
+    # Cell values of an element by name, with cells of its first Character row as Char.Color, Char.Size etc.
+    if xml is None:
+        return dict()
+    cells = {cell.attrib.get('N'): cell.attrib.get('V') for cell in xml.iterfind(f'{namespace}Cell')}
+    cells.update(_character_cells(xml))
+    return cells
+
+
+def _character_cells(xml: Optional[Element]) -> Dict[str, Optional[str]]:
+    row = xml.find(f'{namespace}Section[@N="Character"]/{namespace}Row') if xml is not None else None
+    return _row_cells(row, 'Char.')
+
+
+def _row_cells(row: Optional[Element], prefix: str) -> Dict[str, Optional[str]]:
+    if row is None:
+        return dict()
+    return {prefix + cell.attrib.get('N'): cell.attrib.get('V') for cell in row if cell.tag == cell_tag}
+
+
+def _text_parts(xml: Optional[Element]) -> Tuple[Optional[str], Dict[str, Optional[str]]]:
+    # (text or None if no Text element, cells of first Character row as Char.Color etc.), in one pass over children
+    text = None
+    characters = dict()
+    if xml is None:
+        return text, characters
+    for child in xml:
+        if child.tag == text_tag:
+            text = "".join(child.itertext())
+        elif child.tag == section_tag and child.attrib.get('N') == 'Character':
+            characters = _row_cells(child.find(row_tag), 'Char.')
+    return text, characters
+
+
+def write_svg(page: Page, file: IO[str], precision: int = 4):
+    """Write a page as SVG to a text file like object, in one pass over the shapes of the page
+
+    :param page: the :class:`Page`
+    :param file: text file like object, i.e. open(filename, 'w') or io.StringIO()
+    :param precision: number of decimal places of co-ordinates, which are in inches from the top left of the page
+    """
+    write = file.write
+    width, height = page.width, page.height
+    styles = StyleCells(page.vis)
+    master_text = dict()  # master shape xml: (text, character cells) of master shape
+    style_values = dict()  # (line, fill, text style IDs): value of each of style_cells from the styles
+    paints = dict()  # values of paint_cells: (stroke, fill, stroke width) attributes
+    fonts = dict()  # values of font_cells: (font size, color)
+    shared_paths = dict()  # id of local paths shared by shapes of a master: (path data, no_fill, no_line) of each path
+
+    def number(value: float) -> str:
+        return svg_number(value, precision)
+
+    write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{number(width)}in" height="{number(height)}in" '
+          f'viewBox="0 0 {number(width)} {number(height)}">\n')
+    for shape in shape_paths(page, transform=(1.0, 0.0, 0.0, -1.0, 0.0, height)):  # SVG co-ordinates, y down
+        xml, master_xml, cells = shape.xml, shape.master_xml, shape.cells
+        if master_xml is not None and master_xml not in master_text:
+            master_text[master_xml] = _text_parts(master_xml)
+        text, characters = _text_parts(xml)
+        if master_xml is not None:
+            master_shape_text, master_characters = master_text[master_xml]
+            text = text if text is not None else master_shape_text
+            characters = characters or master_characters
+
+        attrib = xml.attrib
+        master_attrib = master_xml.attrib if master_xml is not None else no_attributes
+        style_ids = (attrib.get('LineStyle') or master_attrib.get('LineStyle'),
+                     attrib.get('FillStyle') or master_attrib.get('FillStyle'),
+                     attrib.get('TextStyle') or master_attrib.get('TextStyle'))  # as style_attributes
+        if style_ids not in style_values:
+            style_values[style_ids] = {name: styles.cells(style_id, attribute).get(name)
+                                       for style_id, attribute in zip(style_ids, style_attributes)
+                                       for name in style_cells[attribute]}
+        style = style_values[style_ids]
+
+        if shape.paths:
+            paint = tuple(cells.get(name, style[name]) for name in paint_cells)
+            if paint not in paints:
+                line_pattern, line_color, line_weight, fill_pattern, fill_color = (_number(paint[0]), paint[1],
+                                                                                   _number(paint[2]),
+                                                                                   _number(paint[3]), paint[4])
+                paints[paint] = ('none' if line_pattern == 0 else svg_color(line_color, '#000000'),
+                                 'none' if fill_pattern == 0 else svg_color(fill_color, '#ffffff'),
+                                 number(line_weight if line_weight is not None else default_line_weight))
+            stroke, fill, stroke_width = paints[paint]
+            if shape.shared:  # path data of master geometry made once, and drawn with the transform of each shape
+                key = id(shape.local_paths)
+                if key not in shared_paths:
+                    shared_paths[key] = [(svg_path_data(commands, precision), no_fill, no_line)
+                                         for commands, no_fill, no_line in shape.local_paths]
+                paths = shared_paths[key]
+                matrix = ' '.join(number(v) for v in shape.transform)
+                transform = f' transform="matrix({matrix})"'
+            else:
+                paths = [(svg_path_data(commands, precision), no_fill, no_line)
+                         for commands, no_fill, no_line in shape.paths]
+                transform = ''
+            for data, no_fill, no_line in paths:
+                path_fill = 'none' if no_fill or not data.endswith('Z') else fill  # only closed paths are filled
+                path_stroke = 'none' if no_line else stroke
+                write(f'<path d="{data}" fill="{path_fill}" stroke="{path_stroke}" stroke-width="{stroke_width}"'
+                      f'{transform}/>\n')
+
+        text = (text or '').rstrip('\n')
+        if text.strip():
+            # text pin in shape local co-ordinates, centre of shape by default
+            pin_x = to_float(cells.get('TxtPinX'))
+            pin_y = to_float(cells.get('TxtPinY'))
+            if pin_x is None:
+                pin_x = (to_float(cells.get('Width')) or 0.0) / 2
+            if pin_y is None:
+                pin_y = (to_float(cells.get('Height')) or 0.0) / 2
+            a, b, c, d, e, f = shape.transform
+            x, y = a * pin_x + c * pin_y + e, b * pin_x + d * pin_y + f
+            font = tuple(characters.get(name, style[name]) for name in font_cells)
+            if font not in fonts:
+                fonts[font] = (_number(font[0]) or default_font_size, svg_color(font[1], '#000000'))
+            size, color = fonts[font]
+            lines = text.split('\n')
+            write(f'<text x="{number(x)}" y="{number(y)}" font-size="{number(size)}" fill="{color}" '
+                  f'text-anchor="middle" dominant-baseline="central">')
+            for i, line in enumerate(lines):
+                dy = -(len(lines) - 1) / 2 * 1.2 * size if i == 0 else 1.2 * size  # lines centred on text pin
+                write(f'<tspan x="{number(x)}" dy="{number(dy)}">{escape(line)}</tspan>')
+            write('</text>\n')
+    write('</svg>\n')
+
+
+def page_svg(page: Page, precision: int = 4) -> str:
+    """Return a page as an SVG string - see :func:`write_svg`"""
+    file = io.StringIO()
+    write_svg(page, file, precision)
+    return file.getvalue()
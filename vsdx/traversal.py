@@ -0,0 +1,61 @@
+"""Iterative tree traversal, used to walk nested group shapes without recursion
+
+Groups can be nested deeply (i.e. in imported CAD diagrams), so walkers use an explicit stack rather than
+recursive calls, which would use a stack frame per level and could reach the python recursion limit.
+"""
+from __future__ import annotations
+
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
+
+from xml.etree.ElementTree import Element
+
+from vsdx import namespace
+
+T = TypeVar('T')
+
+shapes_tag = f'{namespace}Shapes'
+shape_tag = f'{namespace}Shape'
+
+
+def walk(root: T, children: Callable[[T], Iterable[T]], max_depth: int = None,
+         prune: Callable[[T], bool] = None, include_root: bool = True) -> Iterator[Tuple[T, Optional[T], int]]:
+    """Yield (node, parent, depth) for root and each node below it, in document order, using an explicit stack
+
+    :param root: the node to start from, at depth 0 with parent None
+    :param children: function returning the child nodes of a node
+    :param max_depth: if set, nodes deeper than max_depth are not visited
+    :param prune: function returning True for a node whose children should not be visited (the node is yielded)
+    :param include_root: yield the root node, or only the nodes below it
+    """
+    stack = [(root, None, 0)]  # type: List[Tuple[T, Optional[T], int]]
+    while stack:
+        node, parent, depth = stack.pop()
+        if depth or include_root:
+            yield node, parent, depth
+        if (max_depth is not None and depth >= max_depth) or (prune is not None and prune(node)):
+            continue
+        # push children in reverse, so the first child is popped and visited next
+        stack.extend((child, node, depth + 1) for child in reversed(list(children(node))))
+
+
+def shape_xml_children(xml: Element) -> List[Element]:
+    """Shape elements contained by a Shapes element, or by the Shapes element of a group Shape element"""
+    # iterate children rather than findall(), which is slower for the many small elements of a large page
+    if xml.tag == shapes_tag:
+        return [child for child in xml if child.tag == shape_tag]
+    return [shape for shapes in xml if shapes.tag == shapes_tag for shape in shapes if shape.tag == shape_tag]
+
+
+def walk_shape_xml(xml: Element, max_depth: int = None, prune: Callable[[Element], bool] = None,
+                   include_root: bool = True) -> Iterator[Tuple[Element, Optional[Element], int]]:
+    """Yield (Shape element, parent element, depth) for a Shape or Shapes element and every sub shape within it
+
+    See :func:`walk` for parameters
+    """
+    return walk(xml, shape_xml_children, max_depth=max_depth, prune=prune, include_root=include_root)
@@ -1,15 +1,23 @@
 from __future__ import annotations
 
+import concurrent.futures
+import copy
+import functools
 import zipfile
 import shutil
 import os
 import re
 import io
 
+from jinja2 import Environment
 from jinja2 import Template
 
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Tuple
 
 import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import Element
@@ -18,8 +26,17 @@ import xml.dom.minidom as minidom   # minidom used for prettyprint
 import vsdx
 from .pages import Page
 from .pages import PagePosition
+from .datatable import DataPropertyTable
+from .datatable import page_data_property_rows
+from .datatable import data_property_lookup
+from .datatable import update_data_properties
+from .query import ShapeQuery
 
 from vsdx import Shape
+from .shapes import master_shape_xml
+from .shapes import normalize_data_properties_xml
+from .layout import layout_grid
+from .traversal import walk_shape_xml
 
 from vsdx import namespace
 from vsdx import ext_prop_namespace
@@ -35,6 +52,18 @@ ET.register_namespace('r', r_namespace[1:-1])
 ET.register_namespace('', document_rels_namespace[1:-1])
 ET.register_namespace('', cont_types_namespace[1:-1])
 
+sheet_ref_regex = re.compile(r"\bSheet\.(\d+)!")  # i.e. 'Sheet.15!' in a formula, where group 1 is the shape ID
+
+# Jinja statement patterns, compiled once rather than for each shape
+jinja_statement_regex = re.compile(r"{%(.*?)%}")  # non-greedy search for each {%...%} string
+jinja_showif_regex = re.compile(r"{% showif\s(.*?)\s%}")
+# vsdx specific statements: group 1 is 'for', 'showif' or 'layout' and group 2 its argument, or group 3 and 4 are the
+# property and value of a {% set self.property = value %} statement
+jinja_vsdx_statement_regex = re.compile(r"{% (?:(for|showif|layout)\s(.*?)\s|set self\.(.*?)\s?=\s?(.*?) )%}")
+jinja_self_ref_regex = re.compile(r'self.(.*)[\s+-/*//]?')  # greedy search for all self.? between +, -, *, or /
+# environment used to evaluate the arguments of vsdx specific statements, i.e. {% layout columns=4 %}
+jinja_environment = Environment(keep_trailing_newline=True)
+
 
 def file_to_xml(filename: str, zip_file_contents: dict = None) -> ET.ElementTree:
     """Import a file as an ElementTree"""
@@ -51,6 +80,120 @@ def xml_to_file(xml: ET.ElementTree, filename: str, zip_file_contents: dict = No
     zip_file_contents[filename] = io.BytesIO(file.getvalue())
 
 
+def split_jinja_statements(text: str, keywords: tuple = ('for', 'showif', 'layout', 'set self')) -> Tuple[str, List[tuple]]:
+    """Find vsdx specific Jinja statements in shape text, and remove them from it, in a single pass
+
+    :param text: the shape text
+    :param keywords: the kinds of statement to find - others are left in the text
+    :return: the text without the statements found, and a (keyword, argument, value) tuple for each statement in
+      order of the text, i.e. ('for', 'item in items', None), ('showif', 'x > 1', None),
+      ('layout', 'columns=4, spacing=0.1', None) or ('set self', 'x', 'n*2')
+    """
+    statements = []
+
+    def remove_statement(match: re.Match) -> str:
+        keyword, argument, name, value = match.groups()
+        statement = (keyword, argument, None) if keyword else ('set self', name, value)
+        if statement[0] not in keywords:
+            return match.group(0)
+        statements.append(statement)
+        return ''
+
+    return jinja_vsdx_statement_regex.sub(remove_statement, text), statements
+
+
+def has_jinja(text: str) -> bool:
+    """Return True if text contains any Jinja statement, expression or comment markup"""
+    return '{%' in text or '{{' in text or '{#' in text
+
+
+def _elements_have_jinja(elements: Iterable[Element]) -> bool:
+    # True if any of the elements has Jinja markup in its text, tail or attribute values - without serialising them
+    for e in elements:
+        if (e.text and has_jinja(e.text)) or (e.tail and has_jinja(e.tail)) or \
+                (e.attrib and has_jinja(' '.join(e.attrib.values()))):  # values are joined once, not tested each
+            return True
+    return False
+
+
+def jinja_template_shape_ids(page: Page, master_cache: dict = None) -> Dict[str, bool]:
+    """Find the shapes in a page with Jinja markup in their text, scanning the page xml without creating Shapes
+
+    :param page: the page to scan
+    :param master_cache: dict shared across pages to hold whether master shape text has markup, by (master ID, master
+      shape ID) - so each master shape is found once while rendering
+    :return: a dict with shape ID: True for each shape with markup in its own text, or text inherited from its master
+      shape, and shape ID: False for each group shape that only contains such shapes
+    """
+    shape_ids = dict()  # type: Dict[str, bool]
+    shapes_xml = page.xml.find(f'{namespace}Shapes')
+    if shapes_xml is None:
+        return shape_ids
+    if master_cache is None:
+        master_cache = dict()
+    master_ids = dict()  # master page ID by shape element, inherited by sub shapes of a group
+    parents = dict()  # parent element by shape element
+    for xml, parent, depth in walk_shape_xml(shapes_xml, include_root=False):
+        master_id = master_ids[xml] = xml.attrib.get('Master', master_ids.get(parent))
+        parents[xml] = parent
+        text_xml = xml.find(f'{namespace}Text')
+        if text_xml is not None:
+            template = has_jinja("".join(text_xml.itertext()))
+        else:  # as Shape.text, use text of master shape
+            key = (master_id, xml.attrib.get('MasterShape'))
+            if key not in master_cache:
+                master_xml = master_shape_xml(page.vis, *key)
+                master_text_xml = master_xml.find(f'{namespace}Text') if master_xml is not None else None
+                master_cache[key] = master_text_xml is not None and has_jinja("".join(master_text_xml.itertext()))
+            template = master_cache[key]
+        if template:
+            shape_ids[xml.attrib.get('ID')] = True
+            while depth > 1:  # mark each parent group, so it is traversed during rendering
+                xml, depth = parents[xml], depth - 1
+                shape_ids.setdefault(xml.attrib.get('ID'), False)
+    return shape_ids
+    master_ids = dict()  # master page ID by shape element, inherited by sub shapes of a group
+    parents = dict()  # parent element by shape element
+    for xml, parent, depth in walk_shape_xml(shapes_xml, include_root=False):
+        master_id = master_ids[xml] = xml.attrib.get('Master', master_ids.get(parent))
+        parents[xml] = parent
+        text_xml = xml.find(f'{namespace}Text')
+        if text_xml is None:  # as Shape.text, use text of master shape
+            master_xml = master_shape_xml(page.vis, master_id, xml.attrib.get('MasterShape'))
+            text_xml = master_xml.find(f'{namespace}Text') if master_xml is not None else None
+        if text_xml is not None and has_jinja("".join(text_xml.itertext())):
+            shape_ids[xml.attrib.get('ID')] = True
+            while depth > 1:  # mark each parent group, so it is traversed during rendering
+                xml, depth = parents[xml], depth - 1
+                shape_ids.setdefault(xml.attrib.get('ID'), False)
+    return shape_ids
+
+
+@functools.lru_cache(maxsize=1024)
+def jinja_expression(source: str):
+    """Compile a Jinja expression, i.e. the arguments of a {% layout %} statement, once for each source string"""
+    return jinja_environment.compile_expression(source, undefined_to_none=False)
+
+
+def jinja_layout_args(statements: List[tuple], context: dict) -> Optional[dict]:
+    """Return the keyword arguments of the last {% layout %} statement, for :func:`vsdx.layout.layout_grid`, or None
+
+    i.e. a loop shape with text ``{% for port in ports %}{% layout columns=4, spacing=0.1 %}`` is copied for each port,
+    and the copies arranged in a grid of 4 columns, rather than each moved down below the last
+
+    :raises ValueError: if there is a {% layout %} statement without a {% for %} statement
+    """
+    layouts = [argument for keyword, argument, value in statements if keyword == 'layout']
+    if layouts and not any(keyword == 'for' for keyword, argument, value in statements):
+        raise ValueError(f"Jinja layout statement without a for loop: '{{% layout {layouts[-1]} %}}'")
+    return jinja_expression(f"dict({layouts[-1]})")(**context) if layouts else None
+
+
+def render_jinja_source(source: str, context: dict) -> str:
+    """Render a page xml source string as a Jinja template - module level so it can be run in a worker process"""
+    return Template(source).render(context)
+
+
 class VisioFileNotOpen(BaseException):
     """Error class to report when a VisioFile is attempted to be saved when no longer open"""
     pass
@@ -79,7 +222,7 @@ class VisioFile:
         if debug:
             print(f"VisioFile(filename={filename})")
         file_type = self.filename.split('.')[-1]  # last text after dot
-        if not file_type.lower() == 'vsdx' and not file_type.lower() == 'vsdm':
+        if file_type.lower() not in ('vsdx', 'vsdm', 'vssx', 'vssm', 'vstx', 'vstm'):  # drawing, stencil or template
             raise TypeError(f'Invalid File Type:{file_type}')
 
         self.directory = os.path.abspath(filename)[:-5]
@@ -155,8 +298,8 @@ class VisioFile:
         page_dir = f'{self.directory}/visio/pages/'
 
         rel_filename = rel_dir + 'pages.xml.rels'
-        rels = file_to_xml(rel_filename, self.zip_file_contents).getroot()  # rels contains page filenames
         self.pages_xml_rels = file_to_xml(rel_filename, self.zip_file_contents)  # store pages.xml.rels so pages can be added or removed
+        rels = self.pages_xml_rels.getroot() if self.pages_xml_rels else []  # rels contains page filenames - a stencil has none
         if self.debug:
             print(f"Relationships({rel_filename})", VisioFile.pretty_print_element(rels))
         relid_page_dict = {}
@@ -167,8 +310,8 @@ class VisioFile:
             relid_page_dict[rel_id] = page_file
 
         pages_filename = self._pages_filename()  # pages contains Page name, width, height, mapped to Id
-        pages = file_to_xml(pages_filename, self.zip_file_contents).getroot()  # this contains a list of pages with rel_id and filename
         self.pages_xml = file_to_xml(pages_filename, self.zip_file_contents)  # store xml so pages can be removed
+        pages = self.pages_xml.getroot() if self.pages_xml else []  # this contains a list of pages with rel_id and filename
         if self.debug:
             print(f"Pages({pages_filename})", VisioFile.pretty_print_element(pages))
 
@@ -277,6 +420,78 @@ class VisioFile:
             if m.page_id == id:
                 return m
 
+    def export_data_properties(self) -> DataPropertyTable:
+        """Export data properties of every shape in every page to a column based table
+
+        Page xml is read directly in a single pass, without creating Shape or DataProperty objects,
+        and without altering the xml. Master shape properties are read once per master shape.
+
+        :return: :class:`DataPropertyTable` with 'page', 'shape_id', 'master' and a column per property label - see
+          :class:`DataPropertyTable` for labels which are also key column names
+        """
+        table = DataPropertyTable()
+        master_cache = dict()  # master shape properties shared across all pages
+        for page in self.pages:
+            for row in page_data_property_rows(page, master_cache):
+                table.append(row)
+        return table
+
+    def query(self) -> ShapeQuery:
+        """Start a :class:`ShapeQuery` for shapes in all pages, i.e. ``vis.query().property('Site', 'X').all()``"""
+        return ShapeQuery(self)
+
+    def find_shapes(self, query: ShapeQuery = None, text: str = None, regex: str = None, master: str = None,
+                    property_label: str = None, property_value: str = None) -> Iterator[Shape]:
+        """Search all pages for shapes matching every condition given, yielding each Shape in page order
+
+        Each Shape refers to the page it was found in, as Shape.page
+
+        :param query: a :class:`ShapeQuery` of conditions, combined with any of the other conditions given
+        :param text: text contained by the shape text
+        :param regex: regular expression matching the shape text
+        :param master: master page ID or master name
+        :param property_label: label of a data property of the shape
+        :param property_value: value of the property_label data property
+        """
+        query = query.copy() if query else ShapeQuery()
+        if master is not None:
+            query.master(master)
+        if text is not None:
+            query.text(text)
+        if regex is not None:
+            query.text_regex(regex)
+        if property_label is not None:
+            query.property(property_label, property_value)
+
+        for page in self.pages:
+            yield from query.run(page)
+
+    def find_shape(self, query: ShapeQuery = None, text: str = None, regex: str = None, master: str = None,
+                   property_label: str = None, property_value: str = None) -> Optional[Shape]:
+        """Return the first shape in any page matching every condition given, or None - see :meth:`find_shapes`"""
+        return next(self.find_shapes(query, text=text, regex=regex, master=master,
+                                     property_label=property_label, property_value=property_value), None)
+
+    def update_data_properties(self, rows, key: str = 'shape_id') -> List[dict]:
+        """Update data property values of many shapes in all pages from rows of a table
+
+        Shapes are looked up once by key, then each row is joined to matching shapes, and each other
+        value in the row is set on the data property with that label.
+        Rows with a 'page' value, such as those from :meth:`export_data_properties`, only match shapes in that page.
+
+        :param rows: iterable of dicts of values by property label, or a :class:`DataPropertyTable`
+        :type rows: Iterable[dict] or DataPropertyTable
+        :param key: 'shape_id' or the label of the data property used to match rows to shapes
+        :type key: str
+
+        :return: list of rows which did not match any shape
+        """
+        lookup = dict()
+        for page in self.pages:
+            for value, shapes in data_property_lookup(page.all_shapes, key).items():
+                lookup.setdefault(value, []).extend(shapes)
+        return update_data_properties(rows, lookup, key)
+
     def remove_page_by_index(self, index: int):
         """Remove zero-based nth page from VisioFile object
 
@@ -770,33 +985,55 @@ class VisioFile:
         for shape in shapes.findall(f"{namespace}Shape"):
             _replace_shape_text(shape, context)
 
-    def jinja_render_vsdx(self, context: dict):
+    def jinja_render_vsdx(self, context: dict, max_workers: int = None):
         """Transform a template VisioFile object using the Jinja language
         The method updates the VisioFile object loaded from the template file, so does not return any value
         Note: vsdx specific extensions are available such as `{% for item in list %}` statements with no `{% endfor %}`
 
         :param context: A dictionary containing values that can be accessed by the Jinja processor
         :type context: dict
+        :param max_workers: if set, render page templates in a pool of this many processes - context must be picklable
+        :type max_workers: int, default to None
 
         :return: None
         """
         # parse each shape in each page as Jinja2 template with context
+        pages_to_render = []  # list of (page, loop shape IDs, loop layouts) to be rendered
         pages_to_remove = []  # list of pages to be removed after loop
+        master_cache = dict()  # whether master shape text has Jinja markup, for all pages in this render
         for page in self.pages:  # type: Page
             # check if page should be removed
             if VisioFile.jinja_page_showif(page, context):
                 loop_shape_ids = list()
-                for shapes_by_id in page._shapes:  # type: Shape
-                    VisioFile.jinja_render_shape(shape=shapes_by_id, context=context, loop_shape_ids=loop_shape_ids)
+                loop_layouts = dict()  # layout_grid() arguments by loop shape ID
+                template_shape_ids = jinja_template_shape_ids(page, master_cache)
+                if template_shape_ids:  # only shapes with Jinja in their text, and groups containing them, are visited
+                    for shapes_by_id in page._shapes:  # type: Shape
+                        VisioFile.jinja_render_shape(shape=shapes_by_id, context=context, loop_shape_ids=loop_shape_ids,
+                                                     template_shape_ids=template_shape_ids, loop_layouts=loop_layouts)
+                pages_to_render.append((page, loop_shape_ids, loop_layouts))
+            else:
+                # note page to remove after this loop has completed
+                pages_to_remove.append(page)
+
+        # pages with no Jinja markup in their xml (i.e. in text or cell values) are left unchanged, and not serialised
+        pages_to_render = [(page, *loops, VisioFile.unescape_jinja_statements(  # unescape < and > in {%...%}
+                            ET.tostring(page.xml.getroot(), encoding='unicode')))
+                           for page, *loops in pages_to_render if _elements_have_jinja(page.xml.getroot().iter())]
+        # pages are rendered independently, from source strings which are cheap to send to a worker process
+        sources = [source for *page_loops, source in pages_to_render]
+        if max_workers and len(sources) > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+                outputs = list(executor.map(render_jinja_source, sources, [context] * len(sources)))
+        else:
+            outputs = [render_jinja_source(source, context) for source in sources]
 
-                source = ET.tostring(page.xml.getroot(), encoding='unicode')
-                source = VisioFile.unescape_jinja_statements(source)  # unescape chars like < and > inside {%...%}
-                template = Template(source)
-                output = template.render(context)
-                page.xml = ET.ElementTree(ET.fromstring(output))  # create ElementTree from Element created from output
+        for (page, loop_shape_ids, loop_layouts, source), output in zip(pages_to_render, outputs):
+            page.xml = ET.ElementTree(ET.fromstring(output))  # create ElementTree from Element created from output
 
-                # update loop shape IDs which have been duplicated by Jinja template
-                page.set_max_ids()
+            # update loop shape IDs which have been duplicated by Jinja template
+            page.set_max_ids()
+            with page.cell_graph.batch():  # recalculate moved cells once, when all duplicates have new IDs and moved
                 for shape_id in loop_shape_ids:
                     shapes_by_id = page._find_shapes_by_id(shape_id)  # type: List[Shape]
                     if shapes_by_id and len(shapes_by_id) > 1:
@@ -804,112 +1041,100 @@ class VisioFile:
                         for shape in shapes_by_id[1:]:  # from the 2nd onwards - leaving original unchanged
                             # increment each new shape duplicated by the jinja loop
                             self.increment_sub_shape_ids(shape, page)
-                            delta += shape.height  # automatically move each duplicate down
-                            shape.move(0, -delta)  # move duplicated shapes so they are visible
-            else:
-                # note page to remove after this loop has completed
-                pages_to_remove.append(page)
+                            if shape_id not in loop_layouts:
+                                delta += shape.height  # automatically move each duplicate down
+                                shape.move(0, -delta)  # move duplicated shapes so they are visible
+                        if shape_id in loop_layouts:
+                            layout_grid(shapes_by_id, **loop_layouts[shape_id])
+                page.cell_graph.invalidate()  # rebuilt once with the new IDs, when the batch is recalculated
         # remove pages after processing
         for p in pages_to_remove:
             print(f"Removing page:'{p.name}' index:{p.index_num}")
             self.remove_page_by_index(p.index_num)
 
     @staticmethod
-    def jinja_render_shape(shape: Shape, context: dict, loop_shape_ids: list):
+    def jinja_render_shape(shape: Shape, context: dict, loop_shape_ids: list, template_shape_ids: dict = None,
+                           loop_layouts: dict = None):
+        # template_shape_ids, if set, is the dict returned by jinja_template_shape_ids() - other shapes are skipped
+        # loop_layouts, if set, is updated with layout_grid() arguments by loop shape ID for {% layout %} statements
         prev_shape = None
         for s in shape.child_shapes:  # type: Shape
-            # manage for loops in template
-            loop_shape_id = VisioFile.jinja_create_for_loop_if(s, prev_shape)
+            if template_shape_ids is not None and s.ID not in template_shape_ids:
+                prev_shape = s
+                continue
+            if template_shape_ids is not None and not template_shape_ids[s.ID]:  # a group containing template shapes
+                prev_shape = s
+                VisioFile.jinja_render_shape(s, context, loop_shape_ids, template_shape_ids, loop_layouts)
+                continue
+            text, statements = split_jinja_statements(s.text)
+            # manage for loops and showif in template
+            layout = jinja_layout_args(statements, context)
+            loop_shape_id = VisioFile._jinja_create_for_loop_if(s, prev_shape, statements)
             if loop_shape_id:
                 loop_shape_ids.append(loop_shape_id)
+                if layout is not None and loop_layouts is not None:
+                    loop_layouts[loop_shape_id] = layout
             prev_shape = s
             # manage 'set self' statements
-            VisioFile.jinja_set_selfs(s, context)
-            VisioFile.jinja_render_shape(shape=s, context=context, loop_shape_ids=loop_shape_ids)
+            VisioFile._jinja_set_selfs(s, context, statements)
+            s.text = text
+            VisioFile.jinja_render_shape(shape=s, context=context, loop_shape_ids=loop_shape_ids,
+                                         template_shape_ids=template_shape_ids, loop_layouts=loop_layouts)
 
     @staticmethod
     def jinja_set_selfs(shape: Shape, context: dict):
         # apply any {% self self.xxx = yyy %} statements in shape properties
-        jinja_source = shape.text
-        matches = re.findall(r'{% set self.(.*?)\s?=\s?(.*?) %}', jinja_source)  # non-greedy search for all {%...%} strings
-        for m in matches:  # type: tuple  # expect ('property', 'value') such as ('x', '10') or ('y', 'n*2')
-            property_name = m[0]
-            value = "{{ "+m[1]+" }}"  # Jinja to be processed
-            # todo: replace any self references in value with actual value - i.e. {% set self.x = self.x+1 %}
-            self_refs = re.findall(r'self.(.*)[\s+-/*//]?', m[1])  # greedy search for all self.? between +, -, *, or /
-            for self_ref in self_refs:  # type: tuple  # expect ('property', 'value') such as ('x', '10') or ('y', 'n*2')
+        text, statements = split_jinja_statements(shape.text, keywords=('set self',))
+        VisioFile._jinja_set_selfs(shape, context, statements)
+        shape.text = text  # leaving any remaining text
+
+    @staticmethod
+    def _jinja_set_selfs(shape: Shape, context: dict, statements: List[tuple]):
+        for keyword, property_name, value in statements:  # expect ('set self', 'x', '10') or ('set self', 'y', 'n*2')
+            if keyword != 'set self':
+                continue
+            # replace any self references in value with actual value - i.e. {% set self.x = self.x+1 %}
+            for self_ref in jinja_self_ref_regex.findall(value):  # type: str
                 ref_val = str(shape.__getattribute__(self_ref[0]))
                 value = value.replace('self.'+self_ref[0], ref_val)
             # use Jinja template to calculate any self refs found
-            template = Template(value)  # value might be '{{ 1.0+2.4*3 }}'
+            template = Template("{{ "+value+" }}")  # value might be '{{ 1.0+2.4*3 }}'
             value = template.render(context)
             if property_name in ['x', 'y']:
                 shape.__setattr__(property_name, value)
 
-        # remove any {% set self %} statements, leaving any remaining text
-        matches = re.findall('{% set self.*?%}', jinja_source)
-        for m in matches:
-            jinja_source = jinja_source.replace(m, '')  # remove Jinja 'set self' statement
-        shape.text = jinja_source
-
     @staticmethod
     def unescape_jinja_statements(jinja_source):
-        # unescape any text between {% ... %}
-        jinja_source_out = jinja_source
-        matches = re.findall('{%(.*?)%}', jinja_source)  # non-greedy search for all {%...%} strings
-        for m in matches:
-            unescaped = m.replace('&gt;', '>').replace('&lt;', '<')
-            jinja_source_out = jinja_source_out.replace(m, unescaped)
-        return jinja_source_out
+        # unescape any text between {% ... %}, replacing each statement in a single pass over the source
+        return jinja_statement_regex.sub(
+            lambda m: '{%' + m.group(1).replace('&gt;', '>').replace('&lt;', '<') + '%}', jinja_source)
 
     @staticmethod
     def jinja_create_for_loop_if(shape: Shape, previous_shape:Shape or None):
         # update a Shapes tag where text looks like a jinja {% for xxxx %} loop
         # move text to start of Shapes tag and add {% endfor %} at end of tag
-        text = shape.text
-
-        # use regex to find all loops
-        jinja_loops = re.findall(r"{% for\s(.*?)\s%}", text)
-
-        for loop in jinja_loops:
-            jinja_loop_text = f"{{% for {loop} %}}"
-            # move the for loop to start of shapes element (just before first Shape element)
-            if previous_shape:
-                if previous_shape.xml.tail:
-                    previous_shape.xml.tail += jinja_loop_text
-                else:
-                    previous_shape.xml.tail = jinja_loop_text  # add jinja loop text after previous shape, before this element
-            else:
-                if shape.parent.xml.text:
-                    shape.parent.xml.text += jinja_loop_text
-                else:
-                    shape.parent.xml.text = jinja_loop_text  # add jinja loop at start of parent, just before this element
-            shape.text = shape.text.replace(jinja_loop_text, '')  # remove jinja loop from <Text> tag in element
-
-            # add closing 'endfor' to just inside the shapes element, after last shape
-            if shape.xml.tail:  # extend or set text at end of Shape element
-                shape.xml.tail += "{% endfor %}"
-            else:
-                shape.xml.tail = '{% endfor %}'
+        text, statements = split_jinja_statements(shape.text, keywords=('for', 'showif'))
+        loop_shape_id = VisioFile._jinja_create_for_loop_if(shape, previous_shape, statements)
+        shape.text = text  # remove jinja loop and showif from <Text> tag in element
+        return loop_shape_id
 
-        jinja_show_ifs = re.findall(r"{% showif\s(.*?)\s%}", text)  # find all showif statements
-        # jinja_show_if - translate non-standard {% showif statement %} to valid jinja if statement
-        for show_if in jinja_show_ifs:
-            jinja_show_if = f"{{% if {show_if} %}}"  # translate to actual jinja if statement
-            # move the for loop to start of shapes element (just before first Shape element)
+    @staticmethod
+    def _jinja_create_for_loop_if(shape: Shape, previous_shape: Shape or None, statements: List[tuple]):
+        # add each loop, then each showif, as jinja statements before and after the shape element
+        jinja_loops = [argument for keyword, argument, value in statements if keyword == 'for']
+        jinja_show_ifs = [argument for keyword, argument, value in statements if keyword == 'showif']
+        # translate non-standard {% showif statement %} to valid jinja if statement
+        blocks = [(f"{{% for {loop} %}}", "{% endfor %}") for loop in jinja_loops] + \
+                 [(f"{{% if {show_if} %}}", "{% endif %}") for show_if in jinja_show_ifs]
+
+        for start, end in blocks:
+            # move the statement to start of shapes element (just before first Shape element)
             if previous_shape:
-                previous_shape.xml.tail = str(previous_shape.xml.tail or '')+jinja_show_if  # add jinja loop text after previous shape, before this element
+                previous_shape.xml.tail = str(previous_shape.xml.tail or '')+start  # add after previous shape, before this element
             else:
-                shape.parent.xml.text = str(shape.parent.xml.text or '')+jinja_show_if  # add jinja loop at start of parent, just before this element
-
-            # remove original jinja showif from <Text> tag in element
-            shape.text = shape.text.replace(f"{{% showif {show_if} %}}", '')
-
-            # add closing 'endfor' to just inside the shapes element, after last shape
-            if shape.xml.tail:  # extend or set text at end of Shape element
-                shape.xml.tail += "{% endif %}"
-            else:
-                shape.xml.tail = '{% endif %}'
+                shape.parent.xml.text = str(shape.parent.xml.text or '')+start  # add at start of parent, just before this element
+            # add closing statement to just inside the shapes element, after last shape
+            shape.xml.tail = str(shape.xml.tail or '')+end
 
         if jinja_loops:
             return shape.ID  # return shape ID if it is a loop, so that duplicate shape IDs can be updated
@@ -917,7 +1142,7 @@ class VisioFile:
     @staticmethod
     def jinja_page_showif(page: Page, context: dict):
         text = page.name
-        jinja_source = re.findall(r"{% showif\s(.*?)\s%}", text)
+        jinja_source = jinja_showif_regex.findall(text)
         if len(jinja_source):
             # process last matching value
             template_source = "{{ "+jinja_source[-1]+" }}"
@@ -929,7 +1154,7 @@ class VisioFile:
                 print("value in ['False', '0', '', '()', '[]', '{}']")
                 return False  # page should be hidden
             # remove jinja statement from page name
-            jinja_statement = re.match("{%.*?%}", page.name)[0]
+            jinja_statement = jinja_statement_regex.match(page.name)[0]
             page.name = page.name.replace(jinja_statement, '')
         return True  # page should be left in
 
@@ -938,13 +1163,11 @@ class VisioFile:
         return shape.attrib['ID']
 
     def increment_sub_shape_ids(self, shape: Shape, page, id_map: dict = None):
+        # give shape and all of its sub shapes new IDs, then update Sheet.N! references once for the whole shape
+        # note that page.cell_graph is not updated, so callers invalidate it once after changing the IDs of all shapes
         id_map = self.increment_shape_ids(shape.xml, page, id_map)
         self.update_ids(shape.xml, id_map)
-        for s in shape.child_shapes:
-            id_map = self.increment_shape_ids(s.xml, page, id_map)
-            self.update_ids(s.xml, id_map)
-            if s.child_shapes:
-                id_map = self.increment_sub_shape_ids(s, page, id_map)
+        shape.ID = shape.xml.attrib.get('ID')
         return id_map
 
     def copy_shape(self, shape: Element, page: Page) -> ET:
@@ -962,7 +1185,7 @@ class VisioFile:
 
         """
 
-        new_shape = ET.fromstring(ET.tostring(shape))
+        new_shape = copy.deepcopy(shape)  # copy without serialising, which recurses for each level of nesting
 
         page.set_max_ids()
         # find or create Shapes tag
@@ -974,6 +1197,7 @@ class VisioFile:
         id_map = self.increment_shape_ids(new_shape, page) # page_obj)
         self.update_ids(new_shape, id_map)
         shapes_tag.append(new_shape)
+        page.cell_graph.invalidate()
 
         return new_shape
 
@@ -989,13 +1213,12 @@ class VisioFile:
         return shapes
 
     def increment_shape_ids(self, shape: Element, page: Page, id_map: dict=None):
+        # give a Shape element, and all sub shapes at any depth, the next IDs in page - recording changes in id_map
         if id_map is None:
             id_map = dict()
-        self.set_new_id(shape, page, id_map)
-        for e in shape.findall(f"{namespace}Shapes"):
-            self.increment_shape_ids(e, page, id_map)
-        for e in shape.findall(f"{namespace}Shape"):
-            self.set_new_id(e, page, id_map)
+        for e, parent, depth in walk_shape_xml(shape):
+            if e.tag == f"{namespace}Shape":
+                self.set_new_id(e, page, id_map)
 
         return id_map
 
@@ -1009,21 +1232,25 @@ class VisioFile:
         return max_id  # return new id for info
 
     def update_ids(self, shape: Element, id_map: dict):
-        # update: <ns0:Cell F="Sheet.15! replacing 15 with new id using prepopulated id_map
-        # cycle through shapes looking for Cell tag inside a Shape tag, which may be inside a Shapes tag
-        for e in shape.findall(f"{namespace}Shapes"):
-            self.update_ids(e, id_map)
-        for e in shape.findall(f"{namespace}Shape"):
-            # look for Cell elements
-            cells = e.findall(f"{namespace}Cell[@F]")
-            for cell in cells:
-                f = str(cell.attrib['F'])
-                if f.startswith("Sheet."):
-                    # update sheet refs with new ids
-                    shape_id = f.split('!')[0].split('.')[1]
-                    new_id = id_map[shape_id]
-                    new_f = f.replace(f"Sheet.{shape_id}",f"Sheet.{new_id}")
-                    cell.attrib['F'] = new_f
+        """Update Sheet.N! references in the formula of every Cell in shape and its sub shapes, using id_map
+
+        Every reference in a formula is replaced in a single pass, so Sheet.1! and Sheet.15! are distinct and
+        references to shapes which are not in id_map are left unchanged
+
+        :param shape: the Shape element to update
+        :param id_map: dict of new shape ID by previous shape ID
+        """
+        if not id_map:
+            return shape
+
+        def new_ref(match: re.Match) -> str:
+            new_id = id_map.get(match.group(1))
+            return f"Sheet.{new_id}!" if new_id is not None else match.group(0)
+
+        for cell in shape.iter(f"{namespace}Cell"):  # iterative walk of every Cell at any depth
+            f = cell.attrib.get('F')
+            if f and 'Sheet.' in f:
+                cell.attrib['F'] = sheet_ref_regex.sub(new_ref, f)
         return shape
 
     def close_vsdx(self):
@@ -1043,18 +1270,21 @@ class VisioFile:
         """
         if not self.file_open:
             raise VisioFileNotOpen("Unable to save a file after being closed or outside of 'with' block.")
-        # write pages.xml.rels
-        xml_to_file(self.pages_xml_rels, f'{self.directory}/visio/pages/_rels/pages.xml.rels', self.zip_file_contents)
+        if self.pages_xml is not None:  # a stencil has no pages
+            # write pages.xml.rels
+            xml_to_file(self.pages_xml_rels, f'{self.directory}/visio/pages/_rels/pages.xml.rels', self.zip_file_contents)
 
-        # write pages.xml file - in case pages added removed
-        xml_to_file(self.pages_xml, self._pages_filename(), self.zip_file_contents)
+            # write pages.xml file - in case pages added removed
+            xml_to_file(self.pages_xml, self._pages_filename(), self.zip_file_contents)
 
         # write the master pages to file
         for page in self.master_pages:  # type: Page
+            normalize_data_properties_xml(page.xml.getroot())
             xml_to_file(page.xml, page.filename, self.zip_file_contents)
 
         # write the pages to file
         for page in self.pages:  # type: Page
+            normalize_data_properties_xml(page.xml.getroot())  # data property values are only normalized on save
             xml_to_file(page.xml, page.filename, self.zip_file_contents)
             if page.rels_xml_filename:
                 xml_to_file(page.rels_xml, page.rels_xml_filename, self.zip_file_contents)